@@ -0,0 +1,174 @@
+"""
+Code snippet to animate figures over years with a slider. Each frame carries only the points added in its year
+(delta encoding, the file grows linearly with the number of events); the page accumulates them.
+"""
+
+import json
+
+import numpy as np
+
+ANIMATION_SCRIPT_ = """
+(function() {
+    var gd = document.getElementById('{plot_id}');
+    var anim = %(payload)s;
+    var current = anim.years.length;
+    var timer = null;
+
+    function show(k) {
+        if (k > current) {
+            for (var j = current + 1; j <= k; j++) {
+                var frame = anim.frames[j];
+                var update = {};
+                anim.keys.forEach(function(key) {
+                    update[key] = frame.data.map(function(d) { return d[key]; });
+                });
+                Plotly.extendTraces(gd, update, frame.traces);
+            }
+        } else if (k < current) {
+            var update = {};
+            anim.keys.forEach(function(key) {
+                update[key] = anim.traces.map(function(index) {
+                    var a = [];
+                    for (var j = 0; j <= k; j++) {
+                        var p = anim.frames[j].traces.indexOf(index);
+                        if (p > -1) { a = a.concat(anim.frames[j].data[p][key]); }
+                    }
+                    return a;
+                });
+            });
+            Plotly.restyle(gd, update, anim.traces);
+        }
+        current = k;
+    }
+
+    gd.on('plotly_sliderchange', function(e) {
+        show(e.slider.active);
+    });
+
+    gd.on('plotly_buttonclicked', function(e) {
+        if (e.button.name !== 'play') { return; }
+        if (timer !== null) {
+            clearInterval(timer);
+            timer = null;
+            return;
+        }
+        var k = (current >= anim.years.length - 1) ? 0 : current + 1;
+        timer = setInterval(function() {
+            show(k);
+            Plotly.relayout(gd, {'sliders[0].active': k});
+            k += 1;
+            if (k >= anim.years.length) {
+                clearInterval(timer);
+                timer = null;
+            }
+        }, anim.interval);
+    });
+
+    show(anim.years.length - 1);
+})();
+"""
+
+
+def to_list(a):
+    """Converts array to json-compatible list (datetimes to strings)."""
+    a = np.asarray(a)
+    if a.dtype.kind == "M":
+        s = np.char.replace(np.datetime_as_string(a, unit="s"), "T", " ").astype(object)
+        s[np.isnat(a)] = None
+        return s.tolist()
+    return a.tolist()
+
+
+def make_delta_frames(fig, trace_indices, trace_years, keys):
+    """Splits the points of traces into per-year frames with a single sort over all points.
+    Parameters
+    ---------
+        fig : go.Figure
+            figure with the (complete) traces
+        trace_indices : list of int
+            indices of traces to animate
+        trace_years : list of array-like
+            year of every point, for each trace in trace_indices
+        keys : list of str
+            trace attributes holding the points (e.g. ["lat", "lon", "text"])
+    Returns
+    -------
+    (list of years, list of frames); frame: {"traces": [trace indices], "data": [{key: list of values}]}
+    """
+    lengths = [len(y) for y in trace_years]
+    years = np.concatenate([np.asarray(y) for y in trace_years]).astype(np.int64)
+    traces = np.repeat(np.asarray(trace_indices, dtype=np.int64), lengths)
+    columns = {}
+    for key in keys:
+        columns[key] = np.concatenate([
+            np.asarray(fig.data[i][key]) if fig.data[i][key] is not None else np.full(n, None, dtype=object)
+            for (i, n) in zip(trace_indices, lengths)])
+
+    # one sort (by year, then trace) and one split at every change of year or trace
+    order = np.lexsort((traces, years))
+    years, traces = years[order], traces[order]
+    breaks = np.flatnonzero((np.diff(years) != 0) | (np.diff(traces) != 0)) + 1
+    starts = np.concatenate([[0], breaks]) if len(years) > 0 else np.array([], dtype=np.int64)
+    ends = np.concatenate([breaks, [len(years)]]) if len(years) > 0 else np.array([], dtype=np.int64)
+
+    unique_years = list(np.unique(years))
+    frames = {y: {"traces": [], "data": []} for y in unique_years}
+    for (start, end) in zip(starts, ends):
+        rows = order[start:end]
+        frame = frames[years[start]]
+        frame["traces"] += [int(traces[start])]
+        frame["data"] += [{key: to_list(columns[key][rows]) for key in keys}]
+
+    return [int(y) for y in unique_years], [frames[y] for y in unique_years]
+
+
+def add_year_animation(fig, trace_indices, trace_years, keys, interval=300):
+    """Moves the points of the traces into per-year delta frames and adds year slider and play button.
+    Parameters
+    ---------
+        fig : go.Figure
+            figure with the (complete) traces; their points are removed
+        trace_indices : list of int
+            indices of traces to animate
+        trace_years : list of array-like
+            year of every point, for each trace in trace_indices
+        keys : list of str
+            trace attributes holding the points (e.g. ["lat", "lon", "text"])
+        interval : int
+            milliseconds per year when playing
+    Returns
+    -------
+    post_script for the html (see figure_io.save_figure)
+    """
+    years, frames = make_delta_frames(fig, trace_indices, trace_years, keys)
+
+    for i in trace_indices:
+        fig.data[i].update({key: [] for key in keys})
+
+    fig.update_layout(
+        sliders=[dict(
+            active=len(years)-1,
+            currentvalue={"prefix": "Year: "},
+            pad={"t": 30},
+            steps=[dict(label=str(y), method="skip") for y in years],
+        )],
+        updatemenus=list(fig.layout.updatemenus) + [dict(
+            type="buttons",
+            showactive=False,
+            x=0.0,
+            y=0.0,
+            xanchor="right",
+            yanchor="top",
+            pad={"t": 30, "r": 10},
+            buttons=[dict(label="Play", name="play", method="skip")],
+        )],
+    )
+
+    payload = {
+        "years" : years,
+        "traces" : [int(i) for i in trace_indices],
+        "keys" : keys,
+        "frames" : frames,
+        "interval" : interval,
+    }
+    return ANIMATION_SCRIPT_ % {"payload": json.dumps(payload, separators=(",", ":"))}
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3.13
+
+"""
+Batch generation of the figure set for many subsets (e.g. every state, every decade). The data is loaded and
+enriched once and split into the subsets in one pass over state and decade groups; every subset's figures are
+rendered on a process pool into an output tree
+
+    OUTDIR/<subset>/<figure>.html
+    OUTDIR/manifest.json          (subsets with filters, number of explosions and written files)
+
+Subsets are given in a json file (list of {"name": ..., "state": ..., "years": ..., "type": ..., "purpose": ...},
+filters as for the scripts) and/or generated with --by state / --by decade.
+
+usage: batch.py [-h] -i INFILENAME -o OUTDIR [-s SUBSETS] [--by {state,decade}] [-f FIGURE] [--format {html,json}] [-w WORKERS] [-j COUNTRYREGIONJSON] [--metrics METRICS]
+"""
+
+import argparse
+import concurrent.futures
+import datetime
+import json
+import os
+import os.path
+import re
+import sys
+import time
+
+import numpy as np
+
+import helpers
+import metrics
+
+FIGURES_ = {
+    "locations" : "plot_explosion_locations",
+    "regions" : "plot_region_piechart_map",
+    "hob" : "plot_HOB",
+    "pies" : "plot_pies",
+    "year_bars" : "plot_year_bars",
+    "timeline" : "plot_timeline",
+}
+
+
+def make_subsets(df, by):
+    """Makes subset definitions for every value of a grouping.
+    Parameters
+    ---------
+        df : pd.Dataframe
+            explosion data
+        by : str
+            "state" (one subset per state) or "decade" (one subset per decade)
+    Returns
+    -------
+    list of dict (subset definitions)
+    """
+    if by == "state":
+        return [{"name": str(s), "state": str(s)} for s in sorted(df.STATE.dropna().unique())]
+    if by == "decade":
+        decades = sorted(set((df.YEAR.dropna().astype(int) // 10 * 10).tolist()))
+        return [{"name": f"{d}s", "years": f"{d}-{d+9}"} for d in decades]
+    raise ValueError(f"Unknown grouping '{by}'.")
+
+
+def read_subsets(subsetfilename):
+    """Reads subset definitions from json (list of dicts with name and filters)."""
+    with open(subsetfilename, 'r') as f:
+        subsets = json.load(f)
+    for subset in subsets:
+        if "name" not in subset:
+            raise ValueError(f"Subset without name in {subsetfilename}: {subset}.")
+    return subsets
+
+
+def partition(df, subsets):
+    """Splits the explosions into the subsets. State and decade groups are computed once; every subset
+    starts from the union of its groups, and only these rows are checked against its remaining filters.
+    Parameters
+    ---------
+        df : pd.Dataframe
+            enriched explosion data
+        subsets : list of dict
+            subset definitions
+    Returns
+    -------
+    dict subset name -> (filters, pd.Dataframe)
+    """
+    state_groups = df.groupby("STATE", sort=False).indices
+    decade_groups = df.groupby(df.YEAR // 10 * 10, sort=False).indices
+
+    parts = {}
+    for subset in subsets:
+        filters = helpers.make_filters(subset.get("state"), subset.get("years"), subset.get("type"), subset.get("purpose"))
+
+        rows = None
+        if filters["states"]:
+            rows = np.concatenate([state_groups.get(s, np.array([], dtype=np.int64)) for s in filters["states"]])
+        if filters["years"]:
+            first, last = filters["years"]
+            decade_rows = np.concatenate([decade_groups.get(d, np.array([], dtype=np.int64))
+                for d in range(first // 10 * 10, last // 10 * 10 + 1, 10)])
+            rows = decade_rows if rows is None else np.intersect1d(rows, decade_rows)
+
+        dff = df.iloc[np.sort(rows)] if rows is not None else df
+        parts[subset["name"]] = (filters, helpers.filter_events(dff, **filters))
+
+    return parts
+
+
+def render_subset(name, df, figures, outdir, fmt="html", country_region_json=None):
+    """Renders the figures of one subset (run in a worker process).
+    Parameters
+    ---------
+        name : str
+            subset name (directory in outdir)
+        df : pd.Dataframe
+            explosions of the subset
+        figures : list of str
+            figures to render (keys of FIGURES_)
+        outdir : str
+            root of the output tree
+        fmt : str
+            "html" or "json"
+        country_region_json : str
+            region lookup for the region map (None for the shipped lookup)
+    Returns
+    -------
+    dict figure -> {"file", "bytes", "seconds"} (or {"error"})
+    """
+    import importlib
+    import figure_io
+
+    subsetdir = os.path.join(outdir, name)
+    os.makedirs(subsetdir, exist_ok=True)
+
+    results = {}
+    for figure in figures:
+        t = time.perf_counter()
+        outfilename = os.path.join(subsetdir, f"{figure}.{fmt}")
+        try:
+            module = importlib.import_module(FIGURES_[figure])
+            with metrics.timer("figures_build_seconds", figure=figure):
+                if figure == "regions":
+                    fig = module.make_figure(df, country_region_json)
+                else:
+                    fig = module.make_figure(df)
+                figure_io.save_figure(fig, outfilename)
+        except Exception as e:
+            results[figure] = {"error": f"{type(e).__name__}: {e}"}
+            continue
+        results[figure] = {
+            "file" : os.path.relpath(outfilename, outdir),
+            "bytes" : os.path.getsize(outfilename),
+            "seconds" : round(time.perf_counter() - t, 3),
+        }
+    return results
+
+
+def subset_dirname(name):
+    """Makes safe directory name from subset name."""
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", name).strip("._") or "subset"
+
+
+def main(infilename, outdir, subsetfilename=None, by=None, figures=None, fmt="html", workers=None, country_region_json=None):
+    """Main.
+    Parameters
+    ---------
+        infilename : str
+            pickled pd.Dataframe (or parquet) with explosions
+        outdir : str
+            root of the output tree
+        subsetfilename : str
+            json with subset definitions
+        by : list of str
+            groupings to make subsets for ("state", "decade")
+        figures : list of str
+            figures to render (keys of FIGURES_); None for all
+        fmt : str
+            "html" or "json"
+        workers : int
+            number of worker processes (None for number of cpus)
+        country_region_json : str
+            region lookup for the region map (None for the shipped lookup)
+    Returns
+    -------
+    True if all figures of all subsets were built.
+    """
+    t_start = time.perf_counter()
+    figures = figures or list(FIGURES_)
+
+    df = helpers.load_events(infilename)
+    df = helpers.add_derived_columns(df)
+
+    subsets = read_subsets(subsetfilename) if subsetfilename else []
+    for grouping in (by or []):
+        subsets += make_subsets(df, grouping)
+    if not subsets:
+        print("[ERROR] No subsets given (use -s SUBSETS and/or --by).")
+        return False
+
+    names = [subset_dirname(s["name"]) for s in subsets]
+    if len(set(names)) < len(names):
+        print("[ERROR] Subset names are not unique.")
+        return False
+    for subset, name in zip(subsets, names):
+        subset["name"] = name
+
+    parts = partition(df, subsets)
+    print(f"[INFO] Loaded {len(df)} explosions, {len(subsets)} subsets, {len(figures)} figures each.")
+
+    os.makedirs(outdir, exist_ok=True)
+    manifest = {
+        "input" : os.path.abspath(infilename),
+        "created" : datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "figures" : figures,
+        "format" : fmt,
+        "subsets" : {},
+    }
+
+    failed = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for subset in subsets:
+            filters, dff = parts[subset["name"]]
+            manifest["subsets"][subset["name"]] = {
+                "filters" : {k: list(v) if v is not None else None for (k, v) in filters.items()},
+                "n_events" : len(dff),
+                "figures" : {},
+            }
+            if len(dff) == 0:
+                print(f"[WARNING] No explosions in subset '{subset['name']}', skipping.")
+                continue
+            futures[executor.submit(metrics.collect, render_subset, subset["name"], dff, figures, outdir, fmt, country_region_json)] = subset["name"]
+
+        for future in concurrent.futures.as_completed(futures):
+            name = futures[future]
+            manifest["subsets"][name]["figures"], samples = future.result()
+            metrics.merge(samples)
+            errors = [f for (f, r) in manifest["subsets"][name]["figures"].items() if "error" in r]
+            if errors:
+                failed += len(errors)
+                print(f"[WARNING] Subset '{name}': could not build {', '.join(errors)}.")
+            print(f"[INFO] Rendered subset '{name}' ({manifest['subsets'][name]['n_events']} explosions).")
+
+    manifest["subsets"] = dict(sorted(manifest["subsets"].items()))
+    manifestfilename = os.path.join(outdir, "manifest.json")
+    with open(manifestfilename, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    print(f"[INFO] Wrote {manifestfilename} in {time.perf_counter()-t_start:.1f} s.")
+    if failed:
+        print(f"[ERROR] {failed} figure(s) could not be built, see {manifestfilename}.")
+    return failed == 0
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--infilename", help="infilename", required=True)
+    parser.add_argument("-o", "--outdir", help="root directory of the output tree", required=True)
+    parser.add_argument("-s", "--subsets", help="json with subset definitions (list of {name, state, years, type, purpose})", default=None)
+    parser.add_argument("--by", help="make one subset per state or decade (repeatable)", choices=["state", "decade"], action="append", default=None)
+    parser.add_argument("-f", "--figure", help="only render this figure (repeatable)", choices=list(FIGURES_), action="append", default=None)
+    parser.add_argument("--format", help="output format", choices=["html", "json"], default="html")
+    parser.add_argument("-w", "--workers", help="number of worker processes (default: number of cpus)", type=int, default=None)
+    parser.add_argument("-j", "--countryregionjson", help="json that maps states to region (defaults to the lookup shipped with the project)", default=None)
+    parser.add_argument("--metrics", help="write metrics of all subsets (stage durations, rows, traces, bytes, build durations) to this file: .prom for Prometheus text, otherwise appended json lines", default=None)
+
+    args = parser.parse_args()
+
+    ok = main(args.infilename, args.outdir, subsetfilename=args.subsets, by=args.by, figures=args.figure, fmt=args.format,
+        workers=args.workers, country_region_json=args.countryregionjson)
+    if args.metrics:
+        metrics.write(args.metrics, script=parser.prog)
+    if not ok:
+        sys.exit(1)
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3.13
+
+"""
+Regression check of runtime and peak memory: runs every figure builder stage by stage on synthetic data
+of fixed size (see synthetic_data.py) and compares wall time (timers) and peak memory (tracemalloc)
+with the budgets in budgets.json (data size and budgets) and the per-figure budget files next to it
+(budgets.<figure>.json, e.g. for figures added later). Exits with status 1 and reports the exceeded budgets if any.
+A command-line check (timings depend on the machine), not part of the unit tests.
+
+With --calibrate, the budgets are set from the measurement (times headroom) instead, each in the file it came
+from (stages without budget in budgets.<figure>.json).
+
+usage: check_budgets.py [-h] [-b BUDGETS] [-f FIGURE] [--repeat REPEAT] [--calibrate]
+"""
+
+import argparse
+import glob
+import json
+import os.path
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import synthetic_data
+
+DEFAULT_BUDGETS_ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "budgets.json")
+
+# Headroom of calibrated budgets over the measurement (runtime varies more between machines than memory)
+HEADROOM_ = {"seconds": 3.0, "peak_mb": 1.5}
+
+# Lower limits of calibrated budgets (timer noise of fast stages)
+MIN_BUDGET_ = {"seconds": 0.25, "peak_mb": 1.0}
+
+
+def stages_locations(df, outdir):
+    """Stages of the explosion location map (name, function taking and updating the state dict)."""
+    import plot_explosion_locations as m
+    import figure_io
+    return [
+        ("make_location_frequency_df", lambda s: {"dff": m.make_location_frequency_df(df.copy())}),
+        ("make_figure", lambda s: {"fig": m.make_figure(df.copy())}),
+        ("write_html", lambda s: figure_io.write_html(s["fig"], os.path.join(outdir, "locations.html"))),
+    ]
+
+
+def stages_regions(df, outdir):
+    """Stages of the region pie chart map."""
+    import plotly.graph_objects as go
+    import plot_region_piechart_map as m
+    import figure_io
+    import helpers
+    dfr = helpers.add_derived_columns(df[df.LAT.notna()])
+    return [
+        ("plot_explosion_pies", lambda s: {"pies": m.plot_explosion_pies(go.Figure(), dfr, "number")}),
+        ("make_figure", lambda s: {"fig": m.make_figure(df)}),
+        ("write_html", lambda s: figure_io.write_html(s["fig"], os.path.join(outdir, "regions.html"))),
+    ]
+
+
+def stages_simple(module_name, name):
+    """Stages of figures without separate aggregation (make_figure, write_html)."""
+    def stages(df, outdir):
+        import importlib
+        import figure_io
+        m = importlib.import_module(module_name)
+        return [
+            ("make_figure", lambda s: {"fig": m.make_figure(df)}),
+            ("write_html", lambda s: figure_io.write_html(s["fig"], os.path.join(outdir, f"{name}.html"))),
+        ]
+    return stages
+
+
+FIGURES_ = {
+    "locations" : stages_locations,
+    "regions" : stages_regions,
+    "hob" : stages_simple("plot_HOB", "hob"),
+    "pies" : stages_simple("plot_pies", "pies"),
+    "year_bars" : stages_simple("plot_year_bars", "year_bars"),
+    "timeline" : stages_simple("plot_timeline", "timeline"),
+}
+
+
+def run_cold(run, state):
+    """Runs a stage without reusing results of earlier runs: memoized aggregations are cleared and the stage cache
+    is off, so every measured run computes what the stage names.
+    """
+    import figures
+    import stage_cache
+
+    figures.cache_clear()
+    active = stage_cache.get_active()
+    stage_cache.disable()
+    try:
+        return run(state)
+    finally:
+        stage_cache.ACTIVE_ = active
+
+
+def measure(stages, repeat=1):
+    """Runs stages in order and measures them (every run cold, see run_cold).
+    Time is the best of repeat runs without tracing; peak memory is measured in a separate traced run
+    (allocations during the stage on top of what was allocated before).
+    Parameters
+    ---------
+        stages : list of (str, function)
+            stages (see stages_locations)
+        repeat : int
+            number of timed runs per stage
+    Returns
+    -------
+    dict stage -> {"seconds": float, "peak_mb": float}
+    """
+    results = {}
+    state = {}
+    for name, run in stages:
+        seconds = []
+        for _ in range(repeat):
+            t = time.perf_counter()
+            update = run_cold(run, state)
+            seconds += [time.perf_counter() - t]
+
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        update = run_cold(run, state)
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+        tracemalloc.stop()
+
+        state.update(update or {})
+        results[name] = {"seconds": min(seconds), "peak_mb": peak / 2**20}
+    return results
+
+
+def compare(results, budgets):
+    """Compares measurements with budgets.
+    Returns
+    -------
+    list of (stage, metric, measured, budget) exceeding the budget
+    """
+    exceeded = []
+    for stage, measured in results.items():
+        for metric, value in measured.items():
+            budget = budgets.get(stage, {}).get(metric)
+            if budget is not None and value > budget:
+                exceeded += [(stage, metric, value, budget)]
+    return exceeded
+
+
+def get_figure_budget_filename(budgetfilename, figure):
+    """Per-figure budget file next to the budget file (budgets.<figure>.json for budgets.json)."""
+    base, ext = os.path.splitext(budgetfilename)
+    return f"{base}.{figure}{ext}"
+
+
+def read_budgets(budgetfilename):
+    """Reads the budget file and the per-figure budget files next to it (see get_figure_budget_filename).
+    Returns
+    -------
+    config of the budget file (data size), dict stage -> budget, dict stage -> file the budget came from
+    """
+    with open(budgetfilename, 'r') as f:
+        config = json.load(f)
+
+    budgets, origins = {}, {}
+    base, ext = os.path.splitext(budgetfilename)
+    for filename in [budgetfilename] + sorted(glob.glob(f"{glob.escape(base)}.*{ext}")):
+        if filename == budgetfilename:
+            stages = config.get("stages", {})
+        else:
+            with open(filename, 'r') as f:
+                stages = json.load(f).get("stages", {})
+        for stage, budget in stages.items():
+            if stage in budgets:
+                raise ValueError(f"Budget of {stage} in {origins[stage]} and {filename}.")
+            budgets[stage] = budget
+            origins[stage] = filename
+    return config, budgets, origins
+
+
+def write_budgets(budgetfilename, budgets, origins):
+    """Writes budgets into the files they came from (see read_budgets); budgets of new stages into the per-figure
+    budget file of their figure (see get_figure_budget_filename).
+    """
+    files = {}
+    for stage, budget in budgets.items():
+        filename = origins.get(stage) or get_figure_budget_filename(budgetfilename, stage.split(".")[0])
+        files.setdefault(filename, {})[stage] = budget
+
+    for filename, stages in files.items():
+        config = {}
+        if os.path.isfile(filename):
+            with open(filename, 'r') as f:
+                config = json.load(f)
+        config["stages"] = dict(sorted(stages.items()))
+        with open(filename, 'w') as f:
+            json.dump(config, f, indent=4)
+            f.write("\n")
+        print(f"[INFO] Wrote budgets of {len(stages)} stages to {filename}.")
+
+
+def print_report(results, budgets):
+    """Prints table of all stages with measurements and budgets."""
+    print(f"{'stage':<45} {'seconds':>9} {'budget':>8} {'peak MB':>9} {'budget':>8}")
+    for stage, measured in results.items():
+        budget = budgets.get(stage, {})
+        cells = []
+        for metric in ["seconds", "peak_mb"]:
+            b = budget.get(metric)
+            flag = "!" if (b is not None and measured[metric] > b) else " "
+            cells += [f"{measured[metric]:>8.3f}{flag}", f"{b:>8.3f}" if b is not None else f"{'-':>8}"]
+        print(f"{stage:<45} {' '.join(cells)}")
+
+
+def main(budgetfilename, figures=None, repeat=1, calibrate=False):
+    """Main.
+    Parameters
+    ---------
+        budgetfilename : str
+            json with data size ("n_events", "seed") and budgets ("stages": stage -> {"seconds", "peak_mb"}),
+            more budgets in per-figure files next to it (see read_budgets)
+        figures : list of str
+            figures to check (keys of FIGURES_); None for all
+        repeat : int
+            number of timed runs per stage
+        calibrate : bool
+            if True, write budgets from this measurement instead of checking
+    Returns
+    -------
+    True if all budgets are kept.
+    """
+    config, budgets, origins = read_budgets(budgetfilename)
+
+    df = synthetic_data.make_synthetic_events(config["n_events"], seed=config.get("seed", 0))
+    print(f"[INFO] Checking {', '.join(figures or FIGURES_)} on {len(df)} synthetic explosions.")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as outdir:
+        for figure in (figures or FIGURES_):
+            stages = FIGURES_[figure](df, outdir)
+            for stage, measured in measure(stages, repeat=repeat).items():
+                results[f"{figure}.{stage}"] = measured
+
+    print_report(results, budgets)
+
+    if calibrate:
+        for stage, measured in results.items():
+            budgets[stage] = {metric: round(max(value * HEADROOM_[metric], MIN_BUDGET_[metric]), 3) for (metric, value) in measured.items()}
+        write_budgets(budgetfilename, budgets, origins)
+        return True
+
+    missing = [stage for stage in results if stage not in budgets]
+    if missing:
+        print(f"[WARNING] No budgets for {', '.join(missing)} (add them with --calibrate).")
+
+    exceeded = compare(results, budgets)
+    if exceeded:
+        print(f"[ERROR] {len(exceeded)} budget(s) exceeded:")
+        for (stage, metric, value, budget) in exceeded:
+            print(f"    {stage} {metric}: {value:.3f} > {budget:.3f} ({(value-budget)/budget*100:+.0f}%)")
+        return False
+
+    print("[INFO] All budgets kept.")
+    return True
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-b", "--budgets", help="json with data size and budgets (per-figure budgets in BUDGETS.<figure>.json next to it)", default=DEFAULT_BUDGETS_)
+    parser.add_argument("-f", "--figure", help="only check this figure (repeatable)", choices=list(FIGURES_), action="append", default=None)
+    parser.add_argument("--repeat", help="number of timed runs per stage (best is kept)", type=int, default=1)
+    parser.add_argument("--calibrate", help=f"write budgets from this measurement (x{HEADROOM_['seconds']:g} time, x{HEADROOM_['peak_mb']:g} memory)", action="store_true")
+
+    args = parser.parse_args()
+
+    if not main(args.budgets, figures=args.figure, repeat=args.repeat, calibrate=args.calibrate):
+        sys.exit(1)
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3.13
+
+"""
+Single-page dashboard with all five views (location map, region bars, height of burst, overview pies, histograms
+per year). The explosions are embedded once as a columnar store (numeric columns as base64 typed arrays,
+categories as codes into label lists) and every view is built from it in the browser, so the page weighs about
+one copy of the data plus plotly.js.
+
+Views are cross-filtered: clicking a pie slice or a region/year bar restricts all views to those explosions
+(clicking again removes the filter).
+
+usage: dashboard.py [-h] -i INFILENAME -o OUTFILENAME [--plotlyjs {inline,cdn}] [--content-hash] [--metrics METRICS] [--stage-cache STAGE_CACHE] [--state STATE] [--years YEARS] [--type TYPE] [--purpose PURPOSE]
+"""
+
+import argparse
+import html
+import json
+import os.path
+
+import numpy as np
+import pandas as pd
+
+import figure_io
+import helpers
+import metrics
+import stage_cache
+from plot_HOB import HOB_RANGE_
+from plot_year_bars import CATEGORY_DICT_, YIELD_BINS_, get_category_styles
+
+# Minutes since epoch of missing explosion times
+MISSING_TIME_ = -2**31
+
+DASHBOARD_JS_ = """
+const TYPED_ = {i1: Int8Array, u1: Uint8Array, i2: Int16Array, u2: Uint16Array, i4: Int32Array, u4: Uint32Array, f4: Float32Array, f8: Float64Array};
+function decode(spec) {
+    const bin = atob(spec.bdata), bytes = new Uint8Array(bin.length);
+    for (let i = 0; i < bin.length; i++) bytes[i] = bin.charCodeAt(i);
+    return new TYPED_[spec.dtype](bytes.buffer);
+}
+
+const S = DATA_;
+const N = S.n;
+const col = {};
+for (const [k, v] of Object.entries(S.columns)) col[k] = decode(v);
+const cat = {};
+for (const [k, v] of Object.entries(S.categories)) cat[k] = Object.assign({}, v, {codes: decode(v.codes)});
+const time = new Float64Array(N), year = new Int16Array(N);
+for (let i = 0; i < N; i++) {
+    const t = col.TIME[i];
+    time[i] = t === MISSING_TIME_ ? NaN : t * 60000;
+    year[i] = t === MISSING_TIME_ ? 0 : new Date(time[i]).getUTCFullYear();
+}
+const atmospheric = cat.TYPE_SHORT.values.map(v => v.includes("A"));
+
+// Cross-filter: dimension (category or YEAR) -> selected code/year
+const filters = {};
+const modes = {year_bars: "STATE", regions: "number"};
+
+function selected() {
+    const dims = Object.entries(filters);
+    const rows = [];
+    for (let i = 0; i < N; i++) {
+        let keep = true;
+        for (const [d, v] of dims) {
+            if ((d === "YEAR" ? year[i] : cat[d].codes[i]) !== v) { keep = false; break; }
+        }
+        if (keep) rows.push(i);
+    }
+    return rows;
+}
+
+function toggleFilter(dim, value) {
+    if (filters[dim] === value) delete filters[dim]; else filters[dim] = value;
+    render();
+}
+
+function countBy(rows, codes, n, weight) {
+    const counts = new Float64Array(n);
+    for (const i of rows) if (codes[i] >= 0) counts[codes[i]] += weight ? weight(i) : 1;
+    return counts;
+}
+
+function modeButtons(labels, active, x, y) {
+    return [{type: "buttons", direction: "right", active: Object.keys(labels).indexOf(active), x: x, y: y,
+        xanchor: "left", yanchor: "bottom", font: {size: 13}, showactive: true,
+        buttons: Object.entries(labels).map(([m, l]) => ({label: l, name: m, method: "skip", args: []}))}];
+}
+
+// Views //
+//-------//
+function viewLocations(rows) {
+    const st = cat.STATE, sites = new Map();
+    for (const i of rows) {
+        if (Number.isNaN(col.LAT[i])) continue;
+        const key = col.LAT[i] + "," + col.LONG[i];
+        let s = sites.get(key);
+        if (!s) { s = {i: i, n: 0, names: [], kt: [], years: new Set()}; sites.set(key, s); }
+        s.n += 1;
+        if (S.names[i]) s.names.push(S.names[i]);
+        if (!Number.isNaN(col.YIELD[i])) s.kt.push(+col.YIELD[i].toPrecision(3));
+        s.years.add(year[i]);
+    }
+    const traces = st.values.map((v, k) => ({type: "scattermap", lat: [], lon: [], text: [], name: st.names[k],
+        marker: {size: 10, color: st.colors[k]}, hovertemplate: "%{text}<extra></extra>"}));
+    for (const s of sites.values()) {
+        const t = traces[st.codes[s.i]];
+        const ys = [...s.years].sort();
+        t.lat.push(col.LAT[s.i]); t.lon.push(col.LONG[s.i]);
+        t.text.push(`<b>${t.name}, N=${s.n}</b><br>Name(s): ${s.names.slice(0, 10).join(", ")}${s.names.length > 10 ? ", ..." : ""}`
+            + `<br>Yield(s): ${s.kt.slice(0, 10).join(", ")} kt<br>${ys[0] === ys[ys.length-1] ? ys[0] : ys[0] + "-" + ys[ys.length-1]}`);
+    }
+    return {data: traces.filter(t => t.lat.length), layout: {map: {style: "open-street-map", zoom: 0, center: {lat: 20, lon: 0}},
+        margin: {r: 0, t: 0, l: 0, b: 0}, legend: {orientation: "h", x: 0.01, y: 0.02, bgcolor: "#f9f9f9"}}};
+}
+
+function viewRegions(rows) {
+    const rg = cat.REGION, st = cat.STATE, mode = modes.regions;
+    const keep = mode === "yield_A" ? rows.filter(i => cat.TYPE_SHORT.codes[i] >= 0 && atmospheric[cat.TYPE_SHORT.codes[i]]) : rows;
+    const weight = mode === "number" ? null : (i => Number.isNaN(col.YIELD[i]) ? 0 : col.YIELD[i] / 1000);
+    const total = countBy(keep, rg.codes, rg.values.length, weight);
+    const order = [...rg.values.keys()].filter(k => total[k] > 0).sort((a, b) => total[a] - total[b]);
+    const data = st.values.map((v, k) => {
+        const values = new Float64Array(rg.values.length);
+        for (const i of keep) if (st.codes[i] === k && rg.codes[i] >= 0) values[rg.codes[i]] += weight ? weight(i) : 1;
+        return {type: "bar", orientation: "h", name: st.names[k], marker: {color: st.colors[k]},
+            y: order.map(r => rg.names[r]), x: order.map(r => values[r]), customdata: order,
+            hovertemplate: mode === "number" ? "%{y}: <br> N = %{x}" : "%{y}: <br> %{x:.3f} MT"};
+    }).filter(t => t.x.some(x => x > 0));
+    return {data: data, layout: {barmode: "stack", margin: {r: 10, t: 40, l: 10, b: 40}, showlegend: false,
+        yaxis: {automargin: true}, xaxis: {title: {text: S.region_modes[mode]}},
+        updatemenus: modeButtons(S.region_modes, mode, 0, 1.01)}};
+}
+
+function viewHOB(rows) {
+    const st = cat.STATE;
+    const traces = st.values.map((v, k) => ({type: "scattergl", mode: "markers", x: [], y: [], text: [], name: st.names[k],
+        marker: {color: st.colors[k], size: 6, line: {width: 0.5, color: "black"}},
+        hovertemplate: "%{text} <br> %{x|%Y-%m-%d} <br> HOB = %{y:.0f} m<extra></extra>"}));
+    for (const i of rows) {
+        if (Number.isNaN(col.HOB[i]) || Number.isNaN(time[i])) continue;
+        const t = traces[st.codes[i]];
+        t.x.push(time[i]); t.y.push(col.HOB[i]); t.text.push(S.names[i]);
+    }
+    return {data: traces.filter(t => t.x.length), layout: {margin: {r: 10, t: 10, l: 10, b: 40},
+        xaxis: {type: "date", title: {text: "Year"}}, yaxis: {range: S.hob_range, title: {text: "Height of burst [m]"}, automargin: true},
+        legend: {x: 0.01, y: 0.98}}};
+}
+
+const PIES_ = [
+    ["STATE", "Who?", [0.0, 0.3], [0.52, 1.0]], ["REGION", "Where?", [0.35, 0.65], [0.52, 1.0]],
+    ["TYPE_SHORT", "How?", [0.7, 1.0], [0.52, 1.0]], ["PUR_SHORT", "Why?", [0.17, 0.47], [0.0, 0.48]],
+    ["YIELD_CAT", "How <br> big?", [0.53, 0.83], [0.0, 0.48]]];
+
+function viewPies(rows) {
+    const data = PIES_.map(([d, text, x, y]) => {
+        const c = cat[d], counts = countBy(rows, c.codes, c.values.length);
+        const keys = [...c.values.keys()].filter(k => counts[k] > 0);
+        return {type: "pie", values: keys.map(k => counts[k]), labels: keys.map(k => c.names[k]), customdata: keys,
+            marker: {colors: keys.map(k => c.colors[k]), line: {width: 1.5}}, hole: 0.35, textinfo: "label", textposition: "inside",
+            sort: d !== "YIELD_CAT", direction: "clockwise", name: "", hovertemplate: "%{label} <br> N = %{value}",
+            domain: {x: x, y: y}, meta: d, showlegend: false};
+    });
+    const annotations = PIES_.map(([d, text, x, y]) => ({text: text, x: (x[0]+x[1])/2, y: (y[0]+y[1])/2, showarrow: false,
+        font: {size: 15}, xanchor: "center", yanchor: "middle"}));
+    return {data: data, layout: {annotations: annotations, margin: {r: 0, t: 0, l: 0, b: 0}}};
+}
+
+function viewYearBars(rows) {
+    const d = modes.year_bars, c = cat[d];
+    let first = Infinity, last = -Infinity;
+    for (const i of rows) if (year[i] > 0) { first = Math.min(first, year[i]); last = Math.max(last, year[i]); }
+    if (first > last) return {data: [], layout: {}};
+    const data = c.values.map((v, k) => {
+        const counts = new Float64Array(last - first + 1);
+        for (const i of rows) if (c.codes[i] === k && year[i] > 0) counts[year[i] - first] += 1;
+        return {type: "bar", name: c.names[k], marker: {color: c.colors[k], line: {width: 1.5}},
+            x: Array.from(counts.keys(), j => first + j), y: Array.from(counts), hovertemplate: "<b>%{x}</b> <br>N = %{y}"};
+    }).filter(t => t.y.some(y => y > 0));
+    return {data: data, layout: {barmode: "stack", bargap: 0, margin: {r: 0, t: 40, l: 10, b: 40},
+        xaxis: {title: {text: "Year"}}, yaxis: {title: {text: "Number of nuclear weapon explosions"}, automargin: true},
+        legend: {x: 0.98, y: 0.98, xanchor: "right"}, updatemenus: modeButtons(S.category_modes, d, 0, 1.01)}};
+}
+
+const VIEWS_ = {locations: viewLocations, regions: viewRegions, hob: viewHOB, pies: viewPies, year_bars: viewYearBars};
+const CONFIG_ = {responsive: true, modeBarButtonsToRemove: ["lasso2d", "select2d"]};
+
+function render() {
+    const rows = selected();
+    for (const [name, view] of Object.entries(VIEWS_)) {
+        const v = rows.length ? view(rows) : {data: [], layout: {}};
+        Plotly.react("view-" + name, v.data, v.layout, CONFIG_);
+    }
+    const active = Object.entries(filters).map(([d, v]) => d === "YEAR" ? v : cat[d].names[v]);
+    document.getElementById("filters").textContent = active.length
+        ? `${rows.length} of ${N} explosions: ${active.join(", ")}` : `${N} explosions`;
+    document.getElementById("reset").hidden = !active.length;
+}
+
+render();
+
+document.getElementById("reset").onclick = () => { for (const d in filters) delete filters[d]; render(); };
+document.getElementById("view-pies").on("plotly_click", e => {
+    const p = e.points[0];
+    toggleFilter(p.data.meta, p.customdata[0] ?? p.customdata);
+});
+document.getElementById("view-regions").on("plotly_click", e => toggleFilter("REGION", e.points[0].customdata));
+document.getElementById("view-year_bars").on("plotly_click", e => toggleFilter("YEAR", e.points[0].x));
+document.getElementById("view-year_bars").on("plotly_buttonclicked", e => { modes.year_bars = e.button.name; render(); });
+document.getElementById("view-regions").on("plotly_buttonclicked", e => { modes.regions = e.button.name; render(); });
+"""
+
+DASHBOARD_HTML_ = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+{plotlyjs}
+<style>
+body {{ font-family: sans-serif; margin: 1em; }}
+#header {{ display: flex; gap: 1em; align-items: baseline; }}
+#grid {{ display: grid; grid-template-columns: repeat(auto-fit, minmax(36em, 1fr)); gap: 1em; }}
+.view {{ height: 32em; }}
+#view-locations {{ grid-column: 1 / -1; height: 36em; }}
+</style>
+</head>
+<body>
+<div id="header"><h2>{title}</h2><span id="filters"></span><button id="reset" hidden>Reset filters</button></div>
+<div id="grid">
+<div class="view" id="view-locations"></div>
+<div class="view" id="view-year_bars"></div>
+<div class="view" id="view-pies"></div>
+<div class="view" id="view-regions"></div>
+<div class="view" id="view-hob"></div>
+</div>
+<script>
+{script}
+</script>
+</body>
+</html>
+"""
+
+
+def encode_category(values, order=None):
+    """Encodes categorical column as codes into a list of values.
+    Parameters
+    ---------
+        values : pd.Series
+            column
+        order : list
+            values in display order (None: order of appearance)
+    Returns
+    -------
+    (list of values, typed array spec of codes; -1 for missing or unlisted values)
+    """
+    if order is None:
+        order = list(values.dropna().unique())
+    codes = pd.Categorical(values.where(values.isin(order)), categories=order).codes
+    return [str(v) for v in order], figure_io.encode_array(codes.astype(np.int64))
+
+
+def make_event_store(df):
+    """Makes columnar store of the explosions for the dashboard: times (minutes since epoch), coordinates, yields
+    and heights of burst as typed arrays; categories as codes with values, legend names and colors; shot names.
+    Parameters
+    ---------
+        df : pd.Dataframe
+            explosion data
+    Returns
+    -------
+    dict (json serializable)
+    """
+    df = helpers.add_derived_columns(df, yield_bins=YIELD_BINS_)
+
+    minutes = df.DATETIME.to_numpy().astype("datetime64[m]")
+    minutes = np.where(np.isnat(minutes), MISSING_TIME_, minutes.astype(np.int64))
+
+    store = {
+        "n" : len(df),
+        "columns" : {
+            "TIME" : figure_io.encode_array(minutes.astype(np.int64)),
+            "LAT" : figure_io.encode_array(df.LAT.to_numpy(np.float32)),
+            "LONG" : figure_io.encode_array(df.LONG.to_numpy(np.float32)),
+            "YIELD" : figure_io.encode_array(df.YIELD.to_numpy(np.float32)),
+            "HOB" : figure_io.encode_array(df.HOB.to_numpy(np.float32)),
+        },
+        "categories" : {},
+        "names" : df.SHOTNAME.fillna("").astype(str).tolist(),
+        "category_modes" : CATEGORY_DICT_,
+        "region_modes" : {"number": "Number of explosions", "yield": "Cumulative yield [MT]", "yield_A": "Cumulative yield (only atmospheric) [MT]"},
+        "hob_range" : HOB_RANGE_,
+    }
+
+    for category in CATEGORY_DICT_:
+        styles = get_category_styles(df, category)
+        values, codes = encode_category(df[category], [v for (v, _, _) in styles])
+        store["categories"][category] = {
+            "values" : values,
+            "names" : [str(name) for (_, name, _) in styles],
+            "colors" : [color for (_, _, color) in styles],
+            "codes" : codes,
+        }
+
+    return store
+
+
+def make_dashboard_html(df, title="Nuclear weapon explosions", plotlyjs="inline"):
+    """Makes the dashboard page.
+    Parameters
+    ---------
+        df : pd.Dataframe
+            explosion data
+        title : str
+            page title
+        plotlyjs : str
+            "inline" to embed plotly.js, "cdn" to load it from the plotly CDN (version of the installed plotly)
+    Returns
+    -------
+    str (html)
+    """
+    if plotlyjs == "inline":
+        from plotly.offline import get_plotlyjs
+        plotlyjs = f'<script type="text/javascript">{get_plotlyjs()}</script>'
+    else:
+        from plotly.offline import get_plotlyjs_version
+        plotlyjs = f'<script src="https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js"></script>'
+
+    store = json.dumps(make_event_store(df), separators=(",", ":")).replace("</", "<\\/")
+    script = DASHBOARD_JS_.replace("DATA_", store).replace("MISSING_TIME_", str(MISSING_TIME_))
+
+    return DASHBOARD_HTML_.format(title=html.escape(title), plotlyjs=plotlyjs, script=script)
+
+
+def main(infilename, outfilename, plotlyjs="inline", content_hash=False, filters=None):
+    """Main.
+    Parameters
+    ---------
+        infilename : str
+            filename of pickled pd.Dataframe
+        outfilename : str
+            html filename
+        plotlyjs : str
+            "inline" to embed plotly.js, "cdn" to load it from the plotly CDN (version of the installed plotly)
+        content_hash : bool
+            if True, the file name carries a hash of its content (see figure_io.add_content_hash)
+        filters : dict
+            only explosions selected by these filters are loaded (see helpers.load_events, helpers.make_filters)
+    """
+
+    df = helpers.load_events(infilename, **(filters or {}))
+    if len(df) == 0:
+        print("[ERROR] No explosions match the filters. ")
+        return
+
+    with metrics.timer("figures_stage_seconds", stage="make_dashboard_html"):
+        content = make_dashboard_html(df, plotlyjs=plotlyjs).encode('utf-8')
+    figure_io.write_if_changed(outfilename, content)
+    metrics.inc("figures_written_bytes_total", len(content), output=os.path.basename(outfilename))
+    if content_hash:
+        outfilename = figure_io.add_content_hash(outfilename)
+    print(f"[INFO] Saved dashboard of {len(df)} explosions as {outfilename} ({os.path.getsize(outfilename)/2**20:.2f} MB).")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--infilename", help="infilename", required=True)
+    parser.add_argument("-o", "--outfilename", help="outfilename (html)", required=True)
+    parser.add_argument("--plotlyjs", help="embed plotly.js or load it from the CDN", choices=["inline", "cdn"], default="inline")
+    parser.add_argument("--content-hash", help="put a hash of the content into the output file name", action="store_true")
+
+    parser.add_argument("--metrics", help="write build metrics (stage durations, rows, traces, bytes) to this file: .prom for Prometheus text, otherwise appended json lines", default=None)
+    parser.add_argument("--stage-cache", help="cache loaded, enriched and aggregated data in this directory (reused by later builds)", default=None)
+
+    helpers.add_filter_arguments(parser)
+    args = parser.parse_args()
+    try:
+        filters = helpers.make_filters(args.state, args.years, args.type, args.purpose)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.stage_cache:
+        stage_cache.enable(args.stage_cache)
+
+    main(args.infilename, args.outfilename, plotlyjs=args.plotlyjs, content_hash=args.content_hash, filters=filters)
+    if args.metrics:
+        metrics.write(args.metrics, script=parser.prog)
@@ -0,0 +1,717 @@
+"""
+Code snippet to save figures (html, pkl and their variants).
+"""
+
+import gzip
+import hashlib
+import json
+import os.path
+
+import numpy as np
+
+import helpers
+import metrics
+import trace_groups
+
+# Typed array dtypes understood by plotly.js (smallest first)
+INT_DTYPES_ = ["i1", "u1", "i2", "u2", "i4", "u4"]
+
+# Significant digits of floats in reproducible output (hides summation-order noise)
+REPRODUCIBLE_DIGITS_ = 12
+
+# Logical -> content-hashed file names of the figures in a directory
+CONTENT_HASHES_ = "content_hashes.json"
+
+# Shard urls and loaded modes are kept on the plot div, so figure_patch.js can point them to a new build
+LAZY_MODES_SCRIPT_ = """
+(function() {
+    var gd = document.getElementById('{plot_id}');
+    gd._lazyShards = %(shards)s;
+    gd._lazyLoaded = {};
+    gd.on('plotly_buttonclicked', function(e) {
+        var mode = e.button.name;
+        var shards = gd._lazyShards, loaded = gd._lazyLoaded;
+        if (!(mode in shards) || loaded[mode]) {
+            return;
+        }
+        loaded[mode] = true;
+        var url = shards[mode];
+        fetch(url).then(function(r) { return r.json(); }).then(function(shard) {
+            if (gd._lazyShards[mode] !== url) {
+                return;
+            }
+            shard.indices.forEach(function(index, i) {
+                var update = {};
+                Object.keys(shard.data[i]).forEach(function(key) {
+                    update[key] = [shard.data[i][key]];
+                });
+                Plotly.restyle(gd, update, [index]);
+            });
+        }).catch(function() { if (gd._lazyShards[mode] === url) { gd._lazyLoaded[mode] = false; } });
+    });
+})();
+"""
+
+
+FIGURE_PATCH_JS_ = """// Applies figure patches written by figure_io.write_figure_patch to a page that already shows the figure:
+//     applyFigurePatch(document.getElementById(div_id), 'figure.patch.json').then(function(ok) { ... });
+// Resolves to false (page left as it is) if the patch was made for another version of the figure than the one
+// shown (layout.meta.figure_version, written with the figure by figure_io.save_figure(..., patch=True)).
+function applyFigurePatch(gd, url) {
+    return fetch(url, {cache: 'no-cache'}).then(function(r) { return r.json(); }).then(function(patch) {
+        if ((gd.layout.meta || {}).figure_version !== patch.base) {
+            return false;
+        }
+        var data = gd.data.slice(0, patch.length);
+        Object.keys(patch.data).forEach(function(i) {
+            var trace = Object.assign({}, data[i] || {});
+            Object.keys(patch.data[i]).forEach(function(key) {
+                if (patch.data[i][key] === null) { delete trace[key]; } else { trace[key] = patch.data[i][key]; }
+            });
+            data[i] = trace;
+        });
+        var layout = Object.assign({}, gd.layout);
+        Object.keys(patch.layout).forEach(function(key) {
+            if (patch.layout[key] === null) { delete layout[key]; } else { layout[key] = patch.layout[key]; }
+        });
+        layout.meta = Object.assign({}, layout.meta, {figure_version: patch.version});
+        return Plotly.react(gd, data, layout).then(function() {
+            if (patch.shards) {
+                // lazy modes: load the shards of the new build on the next click
+                gd._lazyShards = patch.shards;
+                gd._lazyLoaded = {};
+            }
+            return true;
+        });
+    });
+}
+"""
+
+
+def save_figure(fig, outfilename, lazy_modes=None, compact=False, post_script=None, patch=False, reproducible=False, content_hash=False):
+    """Saves figure as html, json or pkl file (chosen by file extension).
+    Parameters
+    ---------
+        fig : go.Figure
+            figure to save
+        outfilename : str
+            filename to save to (.html, .json or .pkl)
+        lazy_modes : list of str
+            modes (trace meta) switched by buttons; data of modes not visible at start is written to
+            separate json shards next to the html file, fetched by the page on first button click
+        compact : bool
+            if True, numeric trace arrays are written as base64 typed arrays (float32 where precision allows)
+            and pre-compressed .gz/.br variants are written next to the output
+        post_script : str
+            html only: javascript to run after the plot is drawn (e.g. from animation.add_year_animation)
+        patch : bool
+            if True, a patch from the previous build of the figure to this one is written as well (see write_figure_patch),
+            and the version of the figure is written into layout.meta (see add_figure_version)
+        reproducible : bool
+            if True, html and json output is byte-identical for the same figure: sorted keys, floats rounded to
+            REPRODUCIBLE_DIGITS_, div id from the content; unchanged files are not rewritten
+        content_hash : bool
+            if True (implies reproducible), html and json output (and shards) carry a hash of their content in the
+            file name, e.g. figure.3f2a9c1b04de.html (see add_content_hash)
+    Returns
+    -------
+    True if the figure was saved.
+    """
+    with metrics.timer("figures_stage_seconds", stage="save_figure"):
+        savedfilename = _save_figure(fig, outfilename, lazy_modes, compact, post_script, patch, reproducible, content_hash)
+    if savedfilename is None:
+        return False
+
+    output = os.path.basename(outfilename)
+    metrics.inc("figures_traces_total", len(fig.data), output=output)
+    metrics.inc("figures_written_bytes_total", os.path.getsize(savedfilename), output=output)
+    return True
+
+
+def _save_figure(fig, outfilename, lazy_modes=None, compact=False, post_script=None, patch=False, reproducible=False, content_hash=False):
+    """Saves figure (see save_figure).
+    Returns
+    -------
+    name of the saved file, or None
+    """
+    reproducible = reproducible or content_hash
+    savedfilename = outfilename
+    shard_urls = None
+    if patch:
+        patchfig = fig
+        fig = add_figure_version(fig)
+    if outfilename.find(".html") > -1:
+        post_scripts = [post_script] if post_script else []
+        if trace_groups.needs_page_script(fig):
+            post_scripts += [trace_groups.TRACE_GROUPS_JS_ + "enableTraceGroups(document.getElementById('{plot_id}'));"]
+        if lazy_modes:
+            fig, lazy_script, shard_urls = write_lazy_mode_shards(fig, outfilename, lazy_modes, compact=compact, reproducible=reproducible, content_hash=content_hash)
+            post_scripts += [lazy_script]
+        write_html(fig, outfilename, post_script=post_scripts or None, compact=compact, reproducible=reproducible)
+    elif post_script:
+        print("[ERROR] Figures with scripts (e.g. animations) can only be saved as .html file. ")
+        return None
+    elif outfilename.find(".json") > -1:
+        save_json(fig, outfilename, compact=compact, reproducible=reproducible)
+        if trace_groups.needs_page_script(fig):
+            scriptfilename = os.path.join(os.path.dirname(os.path.abspath(outfilename)), "trace_groups.js")
+            write_if_changed(scriptfilename, trace_groups.TRACE_GROUPS_JS_.encode())
+            print(f"[INFO] The buttons of {outfilename} need enableTraceGroups(div) from {scriptfilename} in the page.")
+    elif outfilename.find(".pkl") > -1:
+        helpers.save_pkl(fig, outfilename)
+    else:
+        print("[ERROR] You can save the figure only as .html, .json or .pkl file. ")
+        return None
+
+    if content_hash and outfilename.find(".pkl") < 0:
+        savedfilename = add_content_hash(outfilename)
+
+    print(f"[INFO] Saved figure as {savedfilename}.")
+
+    if compact:
+        write_precompressed(savedfilename)
+
+    if patch:
+        write_figure_patch(patchfig, outfilename, shards=shard_urls)
+
+    return savedfilename
+
+
+def write_tables(tables, outfilename, fmt="csv"):
+    """Writes aggregate tables computed while building a figure next to it (<outfilename without extension>.<table>.<fmt>).
+    Parameters
+    ---------
+        tables : dict
+            table name -> pd.Dataframe (e.g. filled by make_figure(df, tables=...))
+        outfilename : str
+            filename of the figure
+        fmt : str
+            "csv" or "parquet" (needs pyarrow or fastparquet, else csv is written)
+    Returns
+    -------
+    list of written filenames
+    """
+    if fmt == "parquet":
+        try:
+            import pyarrow
+        except ImportError:
+            try:
+                import fastparquet
+            except ImportError:
+                print("[WARNING] Neither pyarrow nor fastparquet is installed, writing tables as csv.")
+                fmt = "csv"
+
+    base = os.path.splitext(outfilename)[0]
+    filenames = []
+    for name, table in tables.items():
+        filename = f"{base}.{name}.{fmt}"
+        if fmt == "parquet":
+            table.to_parquet(filename)
+        else:
+            table.to_csv(filename)
+        filenames += [filename]
+        print(f"[INFO] Saved table '{name}' ({len(table)} rows) as {filename}.")
+
+    return filenames
+
+
+def write_html(fig, outfilename, post_script=None, compact=False, reproducible=False):
+    """Writes figure to html file.
+    Parameters
+    ---------
+        fig : go.Figure
+            figure to save
+        outfilename : str
+            html filename
+        post_script : str or list of str
+            javascript to run after the plot is drawn ({plot_id} is replaced by the div id)
+        compact : bool
+            if True, numeric trace arrays are written as base64 typed arrays
+        reproducible : bool
+            if True, the same figure gives the same bytes (see canonical_figure); unchanged files are not rewritten
+    """
+    if not compact and not reproducible:
+        fig.write_html(outfilename, post_script=post_script)
+        return
+
+    import plotly.io as pio
+
+    fig_dict = encode_typed_arrays(fig.to_plotly_json()) if compact else fig
+    div_id = None
+    if reproducible:
+        fig_dict = canonical_figure(fig_dict)
+        div_id = "figure-" + hashlib.sha1(pio.to_json(fig_dict, validate=False).encode()).hexdigest()[:12]
+    html = pio.to_html(fig_dict, validate=False, post_script=post_script, div_id=div_id)
+    if reproducible:
+        write_if_changed(outfilename, html.encode('utf-8'))
+    else:
+        with open(outfilename, 'w', encoding='utf-8') as f:
+            f.write(html)
+    if not compact:
+        return
+
+    n_plain = len(pio.to_json(fig))
+    n_compact = len(pio.to_json(fig_dict, validate=False))
+    print(f"[INFO] {outfilename}: figure data {n_plain} -> {n_compact} bytes ({(n_compact-n_plain)/n_plain*100:+.0f}%).")
+
+
+def save_json(fig, outfilename, compact=False, reproducible=False):
+    """Writes figure as plotly json (serialized with orjson if installed), atomically, i.e. readers
+    see either the old or the complete new file.
+    Parameters
+    ---------
+        fig : go.Figure
+            figure to save
+        outfilename : str
+            json filename
+        compact : bool
+            if True, numeric trace arrays are written as base64 typed arrays
+        reproducible : bool
+            if True, the same figure gives the same bytes (see canonical_figure); unchanged files are not rewritten
+    """
+    import plotly.io as pio
+
+    if compact:
+        content = pio.to_json(encode_typed_arrays(fig.to_plotly_json()), validate=False)
+    else:
+        content = pio.to_json(fig)
+
+    if reproducible:
+        content = json.dumps(canonical_figure(json.loads(content)), separators=(",", ":"), ensure_ascii=False)
+        write_if_changed(outfilename, content.encode('utf-8'))
+        return
+
+    tmpfilename = os.path.join(os.path.dirname(os.path.abspath(outfilename)), f".{os.path.basename(outfilename)}.tmp")
+    with open(tmpfilename, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmpfilename, outfilename)
+
+
+def load_figure_json(infilename, validate=False):
+    """Loads figure saved with save_json (or any plotly json).
+    Parameters
+    ---------
+        infilename : str
+            json filename
+        validate : bool
+            if True, all properties are validated by plotly (slow for large figures)
+    Returns
+    -------
+    go.Figure
+    """
+    import plotly.graph_objects as go
+
+    try:
+        from orjson import loads
+    except ImportError:
+        loads = json.loads
+
+    with open(infilename, 'rb') as f:
+        fig_dict = loads(f.read())
+
+    return go.Figure(fig_dict, _validate=validate)
+
+
+def round_floats(obj, digits=REPRODUCIBLE_DIGITS_):
+    """Rounds floats in nested dicts and lists to significant digits and sorts dict keys."""
+    if isinstance(obj, dict):
+        return {k: round_floats(obj[k], digits) for k in sorted(obj)}
+    if isinstance(obj, list):
+        return [round_floats(x, digits) for x in obj]
+    if isinstance(obj, float):
+        return float(f"{obj:.{digits}g}")
+    return obj
+
+
+def canonical_figure(fig, digits=REPRODUCIBLE_DIGITS_):
+    """Canonical form of a figure for reproducible output: plotly json as dict with sorted keys and floats rounded
+    to significant digits, so equal figures serialize to equal bytes.
+    Parameters
+    ---------
+        fig : go.Figure or dict
+            figure (or figure dict, e.g. with typed arrays)
+        digits : int
+            significant digits of floats
+    Returns
+    -------
+    dict
+    """
+    import plotly.io as pio
+
+    return round_floats(json.loads(pio.to_json(fig, validate=False)), digits)
+
+
+def write_if_changed(filename, content):
+    """Writes content (bytes) atomically, unless the file already has exactly this content (keeps its mtime, so
+    unchanged files are skipped by rsync and caches).
+    Returns
+    -------
+    True if the file was written.
+    """
+    if os.path.isfile(filename) and os.path.getsize(filename) == len(content):
+        with open(filename, 'rb') as f:
+            if f.read() == content:
+                print(f"[INFO] {filename} is unchanged.")
+                return False
+
+    tmpfilename = os.path.join(os.path.dirname(os.path.abspath(filename)), f".{os.path.basename(filename)}.tmp")
+    with open(tmpfilename, 'wb') as f:
+        f.write(content)
+    os.replace(tmpfilename, filename)
+    return True
+
+
+def content_hashed_filename(filename, content):
+    """File name with hash of content before the extension (e.g. figure.3f2a9c1b04de.html)."""
+    base, ext = os.path.splitext(filename)
+    return f"{base}.{hashlib.sha256(content).hexdigest()[:12]}{ext}"
+
+
+def add_content_hash(filename):
+    """Moves a written file to its content-hashed name (see content_hashed_filename) and records the name in
+    CONTENT_HASHES_ next to it (logical name -> hashed name), e.g. for deploy scripts and links.
+    Returns
+    -------
+    hashed filename
+    """
+    with open(filename, 'rb') as f:
+        content = f.read()
+    hashedfilename = content_hashed_filename(filename, content)
+    write_if_changed(hashedfilename, content)
+    os.remove(filename)
+
+    mapfilename = os.path.join(os.path.dirname(os.path.abspath(filename)), CONTENT_HASHES_)
+    hashes = {}
+    if os.path.isfile(mapfilename):
+        with open(mapfilename, 'r') as f:
+            hashes = json.load(f)
+    hashes[os.path.basename(filename)] = os.path.basename(hashedfilename)
+    write_if_changed(mapfilename, (json.dumps(hashes, indent=1, sort_keys=True) + "\n").encode())
+
+    return hashedfilename
+
+
+def encode_array(a, rtol=1e-6):
+    """Encodes numeric array as plotly.js typed array spec (dict with dtype and base64 bdata).
+    Integers get the smallest fitting integer type (float64 beyond int32, exact up to 2**53), floats float32 if the
+    relative error stays below rtol (else float64), datetimes float64 milliseconds since epoch. Arrays with more
+    than one dimension (e.g. customdata) carry their shape.
+    Parameters
+    ---------
+        a : np.ndarray
+            array to encode
+        rtol : float
+            maximal relative error to accept float32
+    Returns
+    -------
+    typed array spec, or None if the array is not numeric (or integers beyond 2**53).
+    """
+    import base64
+
+    if a.dtype.kind == "M":
+        ms = a.astype("datetime64[ms]")
+        a = ms.astype(np.int64).astype(np.float64)
+        a[np.isnat(ms)] = np.nan
+        dtype = "f8"
+    elif a.dtype.kind in "iu":
+        dtype = None
+        for d in INT_DTYPES_:
+            info = np.iinfo(np.dtype(d))
+            if a.size == 0 or (a.min() >= info.min and a.max() <= info.max):
+                dtype = d
+                break
+        if dtype is None:
+            # plotly.js has no 64 bit integer arrays
+            if a.min() < -2**53 or a.max() > 2**53:
+                return None
+            dtype = "f8"
+    elif a.dtype.kind == "f":
+        a32 = a.astype(np.float32)
+        with np.errstate(invalid='ignore'):
+            dtype = "f4" if np.allclose(a32, a, rtol=rtol, atol=0, equal_nan=True) else "f8"
+    else:
+        return None
+
+    spec = {"dtype": dtype, "bdata": base64.b64encode(a.astype(np.dtype(dtype).newbyteorder("<")).tobytes()).decode("ascii")}
+    if a.ndim > 1:
+        spec["shape"] = ",".join(str(n) for n in a.shape)
+    return spec
+
+
+def decode_array(spec):
+    """Decodes plotly.js typed array spec (dict with dtype, base64 bdata and optional shape) to numpy array.
+    Parameters
+    ---------
+        spec : dict
+            typed array spec
+    Returns
+    -------
+    np.ndarray
+    """
+    import base64
+
+    a = np.frombuffer(base64.b64decode(spec["bdata"]), dtype=np.dtype(spec["dtype"]).newbyteorder("<"))
+    if "shape" in spec:
+        a = a.reshape([int(n) for n in str(spec["shape"]).split(",")])
+    return a
+
+
+def encode_typed_arrays(fig_dict, rtol=1e-6, min_length=8):
+    """Replaces numeric arrays in the traces of a figure dict by typed array specs (see encode_array).
+    Axes showing datetimes (now numbers) are set to type "date".
+    Parameters
+    ---------
+        fig_dict : dict
+            figure as dict (e.g. from fig.to_plotly_json()), modified in place
+        rtol : float
+            maximal relative error to accept float32
+        min_length : int
+            shorter arrays are kept as they are
+    Returns
+    -------
+    fig_dict
+    """
+
+    def encode(d, trace):
+        for key, v in d.items():
+            if isinstance(v, dict) and "bdata" in v and "shape" not in v:
+                # already typed (by plotly), but possibly wider than needed
+                v = decode_array(v)
+            elif isinstance(v, dict):
+                encode(v, trace)
+                continue
+            if not isinstance(v, (list, tuple, np.ndarray)) or len(v) < min_length:
+                continue
+            try:
+                a = np.asarray(v)
+            except ValueError:
+                continue
+            spec = encode_array(a, rtol=rtol)
+            if spec is None:
+                continue
+            d[key] = spec
+            if a.dtype.kind == "M" and key in ["x", "y"] and d is trace:
+                axis = trace.get(f"{key}axis", key)
+                axis = f"{axis[0]}axis{axis[1:]}"
+                fig_dict.setdefault("layout", {}).setdefault(axis, {}).setdefault("type", "date")
+
+    for trace in fig_dict.get("data", []):
+        encode(trace, trace)
+
+    return fig_dict
+
+
+def write_precompressed(filename):
+    """Writes pre-compressed variants (.gz, and .br if brotli is installed) next to a file and reports their sizes.
+    Parameters
+    ---------
+        filename : str
+            file to compress
+    """
+    with open(filename, 'rb') as f:
+        content = f.read()
+
+    sizes = [f"{len(content)} bytes"]
+
+    write_if_changed(f"{filename}.gz", gzip.compress(content, compresslevel=9, mtime=0))
+    sizes += [f"gz {os.path.getsize(f'{filename}.gz')}"]
+
+    try:
+        import brotli
+        write_if_changed(f"{filename}.br", brotli.compress(content, quality=11))
+        sizes += [f"br {os.path.getsize(f'{filename}.br')}"]
+    except ImportError:
+        print("[WARNING] brotli is not installed, skipping .br variant.")
+
+    print(f"[INFO] {filename}: {', '.join(sizes)}.")
+
+
+def split_lazy_modes(fig, modes):
+    """Moves data arrays of hidden modes out of a copy of the figure.
+    Parameters
+    ---------
+        fig : go.Figure
+            figure with traces tagged by mode (trace meta)
+        modes : list of str
+            modes switched by buttons
+    Returns
+    -------
+    (go.Figure without data arrays of hidden modes, dict mode -> {"indices": [...], "data": [...]})
+    """
+    import plotly.graph_objects as go
+
+    fig_inline = go.Figure(fig)
+
+    hidden_modes = [m for m in modes
+        if all(t.visible is False for t in fig_inline.data if t.meta == m)]
+
+    shards = {m: {"indices": [], "data": []} for m in hidden_modes}
+    for i, t in enumerate(fig_inline.data):
+        if t.meta not in shards:
+            continue
+        arrays = {k: v for (k, v) in t.to_plotly_json().items()
+            if hasattr(v, "__len__") and not isinstance(v, (str, dict))}
+        t.update({k: None for k in arrays})
+        shards[t.meta]["indices"] += [i]
+        shards[t.meta]["data"] += [arrays]
+
+    return fig_inline, shards
+
+
+def write_lazy_mode_shards(fig, outfilename, modes, compact=False, reproducible=False, content_hash=False):
+    """Writes the data of modes hidden at start to json shards (<outfilename without .html>.<mode>.json),
+    fetched by the page on first click of the mode's button.
+    Buttons need name=mode (see trace_groups.TraceGroups); the page has to be served (e.g. http), not opened as file.
+    Parameters
+    ---------
+        fig : go.Figure
+            figure to save
+        outfilename : str
+            html filename
+        modes : list of str
+            modes switched by buttons
+        compact : bool
+            if True, shards hold typed arrays (see encode_typed_arrays) and get pre-compressed variants (see write_precompressed)
+        reproducible : bool
+            if True, shards are written in canonical form (see canonical_figure) and only if changed
+        content_hash : bool
+            if True, shard names carry a hash of their content (<outfilename without .html>.<mode>.<hash>.json)
+    Returns
+    -------
+    (figure to write inline, post_script for the html that loads the shards, dict mode -> shard url)
+    """
+    from plotly.io.json import to_json_plotly
+
+    fig_inline, shards = split_lazy_modes(fig, modes)
+
+    base = outfilename[:outfilename.rfind(".html")]
+    urls = {}
+    for mode, shard in shards.items():
+        shardfilename = f"{base}.{mode}.json"
+        if compact:
+            encoded = encode_typed_arrays({"data": shard["data"]})
+            # axes of datetimes in the shard (now numbers) are set to type "date" in the page
+            fig_inline.update_layout(encoded.get("layout", {}))
+        if reproducible:
+            content = json.dumps(round_floats(json.loads(to_json_plotly(shard))), separators=(",", ":"), ensure_ascii=False).encode('utf-8')
+            if content_hash:
+                shardfilename = content_hashed_filename(shardfilename, content)
+            write_if_changed(shardfilename, content)
+        else:
+            with open(shardfilename, 'w') as f:
+                f.write(to_json_plotly(shard))
+        urls[mode] = os.path.basename(shardfilename)
+        print(f"[INFO] Saved data of mode '{mode}' as {shardfilename}.")
+        if compact:
+            write_precompressed(shardfilename)
+
+    return fig_inline, LAZY_MODES_SCRIPT_ % {"shards": json.dumps(urls)}, urls
+
+
+def diff_dicts(old, new):
+    """Top-level keys of new whose values differ from old (removed keys map to None)."""
+    changed = {k: v for (k, v) in new.items() if k not in old or old[k] != v}
+    changed.update({k: None for k in old if k not in new})
+    return changed
+
+
+def make_figure_patch(old_spec, new_spec):
+    """Makes patch from one figure spec (plotly json as dict) to another: changed trace attributes (per trace index)
+    and changed layout keys, each replaced as a whole.
+    Parameters
+    ---------
+        old_spec : dict
+            figure spec of the previous build
+        new_spec : dict
+            figure spec of the current build
+    Returns
+    -------
+    dict with keys "length" (number of traces), "data" (trace index -> changed attributes) and "layout"
+    """
+    old_data, new_data = old_spec.get("data", []), new_spec.get("data", [])
+    data = {}
+    for i, trace in enumerate(new_data):
+        changed = diff_dicts(old_data[i] if i < len(old_data) else {}, trace)
+        if changed:
+            data[str(i)] = changed
+
+    return {
+        "length" : len(new_data),
+        "data" : data,
+        "layout" : diff_dicts(old_spec.get("layout", {}), new_spec.get("layout", {})),
+    }
+
+
+def get_figure_version(fig):
+    """Version of a figure: hash of its plotly json (the base and version of patches, see write_figure_patch)."""
+    import plotly.io as pio
+
+    return hashlib.sha1(pio.to_json(fig).encode()).hexdigest()
+
+
+def add_figure_version(fig):
+    """Copy of the figure with its version (see get_figure_version) in layout.meta.figure_version, so figure_patch.js
+    only applies patches made for the version a page shows.
+    """
+    import plotly.graph_objects as go
+
+    version = get_figure_version(fig)
+    fig = go.Figure(fig)
+    fig.update_layout(meta={"figure_version": version})
+    return fig
+
+
+def write_figure_patch(fig, outfilename, shards=None):
+    """Writes patch from the previous build of a figure to this one (<outfilename without extension>.patch.json),
+    and the loader applying it to an open page with Plotly.react (figure_patch.js, see FIGURE_PATCH_JS_).
+    The spec of every build is kept as <outfilename without extension>.spec.json for the next patch.
+    Parameters
+    ---------
+        fig : go.Figure
+            figure of the current build
+        outfilename : str
+            filename of the figure
+        shards : dict
+            mode -> url of the lazy mode shards of this build (see write_lazy_mode_shards), carried by the patch so
+            the page loads these instead of the shards of the build it shows
+    Returns
+    -------
+    patch filename, or None if there was no previous build
+    """
+    import plotly.io as pio
+
+    base = os.path.splitext(outfilename)[0]
+    specfilename, patchfilename = f"{base}.spec.json", f"{base}.patch.json"
+
+    content = pio.to_json(fig)
+    new_spec = json.loads(content)
+
+    old_spec, old_content = None, None
+    if os.path.isfile(specfilename):
+        with open(specfilename, 'r', encoding='utf-8') as f:
+            old_content = f.read()
+        old_spec = json.loads(old_content)
+
+    if old_spec is not None:
+        patch = make_figure_patch(old_spec, new_spec)
+        patch["base"] = hashlib.sha1(old_content.encode()).hexdigest()
+        patch["version"] = hashlib.sha1(content.encode()).hexdigest()
+        if shards:
+            patch["shards"] = shards
+        patch_content = json.dumps(patch, separators=(",", ":"))
+        with open(patchfilename, 'w', encoding='utf-8') as f:
+            f.write(patch_content)
+        with open(os.path.join(os.path.dirname(os.path.abspath(outfilename)), "figure_patch.js"), 'w') as f:
+            f.write(FIGURE_PATCH_JS_)
+        print(f"[INFO] Saved patch ({len(patch['data'])} traces, {len(patch['layout'])} layout keys changed; "
+            f"{len(patch_content)} of {len(content)} bytes) as {patchfilename}.")
+    else:
+        patchfilename = None
+        print(f"[INFO] No previous build of {outfilename}, keeping its spec for the next patch.")
+
+    tmpfilename = f"{specfilename}.tmp"
+    with open(tmpfilename, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmpfilename, specfilename)
+
+    return patchfilename
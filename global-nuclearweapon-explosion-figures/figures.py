@@ -0,0 +1,109 @@
+"""
+Importable API of the figures, e.g. for notebooks or services: builders take a dataframe and return go.Figure,
+without file round-trips. Aggregations (location frequencies, region pie values, pie slice and year counts) are
+memoized on a fingerprint of the input dataframe, so building several figures from the same data in one session
+reuses them. Large catalogs are aggregated in worker processes after set_workers(N) (see parallel.py).
+
+e.g.:  import figures
+       df = figures.load_events("explosions.pkl", states=["US"], years=(1950, 1963))
+       fig = figures.year_bars(df)
+       fig = figures.build("regions", df, single_choropleth=True)
+"""
+
+import importlib
+
+from helpers import load_events, filter_events, add_derived_columns, frame_fingerprint
+from parallel import set_workers
+from shot_index import ShotIndex
+
+FIGURES_ = {
+    "locations" : "plot_explosion_locations",
+    "regions" : "plot_region_piechart_map",
+    "hob" : "plot_HOB",
+    "pies" : "plot_pies",
+    "year_bars" : "plot_year_bars",
+    "timeline" : "plot_timeline",
+}
+
+# memoized aggregations: (module, function)
+MEMOIZED_ = [
+    ("plot_explosion_locations", "make_location_frequency_df"),
+    ("plot_region_piechart_map", "make_region_state_values"),
+    ("plot_pies", "make_slice_counts"),
+    ("plot_year_bars", "make_year_count_table"),
+    ("plot_timeline", "make_cumulative_table"),
+]
+
+
+def build(figure, df, **kwargs):
+    """Builds a figure from explosion data.
+    Parameters
+    ---------
+        figure : str
+            key of FIGURES_
+        df : pd.Dataframe
+            explosion data (not modified)
+        kwargs :
+            passed to make_figure of the figure's module (e.g. tables, country_region_json)
+    Returns
+    -------
+    go.Figure
+    """
+    if figure not in FIGURES_:
+        raise ValueError(f"Unknown figure '{figure}' (one of {', '.join(FIGURES_)}).")
+    return importlib.import_module(FIGURES_[figure]).make_figure(df, **kwargs)
+
+
+def locations(df, **kwargs):
+    """Map of explosion locations (see plot_explosion_locations.make_figure)."""
+    return build("locations", df, **kwargs)
+
+
+def regions(df, **kwargs):
+    """Map with pie charts of explosion numbers and yields per world region (see plot_region_piechart_map.make_figure)."""
+    return build("regions", df, **kwargs)
+
+
+def hob(df, **kwargs):
+    """Height of burst over years (see plot_HOB.make_figure)."""
+    return build("hob", df, **kwargs)
+
+
+def pies(df, **kwargs):
+    """Overview pie charts (see plot_pies.make_figure)."""
+    return build("pies", df, **kwargs)
+
+
+def year_bars(df, **kwargs):
+    """Histograms of explosion numbers per year (see plot_year_bars.make_figure)."""
+    return build("year_bars", df, **kwargs)
+
+
+def timeline(df, **kwargs):
+    """Cumulative explosion numbers and yields over time (see plot_timeline.make_figure)."""
+    return build("timeline", df, **kwargs)
+
+
+def find_shots(df, query, limit=None):
+    """Explosions with a (full or alternate) shot name starting with query, case-insensitive (see shot_index.ShotIndex).
+    For many lookups, build the index once with ShotIndex.from_df(df).
+    Returns
+    -------
+    pd.Dataframe (rows of df, in name order)
+    """
+    return df.iloc[ShotIndex.from_df(df).prefix(query, limit=limit)]
+
+
+def cache_info():
+    """Hits, misses and size of the memoized aggregations.
+    Returns
+    -------
+    dict "module.function" -> dict
+    """
+    return {f"{m}.{f}": getattr(importlib.import_module(m), f).cache_info() for (m, f) in MEMOIZED_}
+
+
+def cache_clear():
+    """Empties the caches of the memoized aggregations."""
+    for (m, f) in MEMOIZED_:
+        getattr(importlib.import_module(m), f).cache_clear()
@@ -2,10 +2,17 @@
 Code snippet to jelp plotting, i/o and converting to strings.
 """
 
+import collections
+import functools
+import hashlib
 import pickle
 import re
+import threading
 import numpy as np
 
+import metrics
+import stage_cache
+
 COLORS_ = {
     "FR" : '#e41a1c',
     "USSR" : '#377eb8',
@@ -361,4 +368,276 @@ def make_yield_color_dict(bins=YIELD_BINS_):
     
     color_dict["n/a"] = 'rgb(240, 240, 240)'
 
-    return color_dict
\ No newline at end of file
+    return color_dict
+
+# Columns derived from TYPE, PUR and YIELD
+DERIVED_COLUMNS_ = ("TYPE_SHORT", "PUR_SHORT", "YIELD_CAT", "DELIVERY")
+
+
+def cached_stage(func):
+    """Decorator caching the output of a pipeline stage (function of a dataframe, first argument) on disk, if a stage
+    cache is enabled (see stage_cache.enable); otherwise the function is just called. Entries are keyed by the
+    content of the dataframe (see frame_fingerprint), the other arguments and the source of the function and its
+    project callees (see stage_cache.code_version).
+    Duration and rows of every call are recorded as metrics (see metrics.py).
+    """
+    @functools.wraps(func)
+    def wrapper(df, *args, **kwargs):
+        metrics.inc("figures_rows_total", len(df), stage=func.__name__)
+        with metrics.timer("figures_stage_seconds", stage=func.__name__):
+            cache = stage_cache.get_active()
+            if cache is None:
+                return func(df, *args, **kwargs)
+            key = stage_cache.make_key(stage_cache.code_version(func), frame_fingerprint(df), args, kwargs)
+            return cache.run(func.__name__, key, lambda: func(df, *args, **kwargs))
+    return wrapper
+
+
+def add_derived_columns(df, yield_bins=YIELD_BINS_):
+    """Adds columns derived from TYPE, PUR and YIELD (TYPE_SHORT, PUR_SHORT, YIELD_CAT, DELIVERY), 
+    if they are not there yet (e.g. when the data was enriched once for several figures).
+    Parameters
+    ---------
+        df : pd.Dataframe
+            explosion data (not modified)
+        yield_bins : list of float
+            bins for YIELD_CAT
+    Returns
+    -------
+    Dataframe with derived columns.
+    """
+    missing = [col for col in DERIVED_COLUMNS_ if col not in df.columns]
+    if len(missing) == 0:
+        return df
+    derived = make_derived_columns(df, tuple(missing), tuple(yield_bins))
+    return df.assign(**{col: derived[col].set_axis(df.index) for col in missing})
+
+
+@cached_stage
+def make_derived_columns(df, columns=DERIVED_COLUMNS_, yield_bins=YIELD_BINS_):
+    """Derives columns from TYPE, PUR and YIELD (stage "enrich", cached on disk if enabled, see cached_stage).
+    Parameters
+    ---------
+        df : pd.Dataframe
+            explosion data
+        columns : tuple of str
+            columns to derive (of DERIVED_COLUMNS_)
+        yield_bins : tuple of float
+            bins for YIELD_CAT
+    Returns
+    -------
+    pd.Dataframe with the derived columns (index of df)
+    """
+    import pandas as pd
+
+    derived = {
+        "TYPE_SHORT" : lambda: df["TYPE"].apply(lambda x: get_explosion_type(x)),
+        "PUR_SHORT" : lambda: df["PUR"].apply(lambda x: get_explosion_purpose(x)),
+        "YIELD_CAT" : lambda: df["YIELD"].apply(lambda x: get_yield_range_str(x, bins=list(yield_bins))),
+        "DELIVERY" : lambda: df["TYPE"].apply(lambda x: get_delivery(x)),
+    }
+    return pd.DataFrame({col: derived[col]() for col in columns}, index=df.index)
+
+
+def parse_years(years):
+    """Parses year range string (e.g. "1950-1960" or "1962") to tuple of first and last year.
+    Parameters
+    ---------
+        years : str
+            year range string
+    Returns
+    -------
+    (first year, last year)
+    """
+    first, _, last = str(years).strip().partition("-")
+    first = int(first)
+    last = int(last) if last else first
+    if last < first:
+        raise ValueError(f"Invalid year range '{years}'.")
+    return (first, last)
+
+
+def filter_events(df, states=None, years=None, types=None, purposes=None):
+    """Selects explosions by state, year range, type and purpose (None = no selection).
+    Parameters
+    ---------
+        df : pd.Dataframe
+            explosion data
+        states : list of str
+            states (e.g. ["US", "USSR"])
+        years : tuple of int
+            first and last year (inclusive)
+        types : list of str
+            explosion types (part of TYPE before hyphen, e.g. ["A", "UG"])
+        purposes : list of str
+            explosion purposes (as get_explosion_purpose, e.g. ["WR", "PR", "other"])
+    Returns
+    -------
+    Copy of the dataframe with the selected rows.
+    """
+    mask = np.ones(len(df), dtype=bool)
+    if states:
+        mask &= df["STATE"].isin(states).to_numpy()
+    if years:
+        mask &= df["YEAR"].between(years[0], years[1]).to_numpy()
+    # derived columns are only computed for rows still selected
+    if types:
+        rows = np.flatnonzero(mask)
+        type_short = df["TYPE_SHORT"].iloc[rows] if "TYPE_SHORT" in df.columns else df["TYPE"].iloc[rows].apply(get_explosion_type)
+        mask[rows] = type_short.isin(types).to_numpy()
+    if purposes:
+        rows = np.flatnonzero(mask)
+        pur_short = df["PUR_SHORT"].iloc[rows] if "PUR_SHORT" in df.columns else df["PUR"].iloc[rows].apply(get_explosion_purpose)
+        mask[rows] = pur_short.isin(purposes).to_numpy()
+    return df[mask].copy()
+
+
+def make_filters(state=None, years=None, type=None, purpose=None):
+    """Makes filters for filter_events/load_events from command line strings (comma-separated lists).
+    Parameters
+    ---------
+        state : str
+            e.g. "US,USSR"
+        years : str
+            e.g. "1950-1963"
+        type : str
+            e.g. "A,AS"
+        purpose : str
+            e.g. "WR"
+    Returns
+    -------
+    dict with keys states, years, types, purposes (None = no selection)
+    """
+    def get_list(s):
+        values = [v.strip() for v in s.split(",") if v.strip() != ""] if s else []
+        return tuple(sorted(set(values))) if values else None
+
+    return {
+        "states" : get_list(state),
+        "years" : parse_years(years) if years else None,
+        "types" : get_list(type),
+        "purposes" : get_list(purpose),
+    }
+
+
+def add_filter_arguments(parser):
+    """Adds the common filter flags (--state, --years, --type, --purpose) to an argument parser (see make_filters)."""
+    parser.add_argument("--state", help="only explosions of these states (comma-separated, e.g. US,USSR)", default=None)
+    parser.add_argument("--years", help="only explosions in these years (e.g. 1950-1963)", default=None)
+    parser.add_argument("--type", help="only explosions of these types (comma-separated, e.g. A,AS)", default=None)
+    parser.add_argument("--purpose", help="only explosions with these purposes (comma-separated, e.g. WR)", default=None)
+
+
+def load_events(infilename, states=None, years=None, types=None, purposes=None):
+    """Loads explosion data (pickled pd.Dataframe or parquet) with only the selected explosions (see filter_events).
+    For parquet files, state and year selection is pushed into the reader, so other rows are not read at all;
+    pickles are filtered right after loading, before anything is derived from the data.
+    If a stage cache is enabled (see stage_cache.enable), the selection is cached by content of the input file.
+    Parameters
+    ---------
+        infilename : str
+            pickled pd.Dataframe (.pkl) or parquet file (.parquet)
+        states, years, types, purposes : 
+            see filter_events
+    Returns
+    -------
+    pd.Dataframe
+    """
+    with metrics.timer("figures_stage_seconds", stage="load_events"):
+        cache = stage_cache.get_active()
+        if cache is not None:
+            key = stage_cache.make_key(stage_cache.code_version(_load_events, filter_events), stage_cache.file_digest(infilename),
+                (states, years, types, purposes))
+            df = cache.run("load_events", key, lambda: _load_events(infilename, states, years, types, purposes))
+        else:
+            df = _load_events(infilename, states, years, types, purposes)
+    metrics.inc("figures_rows_total", len(df), stage="load_events")
+    return df
+
+
+def _load_events(infilename, states=None, years=None, types=None, purposes=None):
+    """Loads explosion data without the stage cache (see load_events)."""
+    if infilename.endswith(".parquet"):
+        import pandas as pd
+        filters = []
+        if states:
+            filters += [("STATE", "in", list(states))]
+        if years:
+            filters += [("YEAR", ">=", years[0]), ("YEAR", "<=", years[1])]
+        df = pd.read_parquet(infilename, filters=filters or None)
+        states, years = None, None
+    else:
+        df = load_pkl(infilename)
+
+    if states or years or types or purposes:
+        n = len(df)
+        df = filter_events(df, states=states, years=years, types=types, purposes=purposes)
+        print(f"[INFO] Selected {len(df)} of {n} explosions.")
+    return df
+
+
+def frame_fingerprint(df):
+    """Fingerprint of a dataframe's content (values, index, columns and dtypes), e.g. to memoize computations on it.
+    Parameters
+    ---------
+        df : pd.Dataframe
+            dataframe
+    Returns
+    -------
+    hex string
+    """
+    import pandas as pd
+
+    h = hashlib.sha1()
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    h.update(repr([(str(c), str(t)) for (c, t) in df.dtypes.items()]).encode())
+    return h.hexdigest()
+
+
+def memoize_on_frame(maxsize=32):
+    """Decorator memoizing a function of a dataframe (first argument) on its fingerprint (see frame_fingerprint) and
+    the other (hashable) arguments, so the same aggregation of the same data is computed only once per session.
+    Results are copied on return (callers may modify them). The decorated function has cache_info() and cache_clear().
+    Parameters
+    ---------
+        maxsize : int
+            maximal number of cached results (least recently used are dropped)
+    """
+    def decorator(func):
+        cache = collections.OrderedDict()
+        lock = threading.Lock()
+        stats = {"hits": 0, "misses": 0}
+
+        def copy(result):
+            return result.copy() if hasattr(result, "copy") else result
+
+        @functools.wraps(func)
+        def wrapper(df, *args, **kwargs):
+            key = (frame_fingerprint(df), args, tuple(sorted(kwargs.items())))
+            with lock:
+                if key in cache:
+                    cache.move_to_end(key)
+                    stats["hits"] += 1
+                    return copy(cache[key])
+                stats["misses"] += 1
+
+            result = func(df, *args, **kwargs)
+
+            with lock:
+                cache[key] = result
+                while len(cache) > maxsize:
+                    cache.popitem(last=False)
+            return copy(result)
+
+        def cache_info():
+            return {**stats, "size": len(cache), "maxsize": maxsize}
+
+        def cache_clear():
+            with lock:
+                cache.clear()
+                stats.update(hits=0, misses=0)
+
+        wrapper.cache_info = cache_info
+        wrapper.cache_clear = cache_clear
+        return wrapper
+    return decorator
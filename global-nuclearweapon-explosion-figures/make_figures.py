@@ -0,0 +1,245 @@
+#!/usr/bin/env python3.13
+
+"""
+Command-line entry point with one subcommand per figure. Plotly, pandas and numpy are only imported
+once a figure is actually built, so --help and up-to-date runs (-u) finish in milliseconds.
+
+usage: make_figures.py [-h] [-v] {locations,regions,hob,pies,year-bars,timeline,dashboard} ...
+
+e.g.:  make_figures.py -v year-bars -i INFILENAME -o OUTFILENAME [-u] [--compact] [--lazy-modes] [--state US] [--years 1950-1963] [--workers 4] [--stage-cache DIR]
+"""
+
+import argparse
+import glob
+import hashlib
+import importlib
+import json
+import os
+import os.path
+import sys
+import time
+
+SCRIPT_DIR_ = os.path.dirname(os.path.abspath(__file__))
+
+STAMPFILE_ = ".make_figures.json"
+
+# Map of logical to content-hashed file names written next to the output (see figure_io.CONTENT_HASHES_)
+CONTENT_HASHES_ = "content_hashes.json"
+
+def float_tuple(s):
+    """Parses comma-separated numbers (e.g. "37.1,-116.0,50")."""
+    return tuple(float(x) for x in s.split(","))
+
+
+# option name -> (flags, argparse keywords)
+OPTIONS_ = {
+    "country_region_json" : (["-j", "--countryregionjson"], dict(dest="country_region_json", default=None,
+        help="json that maps states to region (defaults to the lookup shipped with the project)")),
+    "lazy_modes" : (["--lazy-modes"], dict(action="store_true",
+        help="html only: write data of hidden modes to json shards, loaded on first button click")),
+    "compact" : (["--compact"], dict(action="store_true",
+        help="write numeric trace arrays as typed arrays (float32 where precision allows) and pre-compressed .gz/.br variants")),
+    "single_choropleth" : (["--single-choropleth"], dict(action="store_true",
+        help="highlight all regions with one choropleth trace (faster map rendering)")),
+    "animate" : (["--animate"], dict(action="store_true",
+        help="html only: animate over years (year slider)")),
+    "max_points" : (["--max-points"], dict(type=int, default=20000,
+        help="above this number of explosions, points are thinned out and drawn with WebGL (0 for no limit)")),
+    "near" : (["--near"], dict(type=float_tuple, metavar="LAT,LON,KM",
+        help="only explosions within KM kilometers of the site LAT,LON")),
+    "bbox" : (["--bbox"], dict(type=float_tuple, metavar="LATMIN,LATMAX,LONMIN,LONMAX",
+        help="only explosions inside the viewport (LONMIN > LONMAX crosses the date line)")),
+    "resolution" : (["--resolution"], dict(choices=["day", "month", "year"], default=None,
+        help="curves change at most once per day, month or year (default: every explosion time)")),
+    "plotlyjs" : (["--plotlyjs"], dict(choices=["inline", "cdn"], default="inline",
+        help="embed plotly.js or load it from the CDN")),
+    "search" : (["--search"], dict(action="store_true",
+        help="html only: add a search box for shot names (prefix, case-insensitive) that zooms to the shot")),
+    "tables" : (["--tables"], dict(choices=["csv", "parquet"], default=None,
+        help="also write the aggregate tables next to the figure")),
+    "patch" : (["--patch"], dict(action="store_true",
+        help="also write a patch from the previous build (json, applied to an open page with figure_patch.js)")),
+    "reproducible" : (["--reproducible"], dict(action="store_true",
+        help="write the same bytes for the same figure (stable ids, sorted keys, rounded floats); unchanged files are not rewritten")),
+    "content_hash" : (["--content-hash"], dict(action="store_true",
+        help="put a hash of the content into the output file names (implies --reproducible)")),
+    "workers" : (["--workers"], dict(type=int, default=1,
+        help="aggregate large catalogs in this many worker processes (0: number of cpus)")),
+    "metrics" : (["--metrics"], dict(default=None,
+        help="write build metrics (stage durations, rows, traces, bytes) to this file: .prom for Prometheus text, otherwise appended json lines")),
+    "stage_cache" : (["--stage-cache"], dict(default=None,
+        help="cache loaded, enriched and aggregated data in this directory (reused by later builds)")),
+    "state" : (["--state"], dict(default=None,
+        help="only explosions of these states (comma-separated, e.g. US,USSR)")),
+    "years" : (["--years"], dict(default=None,
+        help="only explosions in these years (e.g. 1950-1963)")),
+    "type" : (["--type"], dict(default=None,
+        help="only explosions of these types (comma-separated, e.g. A,AS)")),
+    "purpose" : (["--purpose"], dict(default=None,
+        help="only explosions with these purposes (comma-separated, e.g. WR)")),
+}
+
+# options of every subcommand, passed to main as one filters dict (see helpers.make_filters)
+FILTERS_ = ["state", "years", "type", "purpose"]
+
+# options of every subcommand that change how, not what, is built (not passed to main, not part of the fingerprint)
+RUNTIME_ = ["workers", "stage_cache", "metrics"]
+
+# subcommand -> (module, help, options passed to module.main)
+SUBCOMMANDS_ = {
+    "locations" : ("plot_explosion_locations", "map of explosion locations", ["compact", "animate", "near", "bbox", "search", "tables", "patch", "reproducible", "content_hash"]),
+    "regions" : ("plot_region_piechart_map", "pie charts of explosion numbers and yield per world region",
+        ["country_region_json", "lazy_modes", "compact", "single_choropleth", "tables", "patch", "reproducible", "content_hash"]),
+    "hob" : ("plot_HOB", "height of burst over years", ["compact", "animate", "max_points", "patch", "reproducible", "content_hash"]),
+    "pies" : ("plot_pies", "overview pie charts", ["compact", "tables", "patch", "reproducible", "content_hash"]),
+    "year-bars" : ("plot_year_bars", "histograms of explosion numbers per year", ["lazy_modes", "compact", "tables", "patch", "reproducible", "content_hash"]),
+    "timeline" : ("plot_timeline", "cumulative explosion numbers and yields over time",
+        ["resolution", "lazy_modes", "compact", "tables", "patch", "reproducible", "content_hash"]),
+    "dashboard" : ("dashboard", "single page with all views, built in the browser from one copy of the data", ["plotlyjs", "content_hash"]),
+}
+
+
+def make_parser():
+    """Makes argument parser with one subparser per figure."""
+    parser = argparse.ArgumentParser(description="Make interactive figures of nuclear weapon explosions.")
+    parser.add_argument("-v", "--verbose", help="report import and build times", action="store_true")
+    subparsers = parser.add_subparsers(dest="figure", required=True)
+
+    for name, (module, help, options) in SUBCOMMANDS_.items():
+        subparser = subparsers.add_parser(name, help=help)
+        subparser.add_argument("-i", "--infilename", help="pickled pd.Dataframe with explosions", required=True)
+        subparser.add_argument("-o", "--outfilename", help="output file (.html, .json or .pkl)", required=True)
+        subparser.add_argument("-u", "--update", help="only build if input, code or options changed since the last build", action="store_true")
+        for option in options + FILTERS_ + RUNTIME_:
+            flags, kwargs = OPTIONS_[option]
+            subparser.add_argument(*flags, **kwargs)
+
+    return parser
+
+
+def get_fingerprint(args, options):
+    """Fingerprint of everything a build depends on: options, input file, region lookup and code (by size and mtime).
+    Parameters
+    ---------
+        args : argparse.Namespace
+            parsed arguments
+        options : list of str
+            options passed to the figure's main
+    """
+    files = [args.infilename] + sorted(glob.glob(os.path.join(SCRIPT_DIR_, "*.py"))) \
+        + sorted(glob.glob(os.path.join(SCRIPT_DIR_, "data", "*.json")))
+    if getattr(args, "country_region_json", None):
+        files += [args.country_region_json]
+
+    state = {
+        "figure" : args.figure,
+        "options" : {o: getattr(args, o) for o in options + FILTERS_},
+        "files" : [[f, os.stat(f).st_mtime_ns, os.stat(f).st_size] if os.path.isfile(f) else [f, None, None] for f in files],
+    }
+    return hashlib.sha1(json.dumps(state, sort_keys=True).encode()).hexdigest()
+
+
+def read_stamps(outfilename):
+    """Reads fingerprints of previous builds (kept next to the output)."""
+    stampfilename = os.path.join(os.path.dirname(os.path.abspath(outfilename)), STAMPFILE_)
+    if not os.path.isfile(stampfilename):
+        return {}
+    with open(stampfilename, 'r') as f:
+        return json.load(f)
+
+
+def get_written_filename(outfilename):
+    """File a build of outfilename wrote: outfilename, or its content-hashed name (see figure_io.add_content_hash),
+    or None if neither exists.
+    """
+    if os.path.isfile(outfilename):
+        return outfilename
+    mapfilename = os.path.join(os.path.dirname(os.path.abspath(outfilename)), CONTENT_HASHES_)
+    if not os.path.isfile(mapfilename):
+        return None
+    with open(mapfilename, 'r') as f:
+        hashedname = json.load(f).get(os.path.basename(outfilename))
+    if hashedname is None:
+        return None
+    hashedfilename = os.path.join(os.path.dirname(outfilename), hashedname)
+    return hashedfilename if os.path.isfile(hashedfilename) else None
+
+
+def is_up_to_date(outfilename, fingerprint):
+    """Whether the last build of outfilename had this fingerprint and the file it wrote is still there."""
+    stamp = read_stamps(outfilename).get(os.path.basename(outfilename))
+    if not isinstance(stamp, dict) or stamp.get("fingerprint") != fingerprint:
+        return False
+    return os.path.isfile(os.path.join(os.path.dirname(outfilename), stamp["file"]))
+
+
+def write_stamp(outfilename, fingerprint, writtenfilename):
+    """Records fingerprint of a finished build and the file it wrote (e.g. the content-hashed name)."""
+    stamps = read_stamps(outfilename)
+    stamps[os.path.basename(outfilename)] = {"fingerprint": fingerprint, "file": os.path.basename(writtenfilename)}
+    stampfilename = os.path.join(os.path.dirname(os.path.abspath(outfilename)), STAMPFILE_)
+    with open(stampfilename, 'w') as f:
+        json.dump(stamps, f, indent=1, sort_keys=True)
+
+
+def main(argv=None):
+    """Main.
+    Parameters
+    ---------
+        argv : list of str
+            command line arguments (None for sys.argv)
+    """
+    t_start = time.perf_counter()
+    parser = make_parser()
+    args = parser.parse_args(argv)
+    module_name, _, options = SUBCOMMANDS_[args.figure]
+
+    fingerprint = get_fingerprint(args, options)
+    if args.update and is_up_to_date(args.outfilename, fingerprint):
+        print(f"[INFO] {args.outfilename} is up to date.")
+        if args.verbose:
+            print(f"[INFO] Done in {(time.perf_counter()-t_start)*1000:.0f} ms.")
+        return
+
+    if SCRIPT_DIR_ not in sys.path:
+        sys.path.insert(0, SCRIPT_DIR_)
+
+    t_import = time.perf_counter()
+    module = importlib.import_module(module_name)
+    if args.verbose:
+        print(f"[INFO] Imported {module_name} in {(time.perf_counter()-t_import)*1000:.0f} ms.")
+
+    helpers = importlib.import_module("helpers")
+    try:
+        filters = helpers.make_filters(*[getattr(args, o) for o in FILTERS_])
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.stage_cache:
+        importlib.import_module("stage_cache").enable(args.stage_cache)
+    importlib.import_module("parallel").set_workers(args.workers)
+
+    metrics = importlib.import_module("metrics")
+    t_build = time.perf_counter()
+    with metrics.timer("figures_build_seconds", figure=args.figure):
+        module.main(args.infilename, args.outfilename, filters=filters, **{o: getattr(args, o) for o in options})
+    if args.verbose:
+        print(f"[INFO] Built {args.outfilename} in {(time.perf_counter()-t_build)*1000:.0f} ms.")
+        if args.stage_cache:
+            stats = importlib.import_module("stage_cache").get_active().stats
+            print(f"[INFO] Stage cache: {stats['hits']} hit(s), {stats['misses']} miss(es).")
+
+    writtenfilename = get_written_filename(args.outfilename)
+    if writtenfilename is not None:
+        write_stamp(args.outfilename, fingerprint, writtenfilename)
+
+    if args.metrics:
+        metrics.write(args.metrics, figure=args.figure)
+
+    if args.verbose:
+        print(f"[INFO] Done in {(time.perf_counter()-t_start)*1000:.0f} ms.")
+
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,194 @@
+"""
+Metrics of builds and serving: counters and histograms with labels, e.g. stage durations, explosions processed,
+traces and bytes written per output, requests served. All scripts record into one registry per process
+(worker processes send theirs back to the parent, see collect);
+--metrics FILE writes it at the end of a run, as json lines (appended, one line per metric and run, e.g. to
+graph builds over time) or, for .prom files, in the Prometheus text format (e.g. for the textfile collector of
+the node exporter). server.py serves the metrics of its process on /metrics for scraping.
+
+e.g.:  with metrics.timer("figures_stage_seconds", stage="load_events"):
+           df = ...
+       metrics.inc("figures_rows_total", len(df), stage="load_events")
+       metrics.write("build.metrics.jsonl", figure="year_bars")
+"""
+
+import contextlib
+import datetime
+import json
+import math
+import os
+import threading
+import time
+
+# Upper bounds of the histogram buckets [s]
+BUCKETS_ = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, math.inf)
+
+# Metric name -> help text (Prometheus # HELP)
+HELP_ = {
+    "figures_stage_seconds" : "Duration of pipeline stages (loading, deriving columns, aggregations, saving).",
+    "figures_rows_total" : "Explosions processed by pipeline stages.",
+    "figures_stage_cache_total" : "Stage cache lookups by result (hit, miss).",
+    "figures_build_seconds" : "Duration of figure builds (make_figures.py, batch.py, server.py).",
+    "figures_traces_total" : "Traces written per output file.",
+    "figures_written_bytes_total" : "Bytes written per output file.",
+    "figures_requests_total" : "Requests served by endpoint and status.",
+    "figures_request_seconds" : "Duration of requests by endpoint.",
+    "figures_response_bytes_total" : "Response bytes by endpoint.",
+    "figures_response_cache_total" : "Response cache lookups of the server by endpoint and result (hit, miss).",
+}
+
+
+class Registry:
+    """Thread-safe counters and histograms, keyed by name and labels."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        """Increases counter by value."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Records value in histogram (see BUCKETS_)."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            h = self.histograms.setdefault(key, {"buckets": [0] * len(BUCKETS_), "sum": 0.0, "count": 0})
+            for (i, le) in enumerate(BUCKETS_):
+                if value <= le:
+                    h["buckets"][i] += 1
+            h["sum"] += value
+            h["count"] += 1
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """Records duration of the context [s] in histogram."""
+        t_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t_start, **labels)
+
+    def clear(self):
+        """Removes all metrics."""
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def merge(self, samples):
+        """Adds metrics given as samples (see samples), e.g. recorded by a worker process (see collect)."""
+        with self._lock:
+            for s in samples:
+                key = (s["name"], tuple(sorted(s["labels"].items())))
+                if s["type"] == "counter":
+                    self.counters[key] = self.counters.get(key, 0) + s["value"]
+                    continue
+                h = self.histograms.setdefault(key, {"buckets": [0] * len(BUCKETS_), "sum": 0.0, "count": 0})
+                for (i, le) in enumerate(BUCKETS_):
+                    h["buckets"][i] += s["buckets"][format_bound(le)]
+                h["sum"] += s["sum"]
+                h["count"] += s["count"]
+
+    def samples(self):
+        """Metrics as list of dicts (name, type, labels and value, or count, sum and cumulative buckets), sorted."""
+        with self._lock:
+            samples = [{"name": name, "type": "counter", "labels": dict(labels), "value": value}
+                for ((name, labels), value) in self.counters.items()]
+            samples += [{"name": name, "type": "histogram", "labels": dict(labels), "count": h["count"], "sum": h["sum"],
+                    "buckets": {format_bound(le): n for (le, n) in zip(BUCKETS_, h["buckets"])}}
+                for ((name, labels), h) in self.histograms.items()]
+        return sorted(samples, key=lambda s: (s["name"], sorted(s["labels"].items())))
+
+    def to_prometheus(self):
+        """Metrics in the Prometheus text format (version 0.0.4)."""
+        lines = []
+        name = None
+        for s in self.samples():
+            if s["name"] != name:
+                name = s["name"]
+                if name in HELP_:
+                    lines += [f"# HELP {name} {HELP_[name]}"]
+                lines += [f"# TYPE {name} {s['type']}"]
+            if s["type"] == "counter":
+                lines += [f"{name}{format_labels(s['labels'])} {s['value']}"]
+                continue
+            for (le, n) in s["buckets"].items():
+                lines += [f"{name}_bucket{format_labels(dict(s['labels'], le=le))} {n}"]
+            lines += [f"{name}_sum{format_labels(s['labels'])} {s['sum']}",
+                f"{name}_count{format_labels(s['labels'])} {s['count']}"]
+        return "\n".join(lines) + "\n"
+
+    def write(self, filename, **context):
+        """Writes metrics: Prometheus text format for .prom files (replaced), otherwise json lines (appended).
+        Parameters
+        ---------
+            filename : str
+                output file (.prom or e.g. .jsonl)
+            context :
+                added to every json line (e.g. figure="year_bars"), with the time of writing
+        """
+        if filename.endswith(".prom"):
+            tmpfilename = f"{filename}.{os.getpid()}.tmp"
+            with open(tmpfilename, 'w') as f:
+                f.write(self.to_prometheus())
+            os.replace(tmpfilename, filename)
+        else:
+            now = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+            with open(filename, 'a') as f:
+                for s in self.samples():
+                    f.write(json.dumps(dict({"time": now}, **context, **s)) + "\n")
+        print(f"[INFO] Saved metrics as {filename}.")
+
+
+def format_bound(le):
+    """Bucket bound as Prometheus writes it (e.g. 0.5, +Inf)."""
+    return "+Inf" if math.isinf(le) else repr(le)
+
+
+def format_labels(labels):
+    """Labels as Prometheus text ({key="value",...}, empty if no labels)."""
+    if not labels:
+        return ""
+    escape = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escape(v)}"' for (k, v) in labels.items()) + "}"
+
+
+# Registry of this process
+REGISTRY_ = Registry()
+
+
+def inc(name, value=1, **labels):
+    """Increases counter of the process registry (see Registry.inc)."""
+    REGISTRY_.inc(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    """Records value in histogram of the process registry (see Registry.observe)."""
+    REGISTRY_.observe(name, value, **labels)
+
+
+def timer(name, **labels):
+    """Records duration of the context in histogram of the process registry (see Registry.timer)."""
+    return REGISTRY_.timer(name, **labels)
+
+
+def collect(func, *args, **kwargs):
+    """Runs func(*args, **kwargs) in a worker process and returns (result, samples of the metrics it recorded), to be
+    merged into the registry of the parent process (see merge); worker processes do not share the parent's registry.
+    """
+    REGISTRY_.clear()
+    result = func(*args, **kwargs)
+    return result, REGISTRY_.samples()
+
+
+def merge(samples):
+    """Adds samples (e.g. from collect in a worker process) to the process registry (see Registry.merge)."""
+    REGISTRY_.merge(samples)
+
+
+def write(filename, **context):
+    """Writes metrics of the process registry (see Registry.write)."""
+    REGISTRY_.write(filename, **context)
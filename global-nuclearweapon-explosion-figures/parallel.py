@@ -0,0 +1,102 @@
+"""
+Partitioned aggregation in worker processes, for large catalogs.
+
+The explosions are split into partitions that never share a group of the aggregation (by STATE, or by a hash
+of the coordinates, so every site falls into one partition), the aggregation runs on every partition in a
+worker process and the partial results are merged. Partitions keep the row order of the data, so merged
+results are the same as those of one pass over all explosions.
+
+Off by default (one worker); with --workers N (N > 1, 0 for the number of cpus), aggregations of more than
+MIN_ROWS_ explosions are partitioned.
+
+e.g.:  parallel.set_workers(4)
+       counts = parallel.map_partitions(count_per_site, df, by="coords", merge=merge_counts)
+"""
+
+import concurrent.futures
+import functools
+import os
+
+import numpy as np
+import pandas as pd
+
+import metrics
+
+# Number of worker processes (1: aggregations run in the calling process)
+WORKERS_ = 1
+
+# Below this number of explosions, aggregations are not partitioned (process start and pickling cost more)
+MIN_ROWS_ = 20000
+
+
+def set_workers(workers):
+    """Sets the number of worker processes for aggregations (0 or None for the number of cpus)."""
+    global WORKERS_
+    WORKERS_ = workers if workers else (os.cpu_count() or 1)
+
+
+def get_workers():
+    """Number of worker processes for aggregations."""
+    return WORKERS_
+
+
+def partition(df, by, n):
+    """Splits explosions into at most n partitions, in row order.
+    Parameters
+    ---------
+        df : pd.Dataframe
+            explosion data
+        by : str
+            "coords" to partition by a hash of LAT/LONG, otherwise a column (e.g. STATE) whose values are
+            distributed over the partitions by size (largest first)
+        n : int
+            number of partitions
+    Returns
+    -------
+    list of pd.Dataframe (non-empty)
+    """
+    if by == "coords":
+        labels = pd.util.hash_pandas_object(df[["LAT", "LONG"]], index=False).to_numpy() % n
+    else:
+        codes, _ = pd.factorize(df[by], use_na_sentinel=False)
+        sizes = np.bincount(codes)
+        load = np.zeros(n, dtype=np.int64)
+        bins = np.zeros(len(sizes), dtype=np.int64)
+        for code in np.argsort(-sizes, kind="stable"):
+            bins[code] = np.argmin(load)
+            load[bins[code]] += sizes[code]
+        labels = bins[codes]
+    return [df[labels == k] for k in range(n) if (labels == k).any()]
+
+
+def map_partitions(func, df, by, merge=None, args=()):
+    """Aggregates explosions with func in worker processes, one partition each (see partition), and merges the
+    partial results (and the metrics recorded by the workers). With one worker or at most MIN_ROWS_ explosions, func runs once on all explosions.
+    Parameters
+    ---------
+        func : function
+            aggregation func(df, *args) (module-level, so that it can be sent to the workers)
+        df : pd.Dataframe
+            explosion data
+        by : str
+            partition key (see partition); groups of func must not span its values
+        merge : function
+            merge(partial results, df) -> result; None to concatenate dataframes
+        args : tuple
+            further arguments of func
+    """
+    workers = get_workers()
+    if workers <= 1 or len(df) <= MIN_ROWS_:
+        return func(df, *args)
+
+    parts = partition(df, by, workers)
+    print(f"[INFO] Aggregating {len(df)} explosions in {len(parts)} partitions ({func.__name__}).")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(parts))) as executor:
+        outputs = list(executor.map(functools.partial(metrics.collect, func), parts, *[[a] * len(parts) for a in args]))
+    for (_, samples) in outputs:
+        metrics.merge(samples)
+    results = [result for (result, _) in outputs]
+
+    if merge is None:
+        return pd.concat(results, ignore_index=True)
+    return merge(results, df)
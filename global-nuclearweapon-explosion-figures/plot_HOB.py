@@ -3,16 +3,77 @@
 """
 Snippet to plot height of burst values over years. 
 
-Usage: plot_HOB.py [-h] -i INFILENAME -o OUTFILENAME
+Usage: plot_HOB.py [-h] -i INFILENAME -o OUTFILENAME [--compact] [--animate] [--max-points MAXPOINTS] [--patch] [--reproducible] [--content-hash] [--metrics METRICS] [--stage-cache STAGE_CACHE] [--state STATE] [--years YEARS] [--type TYPE] [--purpose PURPOSE]
 """
 
 import argparse
 import numpy as np
 import plotly.graph_objects as go
 
+import animation
+import figure_io
 import helpers
+import metrics
+import stage_cache
 
-def plot_HOB(fig, df):
+# Shown range of heights of burst [m]; explosions outside are outliers (never thinned out)
+HOB_RANGE_ = [-3200, 5000]
+
+# Above this number of explosions, the large-data mode (WebGL, thinning) is used
+MAX_POINTS_ = 20000
+
+
+def decimate(df, n_keep, n_bins=(100, 50), seed=0):
+    """Density-preserving thinning of HOB points: points are binned on a (DATETIME, HOB) grid and every bin keeps
+    the same fraction of its points (rounded by largest remainders, so exactly n_keep points are kept), so dense and
+    sparse areas keep their look. Outliers (HOB outside HOB_RANGE_, e.g. the shots at > 8000m) are always kept on top.
+    Parameters
+    ---------
+        df : pd.Dataframe
+            data with DATETIME and HOB
+        n_keep : int
+            number of points to keep (besides the outliers)
+        n_bins : tuple of int
+            number of bins along DATETIME and HOB
+        seed : int
+            seed for choosing points within a bin (fixed, so builds are reproducible)
+    Returns
+    -------
+    Dataframe with kept points (in original order).
+    """
+    hob = df.HOB.to_numpy(dtype=float)
+    outlier = ~((hob >= HOB_RANGE_[0]) & (hob <= HOB_RANGE_[1]))
+    n_inliers = len(df) - outlier.sum()
+    if n_inliers <= n_keep:
+        return df
+
+    t = df.DATETIME.to_numpy().astype("datetime64[s]").astype(np.int64)
+    t_bin = np.clip(((t - t.min()) / max(t.max() - t.min(), 1) * n_bins[0]).astype(int), 0, n_bins[0]-1)
+    h_bin = np.clip(((hob - HOB_RANGE_[0]) / (HOB_RANGE_[1] - HOB_RANGE_[0]) * n_bins[1]).astype(int), 0, n_bins[1]-1)
+    cell = np.where(outlier, -1, t_bin * n_bins[1] + h_bin)
+
+    # random order within each cell, then keep the first quota points of each cell
+    rng = np.random.default_rng(seed)
+    order = np.lexsort((rng.random(len(df)), cell))
+    cells_sorted = cell[order]
+    starts = np.flatnonzero(np.concatenate([[True], cells_sorted[1:] != cells_sorted[:-1]]))
+    counts = np.diff(np.concatenate([starts, [len(df)]]))
+    rank = np.arange(len(df)) - np.repeat(starts, counts)
+    # quota per cell: n_keep / n_inliers of its points, rounded down; the points left over go to the cells with the
+    # largest remainders, so the quotas add up to n_keep
+    inlier_cell = cells_sorted[starts] != -1
+    exact = counts * (n_keep / n_inliers)
+    quota = np.where(inlier_cell, np.floor(exact), 0).astype(int)
+    remainder = np.where(inlier_cell, exact - quota, -1)
+    quota[np.argsort(-remainder, kind="stable")[:n_keep - quota.sum()]] += 1
+    keep_sorted = (rank < np.repeat(quota, counts)) | (cells_sorted == -1)
+
+    keep = np.zeros(len(df), dtype=bool)
+    keep[order[keep_sorted]] = True
+    return df[keep]
+
+
+def plot_HOB(fig, df, max_points=None):
     """Makes HOB plot. 
     Parameters
     ---------
@@ -20,13 +81,25 @@ def plot_HOB(fig, df):
             figure to plot HOBs on
         df : pd.Dataframe
             data to use
+        max_points : int
+            if there are more explosions, WebGL scatter traces are used and the points of each state are 
+            thinned out (see decimate) to about max_points in total; None for no limit
     """
+    df = df[df.DATETIME.notna()]
+    large = max_points is not None and len(df) > max_points
+    n_thinned = 0
     
     for i, s in enumerate(np.unique(df.STATE)[::-1]): 
         df_s = df[df.STATE == s]
-        df_s = df_s[df_s.DATETIME.notna()]
 
-        scatter = go.Scatter(x=df_s.DATETIME, y=df_s.HOB, 
+        Scatter = go.Scatter
+        if large:
+            Scatter = go.Scattergl
+            n = len(df_s)
+            df_s = decimate(df_s, max(int(max_points * n / len(df)), 1))
+            n_thinned += n - len(df_s)
+
+        scatter = Scatter(x=df_s.DATETIME, y=df_s.HOB, 
         name = helpers.FIXEDLABELS_[s], 
         mode = "markers",
         hovertemplate =
@@ -49,22 +122,30 @@ def plot_HOB(fig, df):
             arrowhead=1, 
             axref="x", ayref="y")
 
+    if large:
+        fig.add_annotation(
+            x=0.01, y=0.01, xref="paper", yref="paper",
+            xanchor="left", yanchor="bottom",
+            text=f"{len(df)-n_thinned} of {len(df)} explosions shown ({n_thinned} thinned out, outliers kept)",
+            showarrow=False)
 
-def main(infilename, outfilename):
-    """Main. 
+
+def make_figure(df, max_points=MAX_POINTS_):
+    """Makes HOB figure. 
     Parameters
     ---------
-        infilename : str 
-            filename of pickled pd.Dataframe
-        outfilename : str
-            filename of pickled go.Figure
+        df : pd.Dataframe
+            data to use
+        max_points : int
+            above this number of explosions, points are thinned out and drawn with WebGL (None for no limit)
+    Returns
+    -------
+    go.Figure
     """
-    
-    df = helpers.load_pkl(infilename)
 
     fig = go.Figure()  
 
-    plot_HOB(fig, df)
+    plot_HOB(fig, df, max_points=max_points)
 
     fig.update_layout(
         modebar_remove=['lasso', 'select'], 
@@ -72,7 +153,7 @@ def main(infilename, outfilename):
         xaxis=dict(
             title=dict(text="Year")),
         yaxis=dict(
-            range=[-3200, 5000],
+            range=HOB_RANGE_,
             title=dict(text="Height of burst [m]"),
             ),        
         margin={"r":0,"t":0,"l":0,"b":0},
@@ -87,12 +168,76 @@ def main(infilename, outfilename):
         }
     )
 
-    if outfilename.find(".html") > -1:
-        fig.write_html(outfilename)
-    elif outfilename.find(".pkl") > -1:
-        helpers.save_pkl(fig, outfilename)
-    else: 
-        print("[ERROR] You can save the figure only as .html or .pkl file. ")
+    return fig
+
+
+def make_animated_figure(df, max_points=MAX_POINTS_):
+    """Makes HOB figure animated over years (year slider, play button). 
+    Parameters
+    ---------
+        df : pd.Dataframe
+            data to use
+        max_points : int
+            above this number of explosions, points are thinned out and drawn with WebGL (None for no limit)
+    Returns
+    -------
+    (go.Figure, post_script for the html)
+    """
+    import pandas as pd
+
+    fig = make_figure(df, max_points=max_points)
+
+    # fixed x range, so the axis does not jump while points are added
+    t = df.DATETIME.dropna()
+    fig.update_layout(
+        xaxis_type="date",
+        xaxis_range=[t.min() - pd.Timedelta(days=365), t.max() + pd.Timedelta(days=365)],
+        margin={"r":0,"t":0,"l":0,"b":60},
+        height=500+60,
+    )
+
+    trace_years = [pd.DatetimeIndex(trace.x).year for trace in fig.data]
+    post_script = animation.add_year_animation(fig, list(range(len(fig.data))), trace_years, ["x", "y", "text"])
+
+    return fig, post_script
+
+
+def main(infilename, outfilename, compact=False, animate=False, max_points=MAX_POINTS_, patch=False, reproducible=False, content_hash=False, filters=None):
+    """Main. 
+    Parameters
+    ---------
+        infilename : str 
+            filename of pickled pd.Dataframe
+        outfilename : str
+            filename of pickled go.Figure
+        compact : bool
+            if True, write typed arrays and pre-compressed variants (see figure_io.save_figure)
+        animate : bool
+            if True, the figure is animated over years (html only)
+        max_points : int
+            above this number of explosions, points are thinned out and drawn with WebGL (None or 0 for no limit)
+        patch : bool
+            if True, also write a patch from the previous build (see figure_io.write_figure_patch)
+        reproducible : bool
+            if True, the same figure is written as the same bytes (see figure_io.save_figure)
+        content_hash : bool
+            if True, output file names carry a hash of their content (see figure_io.add_content_hash)
+        filters : dict
+            only explosions selected by these filters are loaded (see helpers.load_events, helpers.make_filters)
+    """
+    
+    df = helpers.load_events(infilename, **(filters or {}))
+    if len(df) == 0:
+        print("[ERROR] No explosions match the filters. ")
+        return
+
+    post_script = None
+    if animate:
+        fig, post_script = make_animated_figure(df, max_points=max_points or None)
+    else:
+        fig = make_figure(df, max_points=max_points or None)
+
+    figure_io.save_figure(fig, outfilename, compact=compact, patch=patch, reproducible=reproducible, content_hash=content_hash, post_script=post_script)
 
 
 if __name__ == "__main__":
@@ -100,10 +245,28 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("-i", "--infilename", help="infilename", required=True)
     parser.add_argument("-o", "--outfilename", help="outfilename", required=True)
+    parser.add_argument("--compact", help="write numeric trace arrays as typed arrays (float32 where precision allows) and pre-compressed .gz/.br variants", action="store_true")
+    parser.add_argument("--patch", help="also write a patch from the previous build (json, applied to an open page with figure_patch.js)", action="store_true")
+    parser.add_argument("--reproducible", help="write the same bytes for the same figure (stable ids, sorted keys, rounded floats); unchanged files are not rewritten", action="store_true")
+    parser.add_argument("--content-hash", help="put a hash of the content into the output file names (implies --reproducible)", action="store_true")
+    parser.add_argument("--animate", help="html only: animate over years (year slider)", action="store_true")
+    parser.add_argument("--max-points", help=f"above this number of explosions, points are thinned out and drawn with WebGL (default {MAX_POINTS_}, 0 for no limit)", type=int, default=MAX_POINTS_)
+
+    parser.add_argument("--metrics", help="write build metrics (stage durations, rows, traces, bytes) to this file: .prom for Prometheus text, otherwise appended json lines", default=None)
+    parser.add_argument("--stage-cache", help="cache loaded, enriched and aggregated data in this directory (reused by later builds)", default=None)
 
+    helpers.add_filter_arguments(parser)
     args = parser.parse_args()
+    try:
+        filters = helpers.make_filters(args.state, args.years, args.type, args.purpose)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.stage_cache:
+        stage_cache.enable(args.stage_cache)
 
-    main(args.infilename, args.outfilename)
+    main(args.infilename, args.outfilename, compact=args.compact, animate=args.animate, max_points=args.max_points, patch=args.patch, reproducible=args.reproducible, content_hash=args.content_hash, filters=filters)
+    if args.metrics:
+        metrics.write(args.metrics, script=parser.prog)
 
 
 
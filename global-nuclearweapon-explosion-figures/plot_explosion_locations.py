@@ -3,7 +3,7 @@
 """
 Code snippet to plot nuclear explosions on map.
 
-usage: plot_explosion_locations.py [-h] -i INFILENAME -o OUTFILENAME
+usage: plot_explosion_locations.py [-h] -i INFILENAME -o OUTFILENAME [--compact] [--animate] [--near LAT,LON,KM] [--bbox LATMIN,LATMAX,LONMIN,LONMAX] [--search] [--tables {csv,parquet}] [--patch] [--reproducible] [--content-hash] [--workers WORKERS] [--metrics METRICS] [--stage-cache STAGE_CACHE] [--state STATE] [--years YEARS] [--type TYPE] [--purpose PURPOSE]
 """
 
 import argparse
@@ -13,19 +13,54 @@ import numpy as np
 
 import pandas as pd
 
+import animation
+import figure_io
 import helpers 
-
+import metrics
+import parallel
+import stage_cache
+import spatial_index
+import shot_index
+
+@helpers.memoize_on_frame()
+@helpers.cached_stage
 def make_location_frequency_df(df): 
-    """Makes dataframe with locations and frequency. 
+    """Makes dataframe with locations and frequency (memoized, see helpers.memoize_on_frame). 
+    Large catalogs are aggregated per partition of sites in worker processes (see parallel.map_partitions).
     Parameters
     ---------
         df : pd.Dataframe
-            Dataframe with list of locations. 
+            Dataframe with list of locations (not modified). 
     """
 
     print("[INFO] Creating explosion location dataframe... ")
 
-    df['coords'] = [ t for t in zip(df.LAT, df.LONG) ]
+    dff = parallel.map_partitions(aggregate_locations, df, by="coords", merge=merge_locations)
+
+    print("[INFO] ... Done!")
+
+    return dff
+
+
+def merge_locations(parts, df):
+    """Merges location dataframes of partitions of df (see aggregate_locations) in the order of one pass over df."""
+    dff = pd.concat(parts, ignore_index=True)
+    # NaN coordinates are equal in value_counts, but not in dict lookups
+    key = lambda coord: tuple("nan" if np.isnan(x) else x for x in coord)
+    row = {key(coord): i for (i, coord) in enumerate(dff.coords)}
+    order = pd.Series([ t for t in zip(df.LAT, df.LONG) ]).value_counts().index
+    return dff.iloc[[row[key(coord)] for coord in order]].reset_index(drop=True)
+
+
+def aggregate_locations(df):
+    """Makes dataframe with locations and frequency (see make_location_frequency_df), most frequent first.
+    Parameters
+    ---------
+        df : pd.Dataframe
+            Dataframe with list of locations (not modified). 
+    """
+
+    df = df.assign(coords=[ t for t in zip(df.LAT, df.LONG) ])
 
     dff = pd.DataFrame(df['coords'].value_counts())
     dff = dff.rename_axis('coords').reset_index()
@@ -72,8 +107,6 @@ def make_location_frequency_df(df):
             p = helpers.PURPOSELABEL_[df_at_coord["PUR"].iloc[0]]
         dff.loc[dff['coords']==coord, "PUR"] = p
 
-    print("[INFO] ... Done!")
-
     return dff         
 
 
@@ -168,19 +201,22 @@ def draw_scatter(fig, df, mode="STATE", visible=True):
     )
 
 
-def main(infilename, outfilename):
-    """Main. 
+def make_figure(df, tables=None):
+    """Makes explosion location map. 
     Parameters
     ---------
-        infilename : str 
-            filename of pickled pd.Dataframe with explosion locations
-        outfilename : str
-            filename for pickled go.Figure
+        df : pd.Dataframe
+            explosion data
+        tables : dict
+            if given, the location frequency table is added as "location_frequency" (see figure_io.write_tables)
+    Returns
+    -------
+    go.Figure
     """
 
-    df = helpers.load_pkl(infilename)
-    
     dff = make_location_frequency_df(df)
+    if tables is not None:
+        tables["location_frequency"] = dff.drop(columns="coords").set_index(["LAT", "LONG"])
 
     fig = go.Figure()
 
@@ -214,12 +250,134 @@ def main(infilename, outfilename):
             map_dict
     )
 
-    if outfilename.find(".html") > -1:
-        fig.write_html(outfilename)
-    elif outfilename.find(".pkl") > -1:
-        helpers.save_pkl(fig, outfilename)
-    else: 
-        print("[ERROR] You can save the figure only as .html or .pkl file. ")
+    return fig
+
+
+def make_event_df(df):
+    """Makes dataframe with one row per explosion in the format of make_location_frequency_df (COUNT=1). 
+    Parameters
+    ---------
+        df : pd.Dataframe
+            explosion data
+    """
+    df = df[df.LAT.notna() & df.LONG.notna() & df.YEAR.notna()]
+
+    dfe = pd.DataFrame({
+        "LAT" : df.LAT, 
+        "LONG" : df.LONG,
+        "STATE" : df.STATE,
+        "COUNT" : 1,
+        "SHOTNAME" : [x if type(x) is str else "n/a" for x in df.SHOTNAME],
+        "YIELD" : [helpers.make_range_string([y]) for y in df.YIELD],
+        "YEAR" : [f"{t:%Y-%m-%d}" if not pd.isnull(t) else f"{y:.0f}" for (t, y) in zip(df.DATETIME, df.YEAR)],
+        "TYPE" : [helpers.TYPESLABEL_[helpers.get_part_before_hyphen(t)] for t in df.TYPE],
+        "DELIVERY" : [helpers.DELIVERYLABEL_[helpers.get_part_after_hyphen(t)] for t in df.TYPE],
+        "PUR" : ["n/a" if (type(p) is float and np.isnan(p)) else helpers.PURPOSELABEL_[p] for p in df.PUR],
+        "YEAR_NUM" : df.YEAR.astype(int),
+    })
+    return dfe
+
+
+def make_animated_figure(df):
+    """Makes explosion location map animated over years (year slider, play button). 
+    Parameters
+    ---------
+        df : pd.Dataframe
+            explosion data
+    Returns
+    -------
+    (go.Figure, post_script for the html)
+    """
+    dfe = make_event_df(df)
+
+    fig = go.Figure()
+
+    draw_density(fig, dfe)
+    draw_scatter(fig, dfe)
+
+    fig.update_layout(
+        map_style = 'open-street-map', 
+        modebar_remove=['lasso', 'select'], 
+        map_zoom = 0,
+        margin={"r":0,"t":0,"l":0,"b":60},
+        height=745+60, 
+        width=16*55 # 16/em; 55em = fit for website
+    )
+    fig.update_maps(
+        bounds={"north" : 85, "south" : -75, "east" : 180, "west" : -179},
+        center={'lat' : 20, 'lon' : 0},
+    )
+
+    # density trace first, then one scatter trace per state (order of draw_scatter)
+    trace_years = [dfe.YEAR_NUM] + [dfe[dfe.STATE == s].YEAR_NUM for s in dfe.STATE.unique()]
+    post_script = animation.add_year_animation(fig, list(range(len(fig.data))), trace_years, ["lat", "lon", "text"])
+
+    return fig, post_script
+
+
+def main(infilename, outfilename, compact=False, animate=False, near=None, bbox=None, search=False, tables=None, patch=False, reproducible=False, content_hash=False, filters=None):
+    """Main. 
+    Parameters
+    ---------
+        infilename : str 
+            filename of pickled pd.Dataframe with explosion locations
+        outfilename : str
+            filename for pickled go.Figure
+        compact : bool
+            if True, write typed arrays and pre-compressed variants (see figure_io.save_figure)
+        animate : bool
+            if True, the map is animated over years (html only)
+        near : tuple
+            (lat, lon, radius_km): only explosions within radius_km of the site
+        bbox : tuple
+            (lat_min, lat_max, lon_min, lon_max): only explosions inside the map viewport
+        search : bool
+            if True, the html map gets a search box for shot names (see shot_index.make_search_script)
+        tables : str
+            if "csv" or "parquet", the location frequency table is written next to the figure
+        patch : bool
+            if True, also write a patch from the previous build (see figure_io.write_figure_patch)
+        reproducible : bool
+            if True, the same figure is written as the same bytes (see figure_io.save_figure)
+        content_hash : bool
+            if True, output file names carry a hash of their content (see figure_io.add_content_hash)
+        filters : dict
+            only explosions selected by these filters are loaded (see helpers.load_events, helpers.make_filters)
+    """
+
+    df = helpers.load_events(infilename, **(filters or {}))
+    if len(df) == 0:
+        print("[ERROR] No explosions match the filters. ")
+        return
+
+    if near is not None or bbox is not None:
+        n = len(df)
+        df = spatial_index.select_events(df, near=near, bbox=bbox)
+        print(f"[INFO] Selected {len(df)} of {n} explosions.")
+        if len(df) == 0:
+            print("[ERROR] No explosions in the selected area. ")
+            return
+
+    post_script = None
+    aggregates = {}
+    if animate:
+        fig, post_script = make_animated_figure(df)
+    else:
+        fig = make_figure(df, tables=aggregates)
+
+    if search:
+        if outfilename.find(".html") > -1:
+            search_script = shot_index.make_search_script(shot_index.ShotIndex.from_df(df))
+            post_script = "\n".join([s for s in [post_script, search_script] if s])
+        else:
+            print("[WARNING] The shot name search is only added to .html files. ")
+
+    figure_io.save_figure(fig, outfilename, compact=compact, patch=patch, reproducible=reproducible, content_hash=content_hash, post_script=post_script)
+
+    if tables:
+        if animate:
+            aggregates["location_frequency"] = make_location_frequency_df(df).drop(columns="coords").set_index(["LAT", "LONG"])
+        figure_io.write_tables(aggregates, outfilename, fmt=tables)
 
 
 if __name__ == "__main__":
@@ -227,10 +385,34 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("-i", "--infilename", help="infilename", required=True)
     parser.add_argument("-o", "--outfilename", help="outfilename", required=True)
-
+    parser.add_argument("--compact", help="write numeric trace arrays as typed arrays (float32 where precision allows) and pre-compressed .gz/.br variants", action="store_true")
+    parser.add_argument("--patch", help="also write a patch from the previous build (json, applied to an open page with figure_patch.js)", action="store_true")
+    parser.add_argument("--reproducible", help="write the same bytes for the same figure (stable ids, sorted keys, rounded floats); unchanged files are not rewritten", action="store_true")
+    parser.add_argument("--content-hash", help="put a hash of the content into the output file names (implies --reproducible)", action="store_true")
+    parser.add_argument("--animate", help="html only: animate map over years (year slider)", action="store_true")
+    parser.add_argument("--near", help="only explosions within KM kilometers of the site LAT,LON", type=spatial_index.parse_near, metavar="LAT,LON,KM")
+    parser.add_argument("--bbox", help="only explosions inside the viewport (LONMIN > LONMAX crosses the date line)", type=spatial_index.parse_bbox, metavar="LATMIN,LATMAX,LONMIN,LONMAX")
+    parser.add_argument("--search", help="html only: add a search box for shot names (prefix, case-insensitive) that zooms to the shot", action="store_true")
+
+    parser.add_argument("--tables", help="also write the aggregate tables next to the figure", choices=["csv", "parquet"], default=None)
+
+    parser.add_argument("--workers", help="aggregate large catalogs in this many worker processes (0: number of cpus)", type=int, default=1)
+    parser.add_argument("--metrics", help="write build metrics (stage durations, rows, traces, bytes) to this file: .prom for Prometheus text, otherwise appended json lines", default=None)
+    parser.add_argument("--stage-cache", help="cache loaded, enriched and aggregated data in this directory (reused by later builds)", default=None)
+
+    helpers.add_filter_arguments(parser)
     args = parser.parse_args()
-
-    main(args.infilename, args.outfilename)
+    try:
+        filters = helpers.make_filters(args.state, args.years, args.type, args.purpose)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.stage_cache:
+        stage_cache.enable(args.stage_cache)
+    parallel.set_workers(args.workers)
+
+    main(args.infilename, args.outfilename, compact=args.compact, animate=args.animate, near=args.near, bbox=args.bbox, search=args.search, tables=args.tables, patch=args.patch, reproducible=args.reproducible, content_hash=args.content_hash, filters=filters)
+    if args.metrics:
+        metrics.write(args.metrics, script=parser.prog)
 
 
 
@@ -4,18 +4,40 @@
 Snippet to make overview pie charts with basic info on nuclear weapon explosions 
 (conducted state, region, type, purpose, and yield)
 
-usage: plot_pies.py [-h] -i INFILENAME -o OUTFILENAME
+usage: plot_pies.py [-h] -i INFILENAME -o OUTFILENAME [--compact] [--tables {csv,parquet}] [--patch] [--reproducible] [--content-hash] [--metrics METRICS] [--stage-cache STAGE_CACHE] [--state STATE] [--years YEARS] [--type TYPE] [--purpose PURPOSE]
 """
 
 import argparse
+import pandas as pd
 import plotly.graph_objects as go
+from plotly.colors import qualitative
 from plotly.subplots import make_subplots
 
+import figure_io
 import helpers
+import metrics
+import stage_cache
 
 YIELD_BINS_ = [0.01, 1, 10, 50, 100, 1000, 10000]
 
-def make_pie(df, slice="STATE"):
+@helpers.memoize_on_frame()
+@helpers.cached_stage
+def make_slice_counts(df, slice="STATE"):
+    """Number of explosions per value of a column (memoized, see helpers.memoize_on_frame).
+    Parameters
+    ---------
+        df : pd.Dataframe
+            data to use
+        slice : str 
+            dataframe column
+    Returns
+    -------
+    pd.Series value -> number
+    """
+    return df[slice].value_counts(sort=False)
+
+
+def make_pie(df, slice="STATE", tables=None):
     """Plot pie.
     Parameters
     ---------
@@ -23,36 +45,42 @@ def make_pie(df, slice="STATE"):
             data to use
         slice : str 
             what dataframe column to use for pie chart 
+        tables : dict
+            if given, the slice counts are added as "pie_<slice>" (see figure_io.write_tables)
     """
-    values = []
+    counts = make_slice_counts(df, slice)
     labels = df[slice].unique()
 
-    values = [len(df[df[slice]==x]) for x in labels]
+    values = [int(counts.get(x, 0)) for x in labels]
+    keys = list(labels)
     sort = True
 
-    import plotly.express as px
-    colors = px.colors.qualitative.Pastel2
+    colors = qualitative.Pastel2
 
     if slice=="STATE":
         colors = [helpers.COLORS_[x] for x in labels]
         labels = [helpers.FIXEDLABELS_[x] for x in labels]
     elif slice=="PUR_SHORT": 
         labels = [helpers.PURPOSELABEL_[x] if x not in ["other", "n/a"] else x for x in labels ]
-        colors = px.colors.qualitative.Antique
+        colors = qualitative.Antique
     elif slice=="REGION": 
-        colors = [helpers.REGIONCOLORS_[x] for x in labels]
+        colors = [helpers.REGIONCOLORS_.get(x, 'lightgrey') for x in labels]
     elif slice=="TYPE_SHORT": 
         colors = [helpers.TYPECOLORS_[x] for x in labels] 
         labels = [helpers.TYPESLABEL_[x] for x in labels]
     elif slice =="YIELD_CAT":
         color_dict = helpers.make_yield_color_dict()
         labels = list(color_dict.keys())[::-1]
-        values = [len(df[df[slice]==x]) for x in labels]
+        values = [int(counts.get(x, 0)) for x in labels]
+        keys = labels
         colors = [color_dict[x] for x in labels]
         sort = False
     else: 
         pass
 
+    if tables is not None:
+        tables[f"pie_{slice}"] = pd.DataFrame({slice: keys, "COUNT": values}).set_index(slice)
+
     t = go.Pie(
         values=values, 
         labels=labels, 
@@ -83,23 +111,22 @@ def set_layout(fig):
     )
 
 
-def main(infilename, outfilename):
-    """Main. 
+def make_figure(df, tables=None):
+    """Makes overview pie charts. 
     Parameters
     ---------
-        infilename : str 
-            filename of pickled pd.Dataframe
-        outfilename : str
-            filename of pickled go.Figure or html
+        df : pd.Dataframe
+            data to use
+        tables : dict
+            if given, the slice counts of every pie are added (see figure_io.write_tables)
+    Returns
+    -------
+    go.Figure
     """
 
     ### Prepare dataframe
     ### -----------------
-    df = helpers.load_pkl(infilename)
-
-    df["TYPE_SHORT"] = df["TYPE"].apply(lambda x: helpers.get_explosion_type(x))
-    df["PUR_SHORT"] = df["PUR"].apply(lambda x: helpers.get_explosion_purpose(x))
-    df["YIELD_CAT"] = df["YIELD"].apply(lambda x: helpers.get_yield_range_str(x, bins=YIELD_BINS_))
+    df = helpers.add_derived_columns(df, yield_bins=YIELD_BINS_)
 
     ### Make figure
     ### -----------
@@ -128,21 +155,51 @@ def main(infilename, outfilename):
     pos = [(1,1), (1,3), (1,5), (2,2), (2,4)]
 
     for i, var in enumerate(plot_vars):
-        t = make_pie(df, slice=var)
+        t = make_pie(df, slice=var, tables=tables)
         fig.add_trace(t, row=pos[i][0], col=pos[i][1])
 
     fig.update_layout(annotations=annot)
     set_layout(fig)
 
+    return fig
+
+
+def main(infilename, outfilename, compact=False, tables=None, patch=False, reproducible=False, content_hash=False, filters=None):
+    """Main. 
+    Parameters
+    ---------
+        infilename : str 
+            filename of pickled pd.Dataframe
+        outfilename : str
+            filename of pickled go.Figure or html
+        compact : bool
+            if True, write typed arrays and pre-compressed variants (see figure_io.save_figure)
+        tables : str
+            if "csv" or "parquet", the pie slice counts are written next to the figure
+        patch : bool
+            if True, also write a patch from the previous build (see figure_io.write_figure_patch)
+        reproducible : bool
+            if True, the same figure is written as the same bytes (see figure_io.save_figure)
+        content_hash : bool
+            if True, output file names carry a hash of their content (see figure_io.add_content_hash)
+        filters : dict
+            only explosions selected by these filters are loaded (see helpers.load_events, helpers.make_filters)
+    """
+
+    df = helpers.load_events(infilename, **(filters or {}))
+    if len(df) == 0:
+        print("[ERROR] No explosions match the filters. ")
+        return
+
+    aggregates = {}
+    fig = make_figure(df, tables=aggregates)
+
     ### Save output
     ### -----------
 
-    if outfilename.find(".html") > -1:
-        fig.write_html(outfilename)
-    elif outfilename.find(".pkl") > -1:
-        helpers.save_pkl(fig, outfilename)
-    else: 
-        print("[ERROR] You can save the figure only as .html or .pkl file. ")
+    figure_io.save_figure(fig, outfilename, compact=compact, patch=patch, reproducible=reproducible, content_hash=content_hash)
+    if tables:
+        figure_io.write_tables(aggregates, outfilename, fmt=tables)
 
 
 if __name__ == "__main__":
@@ -150,10 +207,28 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("-i", "--infilename", help="infilename", required=True)
     parser.add_argument("-o", "--outfilename", help="outfilename", required=True)
+    parser.add_argument("--compact", help="write numeric trace arrays as typed arrays (float32 where precision allows) and pre-compressed .gz/.br variants", action="store_true")
+    parser.add_argument("--patch", help="also write a patch from the previous build (json, applied to an open page with figure_patch.js)", action="store_true")
+    parser.add_argument("--reproducible", help="write the same bytes for the same figure (stable ids, sorted keys, rounded floats); unchanged files are not rewritten", action="store_true")
+    parser.add_argument("--content-hash", help="put a hash of the content into the output file names (implies --reproducible)", action="store_true")
 
-    args = parser.parse_args()
+    parser.add_argument("--tables", help="also write the aggregate tables next to the figure", choices=["csv", "parquet"], default=None)
 
-    main(args.infilename, args.outfilename)
+    parser.add_argument("--metrics", help="write build metrics (stage durations, rows, traces, bytes) to this file: .prom for Prometheus text, otherwise appended json lines", default=None)
+    parser.add_argument("--stage-cache", help="cache loaded, enriched and aggregated data in this directory (reused by later builds)", default=None)
+
+    helpers.add_filter_arguments(parser)
+    args = parser.parse_args()
+    try:
+        filters = helpers.make_filters(args.state, args.years, args.type, args.purpose)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.stage_cache:
+        stage_cache.enable(args.stage_cache)
+
+    main(args.infilename, args.outfilename, compact=args.compact, tables=args.tables, patch=args.patch, reproducible=args.reproducible, content_hash=args.content_hash, filters=filters)
+    if args.metrics:
+        metrics.write(args.metrics, script=parser.prog)
 
 
 
@@ -3,7 +3,7 @@
 """
 Snippet to plot pie charts of explosion numbers and integrated yield in different world regions.
 
-usage: plot_region_piechart_map.py [-h] -i INFILENAME -o OUTFILENAME -j COUNTRYREGIONJSON
+usage: plot_region_piechart_map.py [-h] -i INFILENAME -o OUTFILENAME [-j COUNTRYREGIONJSON] [--lazy-modes] [--compact] [--single-choropleth] [--tables {csv,parquet}] [--patch] [--reproducible] [--content-hash] [--workers WORKERS] [--metrics METRICS] [--stage-cache STAGE_CACHE] [--state STATE] [--years YEARS] [--type TYPE] [--purpose PURPOSE]
 """
 
 import plotly.graph_objects as go
@@ -14,41 +14,40 @@ import numpy as np
 import argparse
 import os.path
 
+import figure_io
 import helpers
+import metrics
+import parallel
+import stage_cache
+import region_lookup
+from trace_groups import TraceGroups
+
+MODE_LABEL_DICT_ = {
+    "number": "Number of explosions", 
+    "yield": "Cumulative yield", 
+    "yield_A" : "Cumulative yield (only atmospheric)", 
+    # "yield_UG" : "Yield underground/-water"
+    }
+
+# Shown map area [deg] and figure size [px] (see update_layout), to place pies of regions without a fixed position
+MAP_LON_RANGE_ = [-140, 210]
+MAP_LAT_RANGE_ = [-90, 90]
+FIGURE_SIZE_ = (16*55, 600) # 16/em; 55em = fit for website
 
 
-def get_region_dict(jsonfile, key="cc"): 
-    """Take data from json file to get map for states, country codes, and UN geoscheme regions. 
+def get_region_dict(jsonfile=None, key="cc"): 
+    """Take data from the region lookup to get map for states, country codes, and UN geoscheme regions. 
     Parameters
     ---------
         key : str 
             "cc", to get dict that maps country code to region; "region", to get dict that maps region name to list of states in that region.
         jsonfile : str
-            filename for json file countainig the data
+            filename for compiled lookup or ISO-3166 json file countainig the data; None for the lookup shipped with the project
     """
-    import json
-    with open(jsonfile, 'rb') as f:
-        jsonfile = json.load(f)
-
-    region_dict = {}
-
-    for j in jsonfile:
-        cc = j['alpha-2']
-        region = j['sub-region']
-        name = j['name']
+    return region_lookup.load_region_lookup(jsonfile)[key]
 
-        if key=='cc':
-            region_dict[cc] = region
-        elif key=='region':
-            if region not in region_dict:
-                region_dict[region] = [name]
-            else: 
-                region_dict[region] += [name]
 
-    return region_dict
-
-
-def plot_regions(fig, df, jsonfile):
+def plot_regions(fig, df, jsonfile, single_trace=False):
     """Highlight (outline, fill color) states belonging to the regions appearing in the dataframe.
     Parameters
     ---------
@@ -57,14 +56,21 @@ def plot_regions(fig, df, jsonfile):
         df : pd.DataFrame
             dataframe with regions that are plotted 
         jsonfile: str
-            json file to create list of states that belong to region
+            json file to create list of states that belong to region (None for shipped lookup)
+        single_trace: bool
+            if True, all regions are drawn with one choropleth trace (fewer traces, faster map rendering)
     """
+    regions = [x for x in pd.unique(df["REGION"]) if x.find("Ocean")==-1]
+
+    if single_trace:
+        plot_regions_single_trace(fig, regions, jsonfile, colors="lightgray", bordercolor="gray")
+        return
 
-    for i, region in enumerate([x for x in pd.unique(df["REGION"]) if x.find("Ocean")==-1]):
+    for i, region in enumerate(regions):
         plot_region(fig, region, jsonfile, color = "lightgray", bordercolor="gray")
 
 
-def plot_region(fig, region, jsonfile, color="lightblue", bordercolor="black"):
+def plot_region(fig, region, jsonfile=None, color="lightblue", bordercolor="black"):
     """Highlight (outline, fill color) states belonging to a region. 
     Parameters
     ---------
@@ -73,7 +79,7 @@ def plot_region(fig, region, jsonfile, color="lightblue", bordercolor="black"):
         region : str
             name of region to draw
         jsonfile: str
-            json file to create list of states that belong to region
+            json file to create list of states that belong to region (None for shipped lookup)
         color: str
             fill color of state
         bordercolor: str
@@ -100,6 +106,67 @@ def plot_region(fig, region, jsonfile, color="lightblue", bordercolor="black"):
         print(f"[WARNING] Skipping {region}. ")
 
 
+def plot_regions_single_trace(fig, regions, jsonfile=None, colors="lightblue", bordercolor="black"):
+    """Highlight (outline, fill color) states belonging to several regions with one choropleth trace 
+    (z is the index of the region of each state, the hover label names the region). 
+    Parameters
+    ---------
+        fig : go.Figure 
+            figure to plot regions on
+        regions : list of str
+            names of regions to draw
+        jsonfile: str
+            json file to create list of states that belong to region (None for shipped lookup)
+        colors: str or dict
+            fill color of states, or dict mapping region to fill color
+        bordercolor: str
+            color of line around state
+    """
+    region_dict = get_region_dict(jsonfile, key="region")
+
+    for region in regions:
+        if region not in region_dict:
+            print(f"[WARNING] Skipping {region}. ")
+    regions = [r for r in regions if r in region_dict]
+    if len(regions) == 0:
+        return
+
+    if type(colors) is str:
+        colors = {r: colors for r in regions}
+
+    locations = []
+    z = []
+    text = []
+    for i, region in enumerate(regions):
+        locations += region_dict[region]
+        z += [i for _ in region_dict[region]]
+        text += [region for _ in region_dict[region]]
+
+    # Discrete colorscale: region i gets colors[regions[i]] (a single region fills the whole scale)
+    n = max(len(regions) - 1, 1)
+    colorscale = []
+    for i, region in enumerate(regions):
+        colorscale += [[max(i-0.5, 0)/n, colors[region]], [min(i+0.5, n)/n, colors[region]]]
+    colorscale[-1][0] = 1
+
+    fig.add_trace(go.Choropleth(
+            locationmode = 'country names',
+            locations = locations,
+            z = z,
+            zmin = 0,
+            zmax = n,
+            text = text,
+            colorscale = colorscale,
+            showscale = False,
+            name = "regions",
+            geo = 'geo1',
+            marker={"line":{"width":1, "color":bordercolor}},
+            legend = "legend3",
+            visible = True,
+            hovertemplate = '%{location}<extra>%{text}</extra>',
+        )
+    )
+
 
 def add_pie_legend(fig, mode, visible, f):
     """Adds pie radius legend to the figure (via dummy pie charts)
@@ -148,7 +215,84 @@ def add_pie_legend(fig, mode, visible, f):
     return fig
 
 
-def plot_explosion_pies(fig, df, mode = "yield", visible=True):
+@helpers.memoize_on_frame()
+@helpers.cached_stage
+def make_region_state_values(df, mode="yield"):
+    """Values of the region pie charts (memoized, see helpers.memoize_on_frame): number of explosions or summarized yield [MT]
+    of every state in every region. Regions are sorted by number of explosions, so that smaller pies are drawn on top.
+    Large catalogs are aggregated per partition of states in worker processes (see parallel.map_partitions).
+    Parameters
+    ---------
+        df : pd.DataFrame
+            explosion data
+        mode: str
+            "number" for number of explosions, "yield" for summarized yield 
+    Returns
+    -------
+    pd.DataFrame with columns REGION, STATE, VALUE (in drawing order)
+    """
+    return parallel.map_partitions(aggregate_region_states, df, by="STATE", merge=merge_region_states, args=(mode,))
+
+
+def get_region_order(df):
+    """Regions sorted by number of explosions, largest first."""
+    regions = df["REGION"].unique()
+    # Sort list of regions by value to avoid the smaller pies hidden by the larger ones.
+    N = [ len(df[(df.REGION==r)]) for (r) in regions ]
+    return helpers.sort_list_by_score(regions, N)
+
+
+def merge_region_states(parts, df):
+    """Merges region pie values of partitions of df (see aggregate_region_states) in the drawing order of all of df,
+    with the column types of the partition results (as without partitions)."""
+    order = pd.DataFrame({"REGION": get_region_order(df)}).merge(df[["REGION", "STATE"]].drop_duplicates(), on="REGION")
+    return order.merge(pd.concat(parts, ignore_index=True), on=["REGION", "STATE"]).astype(parts[0].dtypes.to_dict())
+
+
+def aggregate_region_states(df, mode="yield"):
+    """Values of the region pie charts (see make_region_state_values).
+    Parameters
+    ---------
+        df : pd.DataFrame
+            explosion data
+        mode: str
+            "number" for number of explosions, "yield" for summarized yield 
+    Returns
+    -------
+    pd.DataFrame with columns REGION, STATE, VALUE (in drawing order)
+    """
+    regions = get_region_order(df)
+
+    rows = []
+    for region in regions:
+        df_r = df[df.REGION == region]
+        for s in df_r.STATE.unique():
+            if mode.find("yield") > -1:
+                rows += [(region, s, df_r[df_r.STATE==s]["YIELD"].sum()/1000)] #mt
+            elif mode.find("number") > -1:
+                rows += [(region, s, len(df_r[df_r.STATE == s]))]
+
+    return pd.DataFrame(rows, columns=["REGION", "STATE", "VALUE"])
+
+
+def get_map_position(lat, lon):
+    """Figure fractions (x, y) of a map coordinate: the equirectangular map (see update_layout) fills the figure
+    width and is centered vertically.
+    Parameters
+    ---------
+        lat, lon : float
+            coordinate [deg]
+    """
+    width, height = FIGURE_SIZE_
+    px_per_deg = width / (MAP_LON_RANGE_[1] - MAP_LON_RANGE_[0])
+    if lon < MAP_LON_RANGE_[0]:
+        lon += 360
+    y_offset = (height - px_per_deg * (MAP_LAT_RANGE_[1] - MAP_LAT_RANGE_[0])) / 2
+    return ((lon - MAP_LON_RANGE_[0]) / (MAP_LON_RANGE_[1] - MAP_LON_RANGE_[0]), 
+        (y_offset + px_per_deg * (lat - MAP_LAT_RANGE_[0])) / height)
+
+
+def plot_explosion_pies(fig, df, mode = "yield", visible=True, tables=None):
     """Plots the pie chart for the chosen mode. Hacks go.Pie into map (position is given by figure fractions, size indicates total values)
     ---------
         fig : go.Figure
@@ -159,6 +303,8 @@ def plot_explosion_pies(fig, df, mode = "yield", visible=True):
             "number" for number of explosions, "yield" for summarized yield 
         visible: Bool
             whether legend is visible per default (can be switched via buttons)
+        tables : dict
+            if given, the pie values are added as region x state pivot "region_state_<mode>" (see figure_io.write_tables)
     """
 
     # Locations can only be set relative to figure (incl. random margins) bounds; set by hand.
@@ -179,34 +325,34 @@ def plot_explosion_pies(fig, df, mode = "yield", visible=True):
         }
     fig.update_geos(projection=dict(type="equirectangular"))
 
-    regions = df["REGION"].unique()
-    # Sort list of regions by value to avoid the smaller pies hidden by the larger ones.
-    N = [ len(df[(df.REGION==r)]) for (r) in regions ]
-    regions = helpers.sort_list_by_score(regions, N)
+    # Factor to scale values to radius of pie chart. 
+    f_radius = 1
+    hovertemplate = ''
+    if mode.find("yield") > -1:
+        f_radius = 0.00026*1000**(1/2)
+        hovertemplate = '%{label}: <br> %{value:.3f} MT'
+    elif mode.find("number") > -1:
+        f_radius = 0.004
+        hovertemplate = '%{label}: <br> N = %{value}'
+    else: 
+        print("[WARNING] You need to specify the mode! (either 'yield' or 'number')!")
 
-    for i, region in enumerate(regions):
-        df_r = df[df.REGION == region]
-        states = []
-        values = []
-        # Factor to scale values to radius of pie chart. 
-        f_radius = 1
-        hovertemplate = ''
-        for s in df_r.STATE.unique():
-            states += [s]
-            if mode.find("yield") > -1:
-                values += [df_r[df_r.STATE==s]["YIELD"].sum()/1000] #mt
-                f_radius = 0.00026*1000**(1/2)
-                hovertemplate = '%{label}: <br> %{value:.3f} MT'
-            elif mode.find("number") > -1:
-                values += [len(df_r[df_r.STATE == s])]
-                f_radius = 0.004
-                hovertemplate = '%{label}: <br> N = %{value}'
-            else: 
-                print("[WARNING] You need to specify the mode! (either 'yield' or 'number')!")
+    region_state_values = make_region_state_values(df, mode)
+
+    for i, (region, df_v) in enumerate(region_state_values.groupby("REGION", sort=False)):
+        states = df_v.STATE.tolist()
+        values = df_v.VALUE.tolist()
 
         R = np.sum(values)**(1/2)*f_radius
 
-        (x,y) = REGION_CENTRA_xy[region]
+        if region in REGION_CENTRA_xy:
+            (x,y) = REGION_CENTRA_xy[region]
+        else:
+            # e.g. regions assigned by region_assign.py: pie at the mean position of the explosions
+            df_r = df[df.REGION == region]
+            (x,y) = get_map_position(df_r.LAT.mean(), df_r.LONG.mean())
+        # pie domains must stay inside the figure
+        (x,y) = (min(max(x, R), 1-R), min(max(y, R), 1-R))
 
         pie = go.Pie(
             labels=[helpers.FIXEDLABELS_[s] for s in states], 
@@ -229,6 +375,10 @@ def plot_explosion_pies(fig, df, mode = "yield", visible=True):
             )
         fig.add_trace(pie)
 
+    if tables is not None:
+        table = region_state_values.pivot(index="REGION", columns="STATE", values="VALUE").fillna(0)
+        tables[f"region_state_{mode}"] = table.astype(int) if mode == "number" else table
+
     add_pie_legend(fig, mode=mode, visible=visible, f=f_radius)
     return fig
 
@@ -257,8 +407,8 @@ def update_layout(fig):
         dragmode=False,
         modebar_remove=['lasso', 'zoom', 'zoom in', 'select', 'pan'], 
         margin={"r":0,"t":0,"l":0,"b":0, "autoexpand": False},
-        height=600, 
-        width=16*55, # 16/em; 55em = fit for website
+        height=FIGURE_SIZE_[1], 
+        width=FIGURE_SIZE_[0],
         map_zoom = 0,
         geo1 = dict(
             countrywidth = 0,
@@ -267,7 +417,7 @@ def update_layout(fig):
         ))
 
     fig.update_geos(
-        lataxis_range=[-90, 90], lonaxis_range=[-140, 210],
+        lataxis_range=MAP_LAT_RANGE_, lonaxis_range=MAP_LON_RANGE_,
         projection=dict(type="equirectangular"),
         landcolor="lightgray"
     )
@@ -281,49 +431,46 @@ def update_layout(fig):
     )
 
 
-def add_buttons(fig, mode_label_dict):
-    """Add the buttons to switch between "number" and "yield" plot. 
+def make_figure(df, country_region_json=None, single_choropleth=False, tables=None):
+    """Makes map with pie charts of explosion numbers and yields per region, with buttons to switch modes. 
+    Parameters
     ---------
-        fig : go.Figure
-            figure to add legend to
-        mode_label_dict : dict
-            keys: mode to add (e.g. "yield"), values: title for respecive button
+        df : pd.DataFrame
+            explosion data
+        country_region_json : str
+            compiled lookup or ISO-3166 json mapping states to regions; None for the lookup shipped with the project
+        single_choropleth : bool
+            if True, all regions are highlighted with one choropleth trace
+        tables : dict
+            if given, the region x state pivots of all modes are added (see figure_io.write_tables)
+    Returns
+    -------
+    go.Figure
     """
-    region_traces = [isinstance(f, go.Choropleth) for f in fig.data ]
-    
-    traces = []
-    modes = []
-    for mode in mode_label_dict:
-        traces += [ [f.meta==mode for f in fig.data] ]
-        modes += [mode]
-
-    buttons = []
-    for i, t in enumerate(traces):
-        buttons += [dict(label=mode_label_dict[modes[i]],
-            method="update",
-            args=[{"visible": [ x | y for (x,y) in zip(region_traces, t)]}] 
-            )]
-
-    menu_dict = {'updatemenus' : [
-        dict(
-            type="buttons",
-            direction="right",
-            active=0,
-            x=0.00,
-            y=0.92,
-            xanchor='left', 
-            yanchor='bottom', 
-            buttons=buttons,
-            font_size=15
-        )
-    ]}
+    df = df.drop(df[df.LAT.isnull()].index)
+    df = helpers.add_derived_columns(df)
 
-    fig.update_layout(
-        menu_dict
-    )
+    fig = go.Figure()
+    trace_groups = TraceGroups(fig)
+
+    # region outlines are visible in all modes
+    plot_regions(fig, df, country_region_json, single_trace=single_choropleth)
+    with trace_groups.recording("number"):
+        plot_explosion_pies(fig, df, "number", tables=tables)
+    with trace_groups.recording("yield_A"):
+        plot_explosion_pies(fig, df[df.TYPE_SHORT.str.contains("A")], "yield_A", visible=False, tables=tables)
+    # plot_explosion_pies(fig, df[df.TYPE.str.contains("UG") | df.TYPE.str.contains("UW") ], "yield_UG", visible=False)
+    with trace_groups.recording("yield"):
+        plot_explosion_pies(fig, df, "yield", visible=False, tables=tables)
 
+    trace_groups.add_buttons(MODE_LABEL_DICT_, y=0.92)
 
-def main(infilename, outfilename, country_region_json):
+    update_layout(fig)
+
+    return fig
+
+
+def main(infilename, outfilename, country_region_json=None, lazy_modes=False, compact=False, single_choropleth=False, tables=None, patch=False, reproducible=False, content_hash=False, filters=None):
     """Main. 
     Parameters
     ---------
@@ -331,53 +478,48 @@ def main(infilename, outfilename, country_region_json):
             filename of pickled pd.Dataframe with explosion locations
         outfilename : str
             filename for pickled go.Figure
+        country_region_json : str
+            compiled lookup or ISO-3166 json mapping states to regions; None for the lookup shipped with the project
+        lazy_modes : bool
+            if True, only the initially visible mode is written inline to html, the others to json shards
+        compact : bool
+            if True, write typed arrays and pre-compressed variants (see figure_io.save_figure)
+        single_choropleth : bool
+            if True, all regions are highlighted with one choropleth trace
+        tables : str
+            if "csv" or "parquet", the region x state pivots are written next to the figure
+        patch : bool
+            if True, also write a patch from the previous build (see figure_io.write_figure_patch)
+        reproducible : bool
+            if True, the same figure is written as the same bytes (see figure_io.save_figure)
+        content_hash : bool
+            if True, output file names carry a hash of their content (see figure_io.add_content_hash)
+        filters : dict
+            only explosions selected by these filters are loaded (see helpers.load_events, helpers.make_filters)
     """
     
-    df = helpers.load_pkl(infilename)
-    df = df.drop(df[df.LAT.isnull()].index)
-    df["TYPE_CAT"] = df["TYPE"].apply(lambda x: helpers.get_part_before_hyphen(x))
-
-    if not os.path.isfile(country_region_json):
-        input(f"[WARNING] Json that connects states to regions does not exist. Will download it and save it as '{country_region_json}'. Press enter to continue...")
-        import urllib.request
-        urllib.request.urlretrieve(
-            "https://raw.githubusercontent.com/lukes/ISO-3166-Countries-with-Regional-Codes/refs/heads/master/all/all.json", 
-            country_region_json
-        )
+    df = helpers.load_events(infilename, **(filters or {}))
+    if len(df) == 0:
+        print("[ERROR] No explosions match the filters. ")
+        return
+
+    if country_region_json is not None and not os.path.isfile(country_region_json):
+        print(f"[WARNING] Json that connects states to regions ('{country_region_json}') does not exist. Using the lookup shipped with the project; refresh it with region_lookup.py.")
+        country_region_json = None
 
     # Plotting
     # --------
 
-    fig = go.Figure()
-
-    plot_regions(fig, df, country_region_json)
-    plot_explosion_pies(fig, df, "number")
-    plot_explosion_pies(fig, df[df.TYPE_CAT.str.contains("A")], "yield_A", visible=False)
-    # plot_explosion_pies(fig, df[df.TYPE.str.contains("UG") | df.TYPE.str.contains("UW") ], "yield_UG", visible=False)
-    plot_explosion_pies(fig, df, "yield", visible=False)
-
-    add_buttons(fig, 
-        {"number": "Number of explosions", 
-        "yield": "Cumulative yield", 
-        "yield_A" : "Cumulative yield (only atmospheric)", 
-        # "yield_UG" : "Yield underground/-water"
-        }
-    )
-
-    update_layout(fig)
+    aggregates = {}
+    fig = make_figure(df, country_region_json, single_choropleth=single_choropleth, tables=aggregates)
 
     # Save output
     # -----------
 
-    if outfilename.find(".html") > -1:
-        fig.write_html(outfilename)
-        print(f"[INFO] Saved figure as {outfilename}.")
-    elif outfilename.find(".pkl") > -1:
-        helpers.save_pkl(fig, outfilename)
-        print(f"[INFO] Saved figure as {outfilename}.")
-    else: 
-        print("[ERROR] You can save the figure only as .html or .pkl file.")
+    if not figure_io.save_figure(fig, outfilename, lazy_modes=list(MODE_LABEL_DICT_) if lazy_modes else None, compact=compact, patch=patch, reproducible=reproducible, content_hash=content_hash):
         fig.show()
+    if tables:
+        figure_io.write_tables(aggregates, outfilename, fmt=tables)
 
 
 if __name__ == "__main__":
@@ -385,8 +527,30 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("-i", "--infilename", help="input data in pandas dataframe", required=True)
     parser.add_argument("-o", "--outfilename", help="output file, either html or pkl format.", required=True)
-    parser.add_argument("-j", "--countryregionjson", help="json that maps states to region. If file does not exist, it is downloaded there.", required=True)
+    parser.add_argument("-j", "--countryregionjson", help="json that maps states to region (compiled lookup or ISO-3166 json). Defaults to the lookup shipped with the project.", default=None)
+    parser.add_argument("--lazy-modes", help="html only: write data of hidden modes to json shards, loaded on first button click", action="store_true")
+    parser.add_argument("--compact", help="write numeric trace arrays as typed arrays (float32 where precision allows) and pre-compressed .gz/.br variants", action="store_true")
+    parser.add_argument("--patch", help="also write a patch from the previous build (json, applied to an open page with figure_patch.js)", action="store_true")
+    parser.add_argument("--reproducible", help="write the same bytes for the same figure (stable ids, sorted keys, rounded floats); unchanged files are not rewritten", action="store_true")
+    parser.add_argument("--content-hash", help="put a hash of the content into the output file names (implies --reproducible)", action="store_true")
+    parser.add_argument("--single-choropleth", help="highlight all regions with one choropleth trace (faster map rendering)", action="store_true")
+    parser.add_argument("--tables", help="also write the aggregate tables next to the figure", choices=["csv", "parquet"], default=None)
+
+    parser.add_argument("--workers", help="aggregate large catalogs in this many worker processes (0: number of cpus)", type=int, default=1)
+    parser.add_argument("--metrics", help="write build metrics (stage durations, rows, traces, bytes) to this file: .prom for Prometheus text, otherwise appended json lines", default=None)
+    parser.add_argument("--stage-cache", help="cache loaded, enriched and aggregated data in this directory (reused by later builds)", default=None)
+
+    helpers.add_filter_arguments(parser)
     args = parser.parse_args()
-
-    main(args.infilename, args.outfilename, args.countryregionjson)
+    try:
+        filters = helpers.make_filters(args.state, args.years, args.type, args.purpose)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.stage_cache:
+        stage_cache.enable(args.stage_cache)
+    parallel.set_workers(args.workers)
+
+    main(args.infilename, args.outfilename, args.countryregionjson, lazy_modes=args.lazy_modes, compact=args.compact, single_choropleth=args.single_choropleth, tables=args.tables, patch=args.patch, reproducible=args.reproducible, content_hash=args.content_hash, filters=filters)
+    if args.metrics:
+        metrics.write(args.metrics, script=parser.prog)
 
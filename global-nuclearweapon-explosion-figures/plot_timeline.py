@@ -0,0 +1,253 @@
+#!/usr/bin/env python3.13
+
+"""
+Snippet to plot cumulative nuclear explosion numbers and yields over time.
+
+Usage: plot_timeline.py [-h] -i INFILENAME -o OUTFILENAME [--resolution {day,month,year}] [--lazy-modes] [--compact] [--tables {csv,parquet}] [--patch] [--reproducible] [--content-hash] [--metrics METRICS] [--stage-cache STAGE_CACHE] [--state STATE] [--years YEARS] [--type TYPE] [--purpose PURPOSE]
+"""
+
+import argparse
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+import figure_io
+import helpers
+import metrics
+import stage_cache
+from plot_year_bars import CATEGORY_DICT_, YIELD_BINS_, get_category_styles
+from trace_groups import TraceGroups
+
+# Resolution of the curves -> pandas period (None: every explosion time)
+RESOLUTIONS_ = {"day": "D", "month": "M", "year": "Y"}
+
+
+@helpers.memoize_on_frame()
+@helpers.cached_stage
+def make_cumulative_table(df, category="STATE", resolution=None):
+    """Makes cumulative explosion numbers and yields per category value over time, reduced to the change points
+    of the step curves: one row per category value and explosion time (or period, see RESOLUTIONS_), after all
+    explosions at that time. Every curve is continued to the last time of all curves.
+    Computed with one stable sort and grouped cumulative sums (memoized, see helpers.memoize_on_frame).
+    Parameters
+    ---------
+        df : pd.Dataframe
+            data to use (with derived columns)
+        category : str
+            category of the curves (e.g. STATE)
+        resolution : str
+            key of RESOLUTIONS_; None to keep every explosion time
+    Returns
+    -------
+    pd.Dataframe with columns <category>, DATETIME, COUNT, YIELD (kt), sorted by time within every category value
+    """
+    d = pd.DataFrame({category: df[category], "DATETIME": df.DATETIME, "YIELD": df.YIELD.fillna(0)})
+    d = d[d[category].notna() & d.DATETIME.notna()]
+    if resolution:
+        d["DATETIME"] = d.DATETIME.dt.to_period(RESOLUTIONS_[resolution]).dt.start_time
+    d = d.sort_values("DATETIME", kind="stable")
+
+    groups = d.groupby(category, sort=False)
+    d["COUNT"] = groups.cumcount() + 1
+    d["YIELD"] = groups.YIELD.cumsum()
+
+    d = d[~d.duplicated([category, "DATETIME"], keep="last")]
+
+    if len(d):
+        last = d.drop_duplicates(category, keep="last")
+        last = last[last.DATETIME < d.DATETIME.iloc[-1]].assign(DATETIME=d.DATETIME.iloc[-1])
+        d = pd.concat([d, last]).sort_values("DATETIME", kind="stable")
+
+    return d[[category, "DATETIME", "COUNT", "YIELD"]].reset_index(drop=True)
+
+
+def make_timeline_traces(dff, category="STATE", name=None, color=None, visible=True):
+    """Makes step curves of cumulative explosion number and yield of one category value.
+    Parameters
+    ---------
+        dff : pd.Dataframe
+            rows of make_cumulative_table for this category value
+        category : str
+            category for colors (i.e. STATE to color according to state)
+        name : str
+            name of traces, for legend and hoverlabel
+        color : str
+            line color
+        visible : bool
+            whether traces are visible at beginning (changed with buttons)
+    Returns
+    -------
+    (go.Scatter, go.Scatter): cumulative number, cumulative yield
+    """
+
+    # yield curve only changes with explosions of known yield
+    changed = dff.YIELD.diff().ne(0)
+    changed.iloc[-1:] = True
+    dfy = dff[changed]
+
+    t_count = go.Scatter(x=dff.DATETIME, y=dff.COUNT,
+        name=name,
+        mode="lines",
+        line={"color": color, "width": 2, "shape": "hv"},
+        hovertemplate='<b>%{x|%Y-%m-%d}</b> <br>N = %{y}',
+        legendgroup=name,
+        legend="legend1",
+        xaxis="x1",
+        yaxis="y1",
+        visible=visible,
+        meta=category
+    )
+    t_yield = go.Scatter(x=dfy.DATETIME, y=dfy.YIELD/1000,
+        name=name,
+        mode="lines",
+        line={"color": color, "width": 2, "shape": "hv"},
+        hovertemplate='<b>%{x|%Y-%m-%d}</b> <br>%{y:.3f} MT',
+        legendgroup=name,
+        showlegend=False,
+        xaxis="x2",
+        yaxis="y2",
+        visible=visible,
+        meta=category
+    )
+    return t_count, t_yield
+
+
+def set_layout(fig):
+    """Set layout of figure.
+    Parameters
+    ---------
+        fig : go.Figure
+            figure to apply layout to
+    """
+    fig.update_layout(
+        modebar_remove=['lasso', 'select'],
+        xaxis2=dict(
+            title=dict(text="Year")),
+        yaxis1=dict(
+            title=dict(text="Cumulative number of explosions"),
+            ),
+        yaxis2=dict(
+            title=dict(text="Cumulative yield [MT]"),
+            ),
+        hovermode="x",
+        margin={"r":0,"t":0,"l":0,"b":0},
+        height=800,
+        width=16*55, # 16/em; 55em = fit for website
+        legend1 = {
+            'yanchor' : "top",
+            'y' : 0.98,
+            'xanchor' : "left",
+            'x' : 0.02,
+            'font' : {'size' : 15}}
+        )
+
+
+def make_figure(df, resolution=None, tables=None):
+    """Makes cumulative explosion numbers (top) and yields (bottom) over time, with buttons to switch categories.
+    Parameters
+    ---------
+        df : pd.Dataframe
+            data to use
+        resolution : str
+            key of RESOLUTIONS_ (curves change once per day, month or year); None for every explosion time
+        tables : dict
+            if given, the cumulative tables are added as "timeline_<category>" (see figure_io.write_tables)
+    Returns
+    -------
+    go.Figure
+    """
+
+    df = helpers.add_derived_columns(df, yield_bins=YIELD_BINS_)
+
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.03)
+    trace_groups = TraceGroups(fig)
+
+    for category in CATEGORY_DICT_:
+        table = make_cumulative_table(df, category, resolution)
+        if tables is not None:
+            tables[f"timeline_{category}"] = table
+
+        groups = dict(tuple(table.groupby(category, sort=False)))
+        traces = []
+        for (value, name, color) in get_category_styles(df, category):
+            if value not in groups:
+                continue
+            traces += make_timeline_traces(groups[value], category=category, name=name, color=color, visible=(category == "STATE"))
+        with trace_groups.recording(category):
+            fig.add_traces(traces, rows=[1, 2] * (len(traces) // 2), cols=1)
+
+    trace_groups.add_buttons(CATEGORY_DICT_, y=1.03)
+
+    set_layout(fig)
+
+    return fig
+
+
+def main(infilename, outfilename, resolution=None, lazy_modes=False, compact=False, tables=None, patch=False, reproducible=False, content_hash=False, filters=None):
+    """Main.
+    Parameters
+    ---------
+        infilename : str
+            filename of pickled pd.Dataframe
+        outfilename : str
+            filename of pickled go.Figure
+        resolution : str
+            key of RESOLUTIONS_; None for every explosion time
+        lazy_modes : bool
+            if True, only the initially visible mode is written inline to html, the others to json shards
+        compact : bool
+            if True, write typed arrays and pre-compressed variants (see figure_io.save_figure)
+        tables : str
+            if "csv" or "parquet", the cumulative tables are written next to the figure
+        patch : bool
+            if True, also write a patch from the previous build (see figure_io.write_figure_patch)
+        reproducible : bool
+            if True, the same figure is written as the same bytes (see figure_io.save_figure)
+        content_hash : bool
+            if True, output file names carry a hash of their content (see figure_io.add_content_hash)
+        filters : dict
+            only explosions selected by these filters are loaded (see helpers.load_events, helpers.make_filters)
+    """
+
+    df = helpers.load_events(infilename, **(filters or {}))
+    if len(df) == 0:
+        print("[ERROR] No explosions match the filters. ")
+        return
+
+    aggregates = {}
+    fig = make_figure(df, resolution=resolution, tables=aggregates)
+
+    figure_io.save_figure(fig, outfilename, lazy_modes=list(CATEGORY_DICT_) if lazy_modes else None, compact=compact, patch=patch, reproducible=reproducible, content_hash=content_hash)
+    if tables:
+        figure_io.write_tables(aggregates, outfilename, fmt=tables)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--infilename", help="infilename", required=True)
+    parser.add_argument("-o", "--outfilename", help="outfilename", required=True)
+    parser.add_argument("--resolution", help="curves change at most once per day, month or year (default: every explosion time)", choices=list(RESOLUTIONS_), default=None)
+    parser.add_argument("--lazy-modes", help="html only: write data of hidden modes to json shards, loaded on first button click", action="store_true")
+    parser.add_argument("--compact", help="write numeric trace arrays as typed arrays (float32 where precision allows) and pre-compressed .gz/.br variants", action="store_true")
+    parser.add_argument("--patch", help="also write a patch from the previous build (json, applied to an open page with figure_patch.js)", action="store_true")
+    parser.add_argument("--reproducible", help="write the same bytes for the same figure (stable ids, sorted keys, rounded floats); unchanged files are not rewritten", action="store_true")
+    parser.add_argument("--content-hash", help="put a hash of the content into the output file names (implies --reproducible)", action="store_true")
+
+    parser.add_argument("--tables", help="also write the aggregate tables next to the figure", choices=["csv", "parquet"], default=None)
+
+    parser.add_argument("--metrics", help="write build metrics (stage durations, rows, traces, bytes) to this file: .prom for Prometheus text, otherwise appended json lines", default=None)
+    parser.add_argument("--stage-cache", help="cache loaded, enriched and aggregated data in this directory (reused by later builds)", default=None)
+
+    helpers.add_filter_arguments(parser)
+    args = parser.parse_args()
+    try:
+        filters = helpers.make_filters(args.state, args.years, args.type, args.purpose)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.stage_cache:
+        stage_cache.enable(args.stage_cache)
+
+    main(args.infilename, args.outfilename, resolution=args.resolution, lazy_modes=args.lazy_modes, compact=args.compact, tables=args.tables, patch=args.patch, reproducible=args.reproducible, content_hash=args.content_hash, filters=filters)
+    if args.metrics:
+        metrics.write(args.metrics, script=parser.prog)
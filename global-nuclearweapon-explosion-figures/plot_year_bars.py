@@ -3,14 +3,20 @@
 """
 Snippet to plot histograms of nuclear explosion numbers over years. 
 
-Usage: plot_year_bars.py [-h] -i INFILENAME -o OUTFILENAME
+Usage: plot_year_bars.py [-h] -i INFILENAME -o OUTFILENAME [--lazy-modes] [--compact] [--tables {csv,parquet}] [--patch] [--reproducible] [--content-hash] [--workers WORKERS] [--metrics METRICS] [--stage-cache STAGE_CACHE] [--state STATE] [--years YEARS] [--type TYPE] [--purpose PURPOSE]
 """
 
 import argparse
+import pandas as pd
 import plotly.graph_objects as go
-import plotly.express as px
+from plotly.colors import qualitative
 
+import figure_io
 import helpers
+import metrics
+import parallel
+import stage_cache
+from trace_groups import TraceGroups
 
 YIELD_BINS_ = [0.01, 1, 10, 50, 100, 1000, 10000]
 
@@ -22,12 +28,12 @@ CATEGORY_DICT_= {
     "YIELD_CAT" : "Yield", 
     "DELIVERY" : "Method"}
 
-def make_year_histogram(df, category="STATE", value="US", name=None, color=None, visible=True):
-    """Plot histograms of nuclear explosion numbers per year.
+def make_year_bars(counts, category="STATE", value="US", name=None, color=None, visible=True):
+    """Plot bars of nuclear explosion numbers per year.
     Parameters
     ---------
-        df : pd.Dataframe
-            data to use
+        counts : pd.Dataframe
+            explosion numbers per year and category value (see make_year_count_table)
         category : str
             category for colors (i.e. STATE to color according to state)
         value : str
@@ -35,7 +41,7 @@ def make_year_histogram(df, category="STATE", value="US", name=None, color=None,
         name : str
             name of trace, for legend and hoverlabel
         color : str
-            fill color of histogram 
+            fill color of bars 
         visible : bool
             whether trace is visible at beginning (changed with buttons)
     """
@@ -43,9 +49,12 @@ def make_year_histogram(df, category="STATE", value="US", name=None, color=None,
     if name is None:
         name=value
 
-    df = df[df[category]==value]
+    # values without explosions (e.g. yield ranges) keep their legend entry
+    n = counts[value] if value in counts.columns else pd.Series(0, index=counts.index)
+    n = n[n > 0]
 
-    t = go.Histogram(x=df.YEAR, 
+    t = go.Bar(x=n.index, y=n.values, 
+        width=1,
         name=name, 
         marker={"color": color, "line": {"width":1.5}}, 
         hovertemplate = '<b>%{x}</b> <br>N = %{y}', 
@@ -68,6 +77,7 @@ def set_layout(fig):
     fig.update_layout(
         modebar_remove=['lasso', 'select'], 
         barmode='stack',
+        bargap=0,
         xaxis1=dict(
             title=dict(text="Year")),
         yaxis1=dict(
@@ -85,50 +95,94 @@ def set_layout(fig):
         )
 
 
-def add_buttons(fig, mode_label_dict):
-    """Add the buttons to switch between modes
+def get_category_styles(df, category):
+    """Values of a category in drawing order, with legend names and colors.
+    Parameters
     ---------
-        fig : go.Figure
-            figure to add legend to
-        mode_label_dict : dict
-            keys: mode to add (e.g. "STATE"), values: title for respecive button
+        df : pd.Dataframe
+            data to use (with derived columns)
+        category : str
+            key of CATEGORY_DICT_
+    Returns
+    -------
+    list of (value, name, color)
+    """
+    if category == "STATE":
+        return [(s, helpers.FIXEDLABELS_[s], helpers.COLORS_[s]) for s in df.STATE.unique()]
+    if category == "REGION":
+        return [(r, r, helpers.REGIONCOLORS_.get(r, 'lightgrey')) for r in df.REGION.unique()]
+    if category == "TYPE_SHORT":
+        return [(r, helpers.TYPESLABEL_[r], helpers.TYPECOLORS_[r]) for r in df.TYPE_SHORT.unique()]
+    if category == "PUR_SHORT":
+        return [(r, helpers.PURPOSELABEL_[r], qualitative.Antique[i]) for (i, r) in enumerate(df.PUR_SHORT.unique())]
+    if category == "YIELD_CAT":
+        return [(r, r, c) for (r, c) in helpers.make_yield_color_dict().items()]
+    if category == "DELIVERY":
+        return [(r, helpers.DELIVERYLABEL_[r], helpers.DELIVERYCOLOR_[r]) for r in sorted(df.DELIVERY.unique())]
+    raise ValueError(f"Unknown category '{category}'.")
+
+
+@helpers.memoize_on_frame()
+@helpers.cached_stage
+def make_year_count_table(df, category="STATE"):
+    """Makes table of explosion numbers per year (rows) and category value (columns), i.e. the bar heights
+    (memoized, see helpers.memoize_on_frame). Large catalogs are counted per partition of states in worker
+    processes (see parallel.map_partitions).
+    Parameters
+    ---------
+        df : pd.Dataframe
+            data to use
+        category : str
+            category of the bars (e.g. STATE)
     """
+    return parallel.map_partitions(count_per_year, df, by="STATE", merge=merge_year_counts, args=(category,))
 
-    other_traces = [not isinstance(f, go.Histogram) for f in fig.data ]
-
-    traces = []
-    modes = []
-    for mode in mode_label_dict:
-        traces += [ [f.meta==mode for f in fig.data] ]
-        modes += [mode]
-
-    buttons = []
-    for i, t in enumerate(traces):
-        buttons += [dict(label=mode_label_dict[modes[i]],
-            method="update",
-            args=[{"visible": [ x | y for (x,y) in zip(other_traces, t)] }] 
-            )]
-
-    menu_dict = {'updatemenus' : [
-        dict(
-            type="buttons",
-            direction="right",
-            active=0,
-            x=0.00,
-            y=1.03,
-            xanchor='left', 
-            yanchor='bottom', 
-            buttons=buttons,
-            font_size=15
-        )
-    ]}
 
-    fig.update_layout(
-        menu_dict
-    )
+def count_per_year(df, category="STATE"):
+    """Makes table of explosion numbers per year and category value (see make_year_count_table)."""
+    return pd.crosstab(df.YEAR, df[category]).rename_axis(index="YEAR", columns=category)
+
+
+def merge_year_counts(parts, df):
+    """Sums year count tables of partitions of df (see count_per_year)."""
+    table = pd.concat(parts).fillna(0).groupby(level="YEAR").sum()
+    return table[sorted(table.columns)].astype(parts[0].dtypes.iloc[0]).rename_axis(columns=parts[0].columns.name)
+
+
+def make_figure(df, tables=None):
+    """Makes histograms of explosion numbers per year (stacked bars from make_year_count_table), with buttons to switch categories. 
+    Parameters
+    ---------
+        df : pd.Dataframe
+            data to use
+        tables : dict
+            if given, the year x category counts are added as "year_<category>" (see figure_io.write_tables)
+    Returns
+    -------
+    go.Figure
+    """
+
+    df = helpers.add_derived_columns(df, yield_bins=YIELD_BINS_)
+
+    fig = go.Figure()
+    trace_groups = TraceGroups(fig)
+
+    for category in CATEGORY_DICT_:
+        counts = make_year_count_table(df, category)
+        if tables is not None:
+            tables[f"year_{category}"] = counts
+        with trace_groups.recording(category):
+            fig.add_traces([make_year_bars(counts, category=category, value=value, visible=(category == "STATE"), color=color, name=name)
+                for (value, name, color) in get_category_styles(df, category)])
 
+    trace_groups.add_buttons(CATEGORY_DICT_, y=1.03)
 
-def main(infilename, outfilename):
+    set_layout(fig)
+
+    return fig
+
+
+def main(infilename, outfilename, lazy_modes=False, compact=False, tables=None, patch=False, reproducible=False, content_hash=False, filters=None):
     """Main. 
     Parameters
     ---------
@@ -136,65 +190,33 @@ def main(infilename, outfilename):
             filename of pickled pd.Dataframe
         outfilename : str
             filename of pickled go.Figure
+        lazy_modes : bool
+            if True, only the initially visible mode is written inline to html, the others to json shards
+        compact : bool
+            if True, write typed arrays and pre-compressed variants (see figure_io.save_figure)
+        tables : str
+            if "csv" or "parquet", the year x category counts are written next to the figure
+        patch : bool
+            if True, also write a patch from the previous build (see figure_io.write_figure_patch)
+        reproducible : bool
+            if True, the same figure is written as the same bytes (see figure_io.save_figure)
+        content_hash : bool
+            if True, output file names carry a hash of their content (see figure_io.add_content_hash)
+        filters : dict
+            only explosions selected by these filters are loaded (see helpers.load_events, helpers.make_filters)
     """
     
-    df = helpers.load_pkl(infilename)
-    df["TYPE_SHORT"] = df["TYPE"].apply(lambda x: helpers.get_explosion_type(x))
-    df["PUR_SHORT"] = df["PUR"].apply(lambda x: helpers.get_explosion_purpose(x))
-    df["YIELD_CAT"] = df["YIELD"].apply(lambda x: helpers.get_yield_range_str(x, YIELD_BINS_))
-    df["DELIVERY"] = df["TYPE"].apply(lambda x: helpers.get_delivery(x))
-
-    fig = go.Figure()
-    
-    # State #
-    #--------
-    for s in df.STATE.unique():
-        t = make_year_histogram(df, category="STATE", value=s, color=helpers.COLORS_[s], name=helpers.FIXEDLABELS_[s])
-        fig.add_trace(t) 
-
-    # Region #
-    #--------
-    for i, r in enumerate(df.REGION.unique()):
-        t = make_year_histogram(df, category="REGION", value=r, visible=False, color=helpers.REGIONCOLORS_[r])
-        fig.add_trace(t) 
-
-    # Type #
-    #--------
-    for i, r in enumerate(df.TYPE_SHORT.unique()):
-        t = make_year_histogram(df, category="TYPE_SHORT", value=r, visible=False, color=helpers.TYPECOLORS_[r], name=helpers.TYPESLABEL_[r])
-        fig.add_trace(t) 
-    
-    # Purpose #
-    #----------
-    for i, r in enumerate(df.PUR_SHORT.unique()):
-        t = make_year_histogram(df, category="PUR_SHORT", value=r, visible=False, name=helpers.PURPOSELABEL_[r], color=px.colors.qualitative.Antique[i])
-        fig.add_trace(t) 
-    
-    # Yield categories #
-    #-------------------
-    color_dict = helpers.make_yield_color_dict()
-    for i, r in enumerate( list(color_dict.keys()) ):
-        t = make_year_histogram(df, category="YIELD_CAT", value=r, visible=False, color=color_dict[r])
-        fig.add_trace(t) 
-    
-    # Method #
-    #---------
-    for i, r in enumerate( sorted(df.DELIVERY.unique())):
-        t = make_year_histogram(df, category="DELIVERY", value=r, visible=False, name=helpers.DELIVERYLABEL_[r], color=helpers.DELIVERYCOLOR_[r])
-        fig.add_trace(t) 
-    
-    add_buttons(fig, 
-        CATEGORY_DICT_
-    )
+    df = helpers.load_events(infilename, **(filters or {}))
+    if len(df) == 0:
+        print("[ERROR] No explosions match the filters. ")
+        return
 
-    set_layout(fig)
+    aggregates = {}
+    fig = make_figure(df, tables=aggregates)
 
-    if outfilename.find(".html") > -1:
-        fig.write_html(outfilename)
-    elif outfilename.find(".pkl") > -1:
-        helpers.save_pkl(fig, outfilename)
-    else: 
-        print("[ERROR] You can save the figure only as .html or .pkl file. ")
+    figure_io.save_figure(fig, outfilename, lazy_modes=list(CATEGORY_DICT_) if lazy_modes else None, compact=compact, patch=patch, reproducible=reproducible, content_hash=content_hash)
+    if tables:
+        figure_io.write_tables(aggregates, outfilename, fmt=tables)
 
 
 if __name__ == "__main__":
@@ -202,10 +224,31 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("-i", "--infilename", help="infilename", required=True)
     parser.add_argument("-o", "--outfilename", help="outfilename", required=True)
+    parser.add_argument("--lazy-modes", help="html only: write data of hidden modes to json shards, loaded on first button click", action="store_true")
+    parser.add_argument("--compact", help="write numeric trace arrays as typed arrays (float32 where precision allows) and pre-compressed .gz/.br variants", action="store_true")
+    parser.add_argument("--patch", help="also write a patch from the previous build (json, applied to an open page with figure_patch.js)", action="store_true")
+    parser.add_argument("--reproducible", help="write the same bytes for the same figure (stable ids, sorted keys, rounded floats); unchanged files are not rewritten", action="store_true")
+    parser.add_argument("--content-hash", help="put a hash of the content into the output file names (implies --reproducible)", action="store_true")
 
-    args = parser.parse_args()
+    parser.add_argument("--tables", help="also write the aggregate tables next to the figure", choices=["csv", "parquet"], default=None)
 
-    main(args.infilename, args.outfilename)
+    parser.add_argument("--workers", help="aggregate large catalogs in this many worker processes (0: number of cpus)", type=int, default=1)
+    parser.add_argument("--metrics", help="write build metrics (stage durations, rows, traces, bytes) to this file: .prom for Prometheus text, otherwise appended json lines", default=None)
+    parser.add_argument("--stage-cache", help="cache loaded, enriched and aggregated data in this directory (reused by later builds)", default=None)
+
+    helpers.add_filter_arguments(parser)
+    args = parser.parse_args()
+    try:
+        filters = helpers.make_filters(args.state, args.years, args.type, args.purpose)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.stage_cache:
+        stage_cache.enable(args.stage_cache)
+    parallel.set_workers(args.workers)
+
+    main(args.infilename, args.outfilename, lazy_modes=args.lazy_modes, compact=args.compact, tables=args.tables, patch=args.patch, reproducible=args.reproducible, content_hash=args.content_hash, filters=filters)
+    if args.metrics:
+        metrics.write(args.metrics, script=parser.prog)
 
 
 
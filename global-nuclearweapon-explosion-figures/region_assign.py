@@ -0,0 +1,254 @@
+#!/usr/bin/env python3.13
+
+"""
+Offline assignment of world regions (UN sub-regions and oceans) to explosions from their LAT/LONG,
+e.g. for new or synthetic events without REGION column.
+
+Boundaries are read from a local GeoJSON file (FeatureCollection of Polygons/MultiPolygons, the region name
+in a feature property). Candidate points of every polygon are pre-filtered with its bounding box (points
+sorted by longitude, one binary search per polygon). The edges of every polygon are bucketed into latitude
+bands, so every candidate is only tested against the edges spanning its band (even-odd rule, holes included).
+
+usage: region_assign.py [-h] -i INFILENAME -o OUTFILENAME -b BOUNDARIES [-p PROPERTY] [--overwrite]
+"""
+
+import argparse
+import json
+
+import numpy as np
+
+import helpers
+
+# Maximal number of point-edge pairs tested at once (bounds memory)
+CHUNK_SIZE_ = 1 << 22
+
+# Mean number of edges per latitude band of a polygon (see RegionBoundaries.make_bands)
+EDGES_PER_BAND_ = 8
+
+
+class RegionBoundaries:
+    """Polygons of regions, flattened to edge arrays bucketed by latitude band."""
+
+    def __init__(self, features, property="REGION"):
+        """Builds edge arrays and bounding boxes.
+        Parameters
+        ---------
+            features : list of dict
+                GeoJSON features (Polygon or MultiPolygon geometry)
+            property : str
+                feature property holding the region name
+        """
+        self.regions = []
+        edges, polygon_ids, bboxes = [], [], []
+
+        for feature in features:
+            geometry = feature.get("geometry") or {}
+            if geometry.get("type") == "Polygon":
+                polygons = [geometry["coordinates"]]
+            elif geometry.get("type") == "MultiPolygon":
+                polygons = geometry["coordinates"]
+            else:
+                continue
+
+            for rings in polygons:
+                # outer ring and holes: even-odd rule over all edges of the polygon
+                ring_edges = []
+                for ring in rings:
+                    ring = np.asarray(ring, dtype=float)[:, :2]
+                    ring_edges += [np.hstack([ring, np.roll(ring, -1, axis=0)])]
+                ring_edges = np.vstack(ring_edges)
+                edges += [ring_edges]
+                polygon_ids += [np.full(len(ring_edges), len(self.regions))]
+                outer = np.asarray(rings[0], dtype=float)
+                bboxes += [[outer[:, 0].min(), outer[:, 0].max(), outer[:, 1].min(), outer[:, 1].max()]]
+                self.regions += [feature["properties"][property]]
+
+        self.edges = np.vstack(edges) if edges else np.zeros((0, 4))
+        polygon_ids = np.concatenate(polygon_ids) if polygon_ids else np.zeros(0, dtype=int)
+        self.bboxes = np.asarray(bboxes, dtype=float).reshape(-1, 4)
+        # polygon -> range [start, end) of its edges
+        self.edge_starts = np.searchsorted(polygon_ids, np.arange(len(self.regions)))
+        self.edge_ends = np.append(self.edge_starts[1:], len(self.edges))
+        self.bands = [self.make_bands(i) for i in range(len(self.regions))]
+
+    def make_bands(self, i):
+        """Buckets the edges of polygon i into latitude bands of equal height over its bounding box.
+        Returns
+        -------
+        (lowest latitude, band height, band -> start in edge list (n_bands + 1), edge list (indices into the polygon's edges))
+        """
+        e = self.edges[self.edge_starts[i]:self.edge_ends[i]]
+        lat_min, lat_max = self.bboxes[i, 2], self.bboxes[i, 3]
+        n_bands = max(min(len(e) // EDGES_PER_BAND_, 4096), 1)
+        height = (lat_max - lat_min) / n_bands if lat_max > lat_min else 1.0
+
+        first = self._band(np.minimum(e[:, 1], e[:, 3]), lat_min, height, n_bands)
+        last = self._band(np.maximum(e[:, 1], e[:, 3]), lat_min, height, n_bands)
+        counts = last - first + 1
+        edge_list = np.repeat(np.arange(len(e)), counts)
+        band_of = np.repeat(first, counts) + np.arange(len(edge_list)) - np.repeat(np.cumsum(counts) - counts, counts)
+        order = np.argsort(band_of, kind="stable")
+        starts = np.searchsorted(band_of[order], np.arange(n_bands + 1))
+        return lat_min, height, starts, edge_list[order]
+
+    @staticmethod
+    def _band(lat, lat_min, height, n_bands):
+        return np.clip(np.floor((lat - lat_min) / height), 0, n_bands - 1).astype(np.int64)
+
+    @classmethod
+    def from_geojson(cls, filename, property="REGION"):
+        """Reads boundaries from a GeoJSON file.
+        Parameters
+        ---------
+            filename : str
+                GeoJSON FeatureCollection
+            property : str
+                feature property holding the region name
+        """
+        with open(filename, 'rb') as f:
+            content = json.load(f)
+        features = content["features"] if content.get("type") == "FeatureCollection" else [content]
+        return cls(features, property=property)
+
+    def contains(self, i, lon, lat):
+        """Tests points against polygon i (even-odd ray casting, vectorized over the points of a latitude band and
+        the edges spanning it).
+        Parameters
+        ---------
+            i : int
+                polygon index
+            lon, lat : np.ndarray
+                coordinates of the points [deg]
+        Returns
+        -------
+        boolean array
+        """
+        e = self.edges[self.edge_starts[i]:self.edge_ends[i]]
+        lat_min, height, starts, edge_list = self.bands[i]
+        inside = np.zeros(len(lon), dtype=bool)
+
+        # points grouped by band
+        bands = self._band(lat, lat_min, height, len(starts) - 1)
+        order = np.argsort(bands, kind="stable")
+        bounds = np.searchsorted(bands[order], np.arange(len(starts)))
+        for band in np.flatnonzero(np.diff(bounds)):
+            points = order[bounds[band]:bounds[band+1]]
+            inside[points] = count_crossings(e[edge_list[starts[band]:starts[band+1]]], lon[points], lat[points]) % 2 == 1
+
+        return inside
+
+    def assign(self, lat, lon):
+        """Assigns regions to points (first containing polygon).
+        Parameters
+        ---------
+            lat, lon : array-like
+                coordinates of the points [deg]
+        Returns
+        -------
+        np.ndarray (object) of region names, None where no polygon contains the point
+        """
+        lat, lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+        result = np.full(len(lat), None, dtype=object)
+        unassigned = np.isfinite(lat) & np.isfinite(lon)
+
+        # bounding box index: points sorted by longitude
+        order = np.argsort(lon, kind="stable")
+        lon_sorted = lon[order]
+
+        for i, (lon_min, lon_max, lat_min, lat_max) in enumerate(self.bboxes):
+            candidates = order[np.searchsorted(lon_sorted, lon_min, side="left"):np.searchsorted(lon_sorted, lon_max, side="right")]
+            candidates = candidates[unassigned[candidates] & (lat[candidates] >= lat_min) & (lat[candidates] <= lat_max)]
+            if len(candidates) == 0:
+                continue
+            hits = candidates[self.contains(i, lon[candidates], lat[candidates])]
+            result[hits] = self.regions[i]
+            unassigned[hits] = False
+
+        return result
+
+
+def count_crossings(e, lon, lat):
+    """Number of edges e (n x 4: lon0, lat0, lon1, lat1) crossed by a ray from every point towards east."""
+    n = np.zeros(len(lon), dtype=np.int64)
+    step = max(CHUNK_SIZE_ // max(len(e), 1), 1)
+    x0, y0, x1, y1 = e[:, 0], e[:, 1], e[:, 2], e[:, 3]
+
+    for start in range(0, len(lon), step):
+        x, y = lon[start:start+step, None], lat[start:start+step, None]
+        crosses = (y0 > y) != (y1 > y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_cross = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+        n[start:start+step] = np.count_nonzero(crosses & (x < x_cross), axis=1)
+
+    return n
+
+
+def assign_regions(df, boundaries, overwrite=False):
+    """Assigns the REGION column of explosions from their LAT/LONG.
+    Parameters
+    ---------
+        df : pd.Dataframe
+            explosion data
+        boundaries : RegionBoundaries
+            region polygons
+        overwrite : bool
+            if False, only rows without REGION are assigned
+    Returns
+    -------
+    pd.Dataframe (copy) with REGION column
+    """
+    df = df.copy()
+    if "REGION" not in df.columns or overwrite:
+        todo = np.ones(len(df), dtype=bool)
+        df["REGION"] = None
+    else:
+        todo = df.REGION.isna().to_numpy()
+
+    rows = np.flatnonzero(todo)
+    regions = boundaries.assign(df.LAT.to_numpy(dtype=float)[rows], df.LONG.to_numpy(dtype=float)[rows])
+    df.iloc[rows, df.columns.get_loc("REGION")] = regions
+
+    return df
+
+
+def main(infilename, outfilename, boundaryfilename, property="REGION", overwrite=False):
+    """Main.
+    Parameters
+    ---------
+        infilename : str
+            filename of pickled pd.Dataframe
+        outfilename : str
+            filename for pickled pd.Dataframe with REGION column
+        boundaryfilename : str
+            GeoJSON with region polygons
+        property : str
+            feature property holding the region name
+        overwrite : bool
+            if True, existing regions are reassigned as well
+    """
+    df = helpers.load_pkl(infilename)
+    boundaries = RegionBoundaries.from_geojson(boundaryfilename, property=property)
+    print(f"[INFO] Read {len(boundaries.regions)} polygons ({len(boundaries.edges)} edges) of {len(set(boundaries.regions))} regions.")
+
+    n_missing = len(df) if ("REGION" not in df.columns or overwrite) else int(df.REGION.isna().sum())
+    df = assign_regions(df, boundaries, overwrite=overwrite)
+    n_unplaced = int(df.REGION.isna().sum())
+    print(f"[INFO] Assigned regions to {n_missing - n_unplaced} of {n_missing} explosions.")
+    if n_unplaced > 0:
+        print(f"[WARNING] {n_unplaced} explosions are not inside any region polygon.")
+
+    helpers.save_pkl(df, outfilename)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--infilename", help="infilename", required=True)
+    parser.add_argument("-o", "--outfilename", help="outfilename", required=True)
+    parser.add_argument("-b", "--boundaries", help="GeoJSON with polygons of UN sub-regions and oceans", required=True)
+    parser.add_argument("-p", "--property", help="feature property holding the region name", default="REGION")
+    parser.add_argument("--overwrite", help="reassign regions of explosions that already have one", action="store_true")
+
+    args = parser.parse_args()
+
+    main(args.infilename, args.outfilename, args.boundaries, property=args.property, overwrite=args.overwrite)
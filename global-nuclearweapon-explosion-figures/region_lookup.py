@@ -0,0 +1,188 @@
+#!/usr/bin/env python3.13
+
+"""
+Compiled lookup connecting states to world regions (according to UN geoscheme).
+
+The lookup (country code -> sub-region, sub-region -> country names) ships with the project
+in data/country_regions.json and can be refreshed from a local mirror of the ISO-3166 json
+(file path) or from a (local stand-in) server. Server requests are conditional (ETag / Last-Modified),
+so an unchanged source is not downloaded again. Nothing here prompts interactively.
+
+usage: region_lookup.py [-h] -s SOURCE [-o OUTFILENAME]
+"""
+
+import argparse
+import functools
+import json
+import os
+import os.path
+
+DEFAULT_LOOKUP_ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "country_regions.json")
+
+UPSTREAM_URL_ = "https://raw.githubusercontent.com/lukes/ISO-3166-Countries-with-Regional-Codes/refs/heads/master/all/all.json"
+
+
+def compile_region_lookup(records):
+    """Compiles list of ISO-3166 records (as in all.json) to the compact lookup.
+    Parameters
+    ---------
+        records : list of dict
+            records with keys 'alpha-2', 'sub-region' and 'name'
+    Returns
+    -------
+    dict with keys "cc" (country code -> region) and "region" (region -> list of state names)
+    """
+    lookup = {"cc": {}, "region": {}}
+
+    for j in records:
+        cc = j['alpha-2']
+        region = j['sub-region']
+        name = j['name']
+
+        lookup["cc"][cc] = region
+        lookup["region"].setdefault(region, []).append(name)
+
+    return lookup
+
+
+@functools.lru_cache(maxsize=None)
+def load_region_lookup(lookupfile=None):
+    """Loads the compiled lookup (cached, i.e. the file is read only once per session).
+    Raw ISO-3166 json files (list of records) are compiled on the fly.
+    Parameters
+    ---------
+        lookupfile : str
+            compiled lookup or raw ISO-3166 json; None for the shipped lookup
+    Returns
+    -------
+    dict with keys "cc" and "region" (see compile_region_lookup). Do not modify.
+    """
+    if lookupfile is None:
+        lookupfile = DEFAULT_LOOKUP_
+
+    with open(lookupfile, 'rb') as f:
+        content = json.load(f)
+
+    if isinstance(content, list):
+        content = compile_region_lookup(content)
+
+    return content
+
+
+def write_region_lookup(lookup, outfilename):
+    """Writes compact lookup atomically (so readers never see half-written files).
+    Parameters
+    ---------
+        lookup : dict
+            compiled lookup
+        outfilename : str
+            filename of compiled lookup
+    """
+    tmpfilename = f"{outfilename}.tmp"
+    with open(tmpfilename, 'w', encoding='utf-8') as f:
+        json.dump(lookup, f, ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+    os.replace(tmpfilename, outfilename)
+
+
+def fetch_records(source, metafilename=None):
+    """Reads ISO-3166 records from a local path or a server (http/https, e.g. a local stand-in server).
+    Parameters
+    ---------
+        source : str
+            file path or url
+        metafilename : str
+            json file keeping ETag/Last-Modified of the last download (used for conditional requests)
+    Returns
+    -------
+    list of records, or None if the server reports the source as unchanged (HTTP 304)
+    """
+    if source.find("://") == -1 or source.startswith("file://"):
+        path = source[len("file://"):] if source.startswith("file://") else source
+        with open(path, 'rb') as f:
+            return json.load(f)
+
+    import urllib.request
+    import urllib.error
+
+    meta = {}
+    if metafilename is not None and os.path.isfile(metafilename):
+        with open(metafilename, 'r') as f:
+            meta = json.load(f)
+
+    headers = {}
+    if meta.get("source") == source:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    request = urllib.request.Request(source, headers=headers)
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            records = json.loads(response.read())
+            meta = {
+                "source" : source,
+                "etag" : response.headers.get("ETag"),
+                "last_modified" : response.headers.get("Last-Modified"),
+            }
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return None
+        raise
+
+    if metafilename is not None:
+        with open(metafilename, 'w') as f:
+            json.dump(meta, f)
+
+    return records
+
+
+def refresh_region_lookup(source, outfilename=DEFAULT_LOOKUP_):
+    """Refreshes the compiled lookup from the source.
+    Parameters
+    ---------
+        source : str
+            file path or url of ISO-3166 json (with UN geoscheme regions)
+        outfilename : str
+            filename of compiled lookup
+    Returns
+    -------
+    True if the lookup was rewritten, False if the source was unchanged.
+    """
+    metafilename = f"{outfilename}.meta.json"
+    if not os.path.isfile(outfilename) and os.path.isfile(metafilename):
+        # nothing to keep on "not modified"; download unconditionally
+        os.remove(metafilename)
+
+    records = fetch_records(source, metafilename=metafilename)
+    if records is None:
+        print(f"[INFO] {source} not modified, keeping {outfilename}.")
+        return False
+
+    lookup = compile_region_lookup(records)
+    write_region_lookup(lookup, outfilename)
+    load_region_lookup.cache_clear()
+    print(f"[INFO] Compiled {len(lookup['cc'])} states in {len(lookup['region'])} regions to {outfilename}.")
+    return True
+
+
+def main(source, outfilename):
+    """Main.
+    Parameters
+    ---------
+        source : str
+            file path or url of ISO-3166 json
+        outfilename : str
+            filename of compiled lookup
+    """
+    refresh_region_lookup(source, outfilename)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--source", help=f"local path or url of ISO-3166 json with regions, e.g. a local mirror of {UPSTREAM_URL_}", required=True)
+    parser.add_argument("-o", "--outfilename", help="compiled lookup to write", default=DEFAULT_LOOKUP_)
+    args = parser.parse_args()
+
+    main(args.source, args.outfilename)
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3.13
+
+"""
+Small local http server for the figures. The explosion data is loaded (and enriched) once and kept in memory;
+every figure is an endpoint taking filter parameters, e.g.
+
+    http://localhost:8050/year_bars?state=US,USSR&years=1950-1963&type=A,AS&purpose=WR
+    http://localhost:8050/locations?near=37.1,-116.0,100        (within 100 km of a site)
+    http://localhost:8050/locations?bbox=30,50,-125,-100         (map viewport)
+
+Endpoints: /locations, /regions, /hob, /pies, /year_bars, /timeline (html; add format=json for plotly json).
+Responses are kept in a bounded LRU cache and carry an ETag, so repeated queries are not rebuilt.
+/metrics serves requests, response bytes and build stage durations in the Prometheus text format (see metrics.py).
+
+usage: server.py [-h] -i INFILENAME [-p PORT] [--host HOST] [--cache-size CACHESIZE] [-j COUNTRYREGIONJSON]
+"""
+
+import argparse
+import collections
+import functools
+import hashlib
+import http.server
+import threading
+import urllib.parse
+
+import helpers
+import metrics
+import spatial_index
+import trace_groups
+
+FIGURES_ = {
+    "locations" : "plot_explosion_locations",
+    "regions" : "plot_region_piechart_map",
+    "hob" : "plot_HOB",
+    "pies" : "plot_pies",
+    "year_bars" : "plot_year_bars",
+    "timeline" : "plot_timeline",
+}
+
+PLOTLYJS_URL_ = "/plotly.min.js"
+
+METRICS_URL_ = "/metrics"
+
+
+class LRUCache:
+    """Bounded, thread-safe least-recently-used cache."""
+
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+def parse_filters(query):
+    """Parses filter parameters of a query string.
+    Parameters
+    ---------
+        query : dict
+            parsed query (from urllib.parse.parse_qs)
+    Returns
+    -------
+    dict with keys states, years, types, purposes (see helpers.filter_events), near and bbox 
+    (see spatial_index.select_events)
+    """
+    def get_list(key):
+        values = [v for q in query.get(key, []) for v in q.split(",") if v != ""]
+        return tuple(sorted(set(values))) if values else None
+
+    years = query.get("years", [None])[-1]
+    near = query.get("near", [None])[-1]
+    bbox = query.get("bbox", [None])[-1]
+
+    return {
+        "states" : get_list("state"),
+        "years" : helpers.parse_years(years) if years else None,
+        "types" : get_list("type"),
+        "purposes" : get_list("purpose"),
+        "near" : spatial_index.parse_near(near) if near else None,
+        "bbox" : spatial_index.parse_bbox(bbox) if bbox else None,
+    }
+
+
+def build_figure(df, figure, filters, country_region_json=None, index=None):
+    """Builds figure for the filtered data.
+    Parameters
+    ---------
+        df : pd.Dataframe
+            enriched explosion data
+        figure : str
+            endpoint name (key of FIGURES_)
+        filters : dict
+            see parse_filters
+        country_region_json : str
+            region lookup for the region map (None for the shipped lookup)
+        index : spatial_index.SpatialIndex
+            index built from df (for near/bbox filters)
+    Returns
+    -------
+    go.Figure, or None if no explosions match the filters
+    """
+    import importlib
+
+    filters = dict(filters)
+    dff = spatial_index.select_events(df, index=index, near=filters.pop("near", None), bbox=filters.pop("bbox", None))
+    dff = helpers.filter_events(dff, **filters)
+    if len(dff) == 0:
+        return None
+
+    module = importlib.import_module(FIGURES_[figure])
+    if figure == "regions":
+        return module.make_figure(dff, country_region_json)
+    return module.make_figure(dff)
+
+
+def make_handler(df, cache, country_region_json=None, index=None):
+    """Makes request handler class serving the figures of the dataframe.
+    Parameters
+    ---------
+        df : pd.Dataframe
+            enriched explosion data
+        cache : LRUCache
+            response cache
+        country_region_json : str
+            region lookup for the region map (None for the shipped lookup)
+        index : spatial_index.SpatialIndex
+            index built from df (for near/bbox filters)
+    """
+
+    class FigureRequestHandler(http.server.BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            url = urllib.parse.urlsplit(self.path)
+            name = url.path.strip("/")
+            # endpoint label of the metrics (not the raw path, to keep the number of series bounded)
+            endpoint = name if name in FIGURES_ or url.path in [PLOTLYJS_URL_, METRICS_URL_] else ("index" if name == "" else "other")
+
+            self.endpoint, self.status = endpoint, None
+            with metrics.timer("figures_request_seconds", endpoint=endpoint):
+                self.handle_get(url, name)
+            metrics.inc("figures_requests_total", endpoint=endpoint, status=str(self.status))
+
+        def send_response(self, code, message=None):
+            self.status = code
+            super().send_response(code, message)
+
+        def handle_get(self, url, name):
+            if url.path == PLOTLYJS_URL_:
+                return self.send_body(get_plotlyjs(), "application/javascript", etag=None)
+            if url.path == METRICS_URL_:
+                return self.send_body(metrics.REGISTRY_.to_prometheus().encode(), "text/plain; version=0.0.4", etag=None, max_age=0)
+            if name == "":
+                links = "".join([f'<li><a href="/{f}">{f}</a></li>' for f in FIGURES_])
+                return self.send_body(f"<ul>{links}</ul>".encode(), "text/html", etag=None)
+            if name not in FIGURES_:
+                return self.send_error(404, f"Unknown figure '{name}'.")
+
+            query = urllib.parse.parse_qs(url.query)
+            try:
+                filters = parse_filters(query)
+            except ValueError as e:
+                return self.send_error(400, str(e))
+            fmt = query.get("format", ["html"])[-1]
+            if fmt not in ["html", "json"]:
+                return self.send_error(400, f"Unknown format '{fmt}'.")
+
+            key = (name, fmt) + tuple(sorted(filters.items()))
+            cached = cache.get(key)
+            metrics.inc("figures_response_cache_total", endpoint=name, result="miss" if cached is None else "hit")
+            if cached is None:
+                try:
+                    with metrics.timer("figures_build_seconds", figure=name):
+                        fig = build_figure(df, name, filters, country_region_json, index)
+                except Exception as e:
+                    return self.send_error(500, f"Could not build figure: {e}")
+                if fig is None:
+                    return self.send_error(404, "No explosions match the filters.")
+                if fmt == "json":
+                    body, content_type = fig.to_json().encode(), "application/json"
+                else:
+                    post_script = trace_groups.TRACE_GROUPS_JS_ + f"enableTraceGroups(document.getElementById('{name}'));" \
+                        if trace_groups.needs_page_script(fig) else None
+                    body, content_type = fig.to_html(include_plotlyjs=PLOTLYJS_URL_, div_id=name, post_script=post_script).encode(), "text/html"
+                cached = (body, content_type, f'"{hashlib.sha1(body).hexdigest()[:20]}"')
+                cache.put(key, cached)
+
+            body, content_type, etag = cached
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self.send_body(body, content_type, etag)
+
+        def send_body(self, body, content_type, etag, max_age=86400):
+            self.send_response(200)
+            self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            if etag is not None:
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", "no-cache")
+            elif max_age:
+                self.send_header("Cache-Control", f"max-age={max_age}")
+            else:
+                self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            self.wfile.write(body)
+            metrics.inc("figures_response_bytes_total", len(body), endpoint=self.endpoint)
+
+    return FigureRequestHandler
+
+
+@functools.lru_cache(maxsize=1)
+def get_plotlyjs():
+    """Returns plotly.js (bundled with plotly) as bytes."""
+    from plotly.offline import get_plotlyjs as get_js
+    return get_js().encode()
+
+
+def main(infilename, port, host, cache_size, country_region_json=None):
+    """Main.
+    Parameters
+    ---------
+        infilename : str
+            filename of pickled pd.Dataframe
+        port : int
+            port to listen on
+        host : str
+            interface to listen on
+        cache_size : int
+            maximal number of cached responses
+        country_region_json : str
+            region lookup for the region map (None for the shipped lookup)
+    """
+    df = helpers.load_pkl(infilename)
+    df = helpers.add_derived_columns(df)
+
+    index = spatial_index.SpatialIndex.from_df(df)
+
+    handler = make_handler(df, LRUCache(cache_size), country_region_json, index)
+    server = http.server.ThreadingHTTPServer((host, port), handler)
+    print(f"[INFO] Serving {len(df)} explosions on http://{host}:{port}/ (Ctrl+C to stop).")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--infilename", help="infilename", required=True)
+    parser.add_argument("-p", "--port", help="port", type=int, default=8050)
+    parser.add_argument("--host", help="interface to listen on", default="127.0.0.1")
+    parser.add_argument("--cache-size", help="maximal number of cached responses", type=int, default=64)
+    parser.add_argument("-j", "--countryregionjson", help="json that maps states to region (defaults to the lookup shipped with the project)", default=None)
+
+    args = parser.parse_args()
+
+    main(args.infilename, args.port, args.host, args.cache_size, args.countryregionjson)
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3.13
+
+"""
+Search index over shot names, built once from the loaded data.
+
+Every explosion is indexed under its SHOTNAME and its alternate names (parts separated by "/" or ";", names in
+parentheses, and the comma-separated names of an ALTNAMES column if the data has one). Names are normalized
+(lower case, single spaces) and kept in one sorted array, so exact and prefix lookups are two binary searches.
+Every match gives the row of the explosion, its site (unique LAT/LONG) and year.
+
+The index is also written as compact json (sorted keys, rows, sites, years), e.g. for the search box of the
+location map (plot_explosion_locations.py --search).
+
+e.g.:  index = ShotIndex.from_df(df)
+       rows = index.prefix("castle")          # positions (df.iloc) of explosions named Castle ...
+
+usage: shot_index.py [-h] -i INFILENAME [-q QUERY] [-n LIMIT] [-o OUTFILENAME] [--state STATE] [--years YEARS] [--type TYPE] [--purpose PURPOSE]
+"""
+
+import argparse
+import bisect
+import json
+import re
+
+import numpy as np
+import pandas as pd
+
+import helpers
+
+# Separators of alternate names within SHOTNAME
+ALT_NAME_SEPARATORS_ = r"[/;()]"
+
+SEARCH_SCRIPT_ = """
+(function() {
+    const gd = document.getElementById('{plot_id}');
+    const index = SHOT_INDEX_;
+    const box = document.createElement('div');
+    box.style.cssText = 'position:absolute; top:8px; right:8px; z-index:10; font:14px sans-serif;';
+    box.innerHTML = '<input type="search" placeholder="Search shot name" style="width:14em; padding:3px">'
+        + '<div style="background:white; max-height:20em; overflow-y:auto"></div>';
+    gd.style.position = 'relative';
+    gd.appendChild(box);
+    const input = box.firstChild, results = box.lastChild;
+
+    function lowerBound(q) {
+        let lo = 0, hi = index.keys.length;
+        while (lo < hi) { const mid = (lo + hi) >> 1; if (index.keys[mid] < q) lo = mid + 1; else hi = mid; }
+        return lo;
+    }
+
+    function show(row) {
+        const site = index.sites[index.site[row]];
+        const trace = {type: 'scattermap', lat: [site[0]], lon: [site[1]], mode: 'markers', hoverinfo: 'skip',
+            marker: {size: 24, color: '#ffff00', opacity: 0.7}, name: index.names[row], showlegend: false};
+        const k = gd.data.findIndex(t => t.meta === 'search');
+        if (k < 0) Plotly.addTraces(gd, Object.assign({meta: 'search'}, trace));
+        else Plotly.restyle(gd, {lat: [trace.lat], lon: [trace.lon], name: trace.name}, [k]);
+        Plotly.relayout(gd, {'map.center': {lat: site[0], lon: site[1]}, 'map.zoom': 7});
+    }
+
+    input.addEventListener('input', () => {
+        const q = input.value.toLowerCase().trim().replace(/\\s+/g, ' ');
+        results.innerHTML = '';
+        if (!q) return;
+        const rows = [];
+        for (let i = lowerBound(q); i < index.keys.length && index.keys[i].startsWith(q) && rows.length < 10; i++) {
+            if (index.site[index.rows[i]] >= 0 && !rows.includes(index.rows[i])) rows.push(index.rows[i]);
+        }
+        for (const row of rows) {
+            const item = document.createElement('div');
+            item.textContent = `${index.names[row]} (${index.states[row]}, ${index.years[row]})`;
+            item.style.cssText = 'padding:2px 4px; cursor:pointer';
+            item.onclick = () => show(row);
+            results.appendChild(item);
+        }
+    });
+})();
+"""
+
+
+def normalize(name):
+    """Normalizes name for lookups (lower case, single spaces)."""
+    return " ".join(str(name).lower().split())
+
+
+def split_names(shotname, altnames=None):
+    """Names of an explosion: full name, its parts separated by ALT_NAME_SEPARATORS_ and alternate names.
+    Parameters
+    ---------
+        shotname : str
+            SHOTNAME (may be None/NaN)
+        altnames : str
+            comma-separated alternate names (may be None/NaN)
+    Returns
+    -------
+    list of normalized names (unique, non-empty)
+    """
+    names = []
+    if isinstance(shotname, str):
+        names += [shotname] + re.split(ALT_NAME_SEPARATORS_, shotname)
+    if isinstance(altnames, str):
+        names += altnames.split(",")
+    return list(dict.fromkeys(n for n in map(normalize, names) if n))
+
+
+class ShotIndex:
+    """Sorted array of normalized shot names -> rows, with site and year of every row."""
+
+    def __init__(self, names, states, years, lat, lon, altnames=None):
+        """Builds index.
+        Parameters
+        ---------
+            names : list of str
+                SHOTNAME of every explosion
+            states : list of str
+                STATE of every explosion
+            years : array of int
+                YEAR of every explosion
+            lat, lon : array of float
+                coordinates [deg] of every explosion
+            altnames : list of str
+                comma-separated alternate names of every explosion (None if not available)
+        """
+        n = len(names)
+        self.names = [x if isinstance(x, str) else "n/a" for x in names]
+        self.states = [str(s) for s in states]
+        self.years = np.nan_to_num(np.asarray(years, dtype=float), nan=0).astype(int)
+
+        lat, lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+        known = ~(np.isnan(lat) | np.isnan(lon))
+        self.site = np.full(n, -1, dtype=np.int64)
+        codes, sites = pd.factorize(pd.MultiIndex.from_arrays([lat[known], lon[known]]))
+        self.site[known] = codes
+        self.sites = np.array(list(sites), dtype=float).reshape(-1, 2)
+
+        altnames = altnames if altnames is not None else [None] * n
+        pairs = sorted((key, row) for row, (name, alt) in enumerate(zip(names, altnames)) for key in split_names(name, alt))
+        self.keys = [key for (key, _) in pairs]
+        self.rows = np.array([row for (_, row) in pairs], dtype=np.int64)
+
+    @classmethod
+    def from_df(cls, df):
+        """Builds index from explosion data (SHOTNAME, STATE, YEAR, LAT, LONG and ALTNAMES if present)."""
+        altnames = df["ALTNAMES"].tolist() if "ALTNAMES" in df.columns else None
+        return cls(df.SHOTNAME.tolist(), df.STATE.tolist(), df.YEAR.to_numpy(), df.LAT.to_numpy(), df.LONG.to_numpy(), altnames=altnames)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _unique_rows(self, lo, hi, limit=None):
+        """Rows of keys[lo:hi] in key order, without repetitions."""
+        rows = list(dict.fromkeys(self.rows[lo:hi].tolist()))
+        return np.array(rows[:limit], dtype=np.int64)
+
+    def lookup(self, name):
+        """Rows of explosions with this (full or alternate) name, case-insensitive.
+        Returns
+        -------
+        np.ndarray of row positions
+        """
+        key = normalize(name)
+        return self._unique_rows(bisect.bisect_left(self.keys, key), bisect.bisect_right(self.keys, key))
+
+    def prefix(self, query, limit=None):
+        """Rows of explosions with a (full or alternate) name starting with query, case-insensitive, in name order.
+        Parameters
+        ---------
+            query : str
+                beginning of the name
+            limit : int
+                maximal number of rows (None for all)
+        Returns
+        -------
+        np.ndarray of row positions
+        """
+        key = normalize(query)
+        return self._unique_rows(bisect.bisect_left(self.keys, key), bisect.bisect_left(self.keys, key + "\U0010ffff"), limit=limit)
+
+    def describe(self, rows):
+        """Name, state, year and site of rows.
+        Returns
+        -------
+        pd.DataFrame with columns ROW, SHOTNAME, STATE, YEAR, LAT, LONG
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        site = self.site[rows]
+        coords = np.full((len(rows), 2), np.nan)
+        coords[site >= 0] = self.sites[site[site >= 0]]
+        return pd.DataFrame({
+            "ROW" : rows,
+            "SHOTNAME" : [self.names[r] for r in rows],
+            "STATE" : [self.states[r] for r in rows],
+            "YEAR" : self.years[rows],
+            "LAT" : coords[:, 0],
+            "LONG" : coords[:, 1],
+        })
+
+    def to_dict(self):
+        """Compact json form: sorted keys with their rows, and names, states, years and site of every row."""
+        return {
+            "keys" : self.keys,
+            "rows" : self.rows.tolist(),
+            "names" : self.names,
+            "states" : self.states,
+            "years" : self.years.tolist(),
+            "site" : self.site.tolist(),
+            "sites" : [[round(lat, 5), round(lon, 5)] for (lat, lon) in self.sites.tolist()],
+        }
+
+    def write_json(self, outfilename):
+        """Writes compact json form (see to_dict)."""
+        with open(outfilename, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, separators=(",", ":"), ensure_ascii=False)
+        print(f"[INFO] Saved search index of {len(self)} names as {outfilename}.")
+
+
+def make_search_script(index):
+    """Makes post_script for the html location map: search box with prefix lookup in the embedded index, which
+    highlights the site of the chosen shot and zooms to it.
+    Parameters
+    ---------
+        index : ShotIndex
+            index of the explosions on the map
+    Returns
+    -------
+    str (javascript, {plot_id} is replaced by the div id)
+    """
+    data = json.dumps(index.to_dict(), separators=(",", ":")).replace("</", "<\\/")
+    return SEARCH_SCRIPT_.replace("SHOT_INDEX_", data)
+
+
+def main(infilename, queries=None, limit=20, outfilename=None, filters=None):
+    """Main.
+    Parameters
+    ---------
+        infilename : str
+            filename of pickled pd.Dataframe
+        queries : list of str
+            name prefixes to look up (results are printed)
+        limit : int
+            maximal number of results per query
+        outfilename : str
+            json file for the index (None: not written)
+        filters : dict
+            only explosions selected by these filters are loaded (see helpers.load_events, helpers.make_filters)
+    """
+    df = helpers.load_events(infilename, **(filters or {}))
+    index = ShotIndex.from_df(df)
+    print(f"[INFO] Indexed {len(index)} names of {len(df)} explosions.")
+
+    for query in (queries or []):
+        rows = index.prefix(query, limit=limit)
+        print(f"[INFO] {len(rows)} match(es) for '{query}'{' (limited)' if len(rows) == limit else ''}:")
+        if len(rows):
+            print(index.describe(rows).to_string(index=False))
+
+    if outfilename:
+        index.write_json(outfilename)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--infilename", help="infilename", required=True)
+    parser.add_argument("-q", "--query", help="print explosions with a name starting with QUERY (case-insensitive, repeatable)", action="append", default=None)
+    parser.add_argument("-n", "--limit", help="maximal number of results per query", type=int, default=20)
+    parser.add_argument("-o", "--outfilename", help="write the index as json", default=None)
+
+    helpers.add_filter_arguments(parser)
+    args = parser.parse_args()
+    try:
+        filters = helpers.make_filters(args.state, args.years, args.type, args.purpose)
+    except ValueError as e:
+        parser.error(str(e))
+
+    main(args.infilename, queries=args.query, limit=args.limit, outfilename=args.outfilename, filters=filters)
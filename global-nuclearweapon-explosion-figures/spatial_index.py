@@ -0,0 +1,260 @@
+"""
+Code snippet for a spatial index over explosion coordinates (LAT/LONG), built once from the loaded data.
+
+Points are sorted into a regular latitude/longitude grid (cell key -> contiguous range of points), so
+radius, k-nearest and bounding-box queries only look at the points of the cells they touch.
+Distances are great-circle distances (on a sphere with the mean earth radius).
+
+e.g.:  index = SpatialIndex.from_df(df)
+       rows = index.query_radius(37.1, -116.0, 50)[0]     # positions (df.iloc) within 50 km
+"""
+
+import numpy as np
+
+EARTH_RADIUS_KM_ = 6371.0088
+
+
+def to_unit_vectors(lat, lon):
+    """Converts latitudes and longitudes [deg] to unit vectors (n x 3)."""
+    lat, lon = np.radians(np.asarray(lat, dtype=float)), np.radians(np.asarray(lon, dtype=float))
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def great_circle_km(xyz, q):
+    """Great-circle distances [km] between unit vectors xyz (n x 3) and the unit vector q."""
+    chord = np.linalg.norm(xyz - q, axis=-1)
+    return 2 * EARTH_RADIUS_KM_ * np.arcsin(np.clip(chord / 2, 0, 1))
+
+
+def parse_bbox(s):
+    """Parses bounding box "LATMIN,LATMAX,LONMIN,LONMAX" (LONMIN > LONMAX crosses the date line).
+    Returns
+    -------
+    (lat_min, lat_max, lon_min, lon_max)
+    """
+    try:
+        lat_min, lat_max, lon_min, lon_max = [float(x) for x in s.split(",")]
+    except ValueError:
+        raise ValueError(f"Invalid bounding box '{s}' (expected LATMIN,LATMAX,LONMIN,LONMAX).")
+    if not (-90 <= lat_min <= lat_max <= 90) or not (-180 <= lon_min <= 180 and -180 <= lon_max <= 180):
+        raise ValueError(f"Invalid bounding box '{s}' (latitudes in [-90, 90], longitudes in [-180, 180]).")
+    return (lat_min, lat_max, lon_min, lon_max)
+
+
+def parse_near(s):
+    """Parses radius query "LAT,LON,KM".
+    Returns
+    -------
+    (lat, lon, radius_km)
+    """
+    try:
+        lat, lon, radius_km = [float(x) for x in s.split(",")]
+    except ValueError:
+        raise ValueError(f"Invalid radius query '{s}' (expected LAT,LON,KM).")
+    if not (-90 <= lat <= 90) or radius_km < 0:
+        raise ValueError(f"Invalid radius query '{s}' (latitude in [-90, 90], radius >= 0).")
+    return (lat, lon, radius_km)
+
+
+class SpatialIndex:
+    """Grid index over points on the sphere."""
+
+    def __init__(self, lat, lon, cell_deg=1.0):
+        """Builds the index.
+        Parameters
+        ---------
+            lat, lon : array-like
+                coordinates [deg] of the points; points with missing coordinates are not indexed
+            cell_deg : float
+                edge length of grid cells [deg]
+        """
+        lat, lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+        valid = np.flatnonzero(np.isfinite(lat) & np.isfinite(lon))
+
+        self.cell_deg = cell_deg
+        self.n_rows = int(np.ceil(180 / cell_deg))
+        self.n_cols = int(np.ceil(360 / cell_deg))
+
+        keys = self._cell_keys(lat[valid], lon[valid])
+        order = np.argsort(keys, kind="stable")
+        self.positions = valid[order]
+        self.lat, self.lon = lat[self.positions], lon[self.positions]
+        self.xyz = to_unit_vectors(self.lat, self.lon)
+
+        # cell key -> range [start, end) of points
+        sorted_keys = keys[order]
+        self.keys, self.starts = np.unique(sorted_keys, return_index=True)
+        self.ends = np.append(self.starts[1:], len(sorted_keys))
+
+    @classmethod
+    def from_df(cls, df, cell_deg=1.0):
+        """Builds the index over the LAT/LONG columns of a dataframe (query results are df.iloc positions)."""
+        return cls(df.LAT.to_numpy(dtype=float), df.LONG.to_numpy(dtype=float), cell_deg=cell_deg)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def _rows(self, lat):
+        return np.clip(((np.asarray(lat) + 90) // self.cell_deg).astype(int), 0, self.n_rows - 1)
+
+    def _cols(self, lon):
+        return (((np.asarray(lon) + 180) // self.cell_deg).astype(int)) % self.n_cols
+
+    def _cell_keys(self, lat, lon):
+        return self._rows(lat) * self.n_cols + self._cols(lon)
+
+    def _candidates(self, lat_min, lat_max, lon_min, lon_max):
+        """Indices (into the sorted points) of all points in cells touching the box."""
+        if len(self.keys) == 0:
+            return np.array([], dtype=np.int64)
+        rows = np.arange(self._rows(lat_min), self._rows(lat_max) + 1)
+        if lon_max - lon_min >= 360:
+            cols = np.arange(self.n_cols)
+        else:
+            c0, c1 = self._cols(lon_min), self._cols(lon_max)
+            cols = np.arange(c0, c1 + 1) if c0 <= c1 else np.concatenate([np.arange(c0, self.n_cols), np.arange(0, c1 + 1)])
+
+        cells = (rows[:, None] * self.n_cols + cols[None, :]).ravel()
+        found = np.minimum(np.searchsorted(self.keys, cells), len(self.keys) - 1)
+        found = found[self.keys[found] == cells]
+        if len(found) == 0:
+            return np.array([], dtype=np.int64)
+
+        # concatenate the ranges [start, end) of the found cells without a python loop
+        lengths = self.ends[found] - self.starts[found]
+        offsets = np.repeat(self.starts[found] - np.cumsum(lengths) + lengths, lengths)
+        return offsets + np.arange(lengths.sum())
+
+    def query_bbox(self, lat_min, lat_max, lon_min, lon_max):
+        """Points inside bounding boxes (batch: arrays of equal length).
+        Parameters
+        ---------
+            lat_min, lat_max, lon_min, lon_max : float or array-like
+                bounding boxes [deg]; lon_min > lon_max crosses the date line
+        Returns
+        -------
+        list (one per box) of arrays of point positions
+        """
+        boxes = np.broadcast_arrays(*[np.atleast_1d(np.asarray(x, dtype=float)) for x in [lat_min, lat_max, lon_min, lon_max]])
+        results = []
+        for (la0, la1, lo0, lo1) in zip(*boxes):
+            c = self._candidates(la0, la1, lo0, lo1)
+            lat, lon = self.lat[c], self.lon[c]
+            in_lon = (lon >= lo0) & (lon <= lo1) if lo0 <= lo1 else (lon >= lo0) | (lon <= lo1)
+            results += [np.sort(self.positions[c[(lat >= la0) & (lat <= la1) & in_lon]])]
+        return results
+
+    def _cap_box(self, lat, lon, radius_km):
+        """Bounding box of a spherical cap."""
+        dlat = np.degrees(radius_km / EARTH_RADIUS_KM_)
+        lat_min, lat_max = lat - dlat, lat + dlat
+        if lat_min <= -90 or lat_max >= 90 or dlat >= 90:
+            return (max(lat_min, -90), min(lat_max, 90), -180, 180)
+        dlon = np.degrees(np.arcsin(min(np.sin(np.radians(dlat)) / np.cos(np.radians(lat)), 1)))
+        if dlon >= 180:
+            return (lat_min, lat_max, -180, 180)
+        return (lat_min, lat_max, (lon - dlon + 180) % 360 - 180, (lon + dlon + 180) % 360 - 180)
+
+    def query_radius(self, lat, lon, radius_km, return_distance=False):
+        """Points within a great-circle distance (batch: arrays of equal length).
+        Parameters
+        ---------
+            lat, lon : float or array-like
+                query points [deg]
+            radius_km : float or array-like
+                radius [km]
+            return_distance : bool
+                if True, distances [km] are returned as well
+        Returns
+        -------
+        list (one per query point) of arrays of point positions (sorted by distance),
+        and list of arrays of distances if return_distance
+        """
+        queries = np.broadcast_arrays(*[np.atleast_1d(np.asarray(x, dtype=float)) for x in [lat, lon, radius_km]])
+        q_xyz = to_unit_vectors(queries[0], queries[1])
+
+        results, distances = [], []
+        for (la, lo, r), q in zip(zip(*queries), q_xyz):
+            c = self._candidates(*self._cap_box(la, lo, r))
+            d = great_circle_km(self.xyz[c], q)
+            inside = np.flatnonzero(d <= r)
+            inside = inside[np.argsort(d[inside], kind="stable")]
+            results += [self.positions[c[inside]]]
+            distances += [d[inside]]
+
+        if return_distance:
+            return results, distances
+        return results
+
+    def query_knn(self, lat, lon, k=1, return_distance=False):
+        """k nearest points (batch: arrays of equal length).
+        The search radius starts at one cell and doubles until at least k points are inside.
+        Parameters
+        ---------
+            lat, lon : float or array-like
+                query points [deg]
+            k : int
+                number of neighbours
+            return_distance : bool
+                if True, distances [km] are returned as well
+        Returns
+        -------
+        list (one per query point) of arrays of point positions (sorted by distance),
+        and list of arrays of distances if return_distance
+        """
+        queries = np.broadcast_arrays(*[np.atleast_1d(np.asarray(x, dtype=float)) for x in [lat, lon]])
+        q_xyz = to_unit_vectors(*queries)
+        k = min(k, len(self))
+        max_radius = np.pi * EARTH_RADIUS_KM_
+
+        results, distances = [], []
+        for (la, lo), q in zip(zip(*queries), q_xyz):
+            radius = np.radians(self.cell_deg) * EARTH_RADIUS_KM_
+            while True:
+                c = self._candidates(*self._cap_box(la, lo, radius))
+                d = great_circle_km(self.xyz[c], q)
+                inside = np.flatnonzero(d <= radius)
+                if len(inside) >= k or radius >= max_radius:
+                    break
+                radius = min(2 * radius, max_radius)
+            nearest = inside[np.argsort(d[inside], kind="stable")[:k]]
+            results += [self.positions[c[nearest]]]
+            distances += [d[nearest]]
+
+        if return_distance:
+            return results, distances
+        return results
+
+
+def select_events(df, index=None, near=None, bbox=None):
+    """Selects explosions near a site and/or inside a map viewport.
+    Parameters
+    ---------
+        df : pd.Dataframe
+            explosion data
+        index : SpatialIndex
+            index built from df (built here if None)
+        near : tuple
+            (lat, lon, radius_km), see parse_near
+        bbox : tuple
+            (lat_min, lat_max, lon_min, lon_max), see parse_bbox
+    Returns
+    -------
+    pd.Dataframe (rows in original order)
+    """
+    if near is None and bbox is None:
+        return df
+    if index is None:
+        index = SpatialIndex.from_df(df)
+
+    mask = np.ones(len(df), dtype=bool)
+    if near is not None:
+        selected = np.zeros(len(df), dtype=bool)
+        selected[index.query_radius(*near)[0]] = True
+        mask &= selected
+    if bbox is not None:
+        selected = np.zeros(len(df), dtype=bool)
+        selected[index.query_bbox(*bbox)[0]] = True
+        mask &= selected
+
+    return df.iloc[np.flatnonzero(mask)]
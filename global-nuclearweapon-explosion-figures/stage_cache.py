@@ -0,0 +1,291 @@
+#!/usr/bin/env python3.13
+
+"""
+On-disk cache of pipeline stage outputs (loaded explosions, derived columns, aggregates), so that builds which
+only change the plotting layout start from the cached intermediates instead of loading, enriching and
+aggregating again.
+
+Every entry is keyed by its upstream input (content hash of the input file or of the input dataframe), its
+arguments and the version of the stage code (hash of the source of the stage function and of the project
+functions and constants it uses, see code_version), so changed data or changed stage code never reuse stale
+entries. Dataframes are stored as parquet (if pyarrow or fastparquet is installed), everything else (and frames
+parquet cannot hold) as pickle.
+
+The cache is off unless enabled, e.g. with --stage-cache DIR (all scripts) or stage_cache.enable(DIR).
+
+usage: stage_cache.py [-h] -d DIRECTORY [--clear]
+"""
+
+import argparse
+import ast
+import hashlib
+import inspect
+import os
+import os.path
+import pickle
+import sys
+import threading
+import time
+
+import metrics
+
+# Cache used by the stages (None: off)
+ACTIVE_ = None
+
+
+class StageCache:
+    """Directory of stage outputs (<stage>-<key>.parquet or .pkl)."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def _filenames(self, stage, key):
+        base = os.path.join(self.directory, f"{stage}-{key}")
+        return f"{base}.parquet", f"{base}.pkl"
+
+    def get(self, stage, key):
+        """Cached output of a stage, or None."""
+        parquetfilename, pklfilename = self._filenames(stage, key)
+        try:
+            if os.path.isfile(parquetfilename):
+                import pandas as pd
+                return pd.read_parquet(parquetfilename)
+            if os.path.isfile(pklfilename):
+                with open(pklfilename, 'rb') as f:
+                    return pickle.load(f)
+        except Exception as e:
+            print(f"[WARNING] Could not read stage cache entry {stage}-{key} ({type(e).__name__}: {e}), recomputing.")
+        return None
+
+    def put(self, stage, key, value):
+        """Stores output of a stage (atomically, concurrent builds may share the cache)."""
+        parquetfilename, pklfilename = self._filenames(stage, key)
+        if is_columnar(value):
+            tmpfilename = f"{parquetfilename}.{os.getpid()}.tmp"
+            try:
+                value.to_parquet(tmpfilename)
+                os.replace(tmpfilename, parquetfilename)
+                return
+            except Exception:
+                # no parquet engine, or columns parquet cannot hold
+                if os.path.isfile(tmpfilename):
+                    os.remove(tmpfilename)
+
+        tmpfilename = f"{pklfilename}.{os.getpid()}.tmp"
+        with open(tmpfilename, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpfilename, pklfilename)
+
+    def run(self, stage, key, compute):
+        """Cached output of a stage, computed (and stored) if there is none.
+        Parameters
+        ---------
+            stage : str
+                stage name
+            key : str
+                key of the output (see make_key)
+            compute : function
+                computes the output (no arguments)
+        """
+        value = self.get(stage, key)
+        if value is not None:
+            with self._lock:
+                self.stats["hits"] += 1
+            metrics.inc("figures_stage_cache_total", stage=stage, result="hit")
+            return value
+
+        with self._lock:
+            self.stats["misses"] += 1
+        metrics.inc("figures_stage_cache_total", stage=stage, result="miss")
+        value = compute()
+        self.put(stage, key, value)
+        return value
+
+    def entries(self):
+        """Entries as list of (filename, bytes, mtime), oldest first."""
+        entries = []
+        for name in os.listdir(self.directory):
+            filename = os.path.join(self.directory, name)
+            if name.endswith((".parquet", ".pkl")) and os.path.isfile(filename):
+                entries += [(name, os.path.getsize(filename), os.path.getmtime(filename))]
+        return sorted(entries, key=lambda e: e[2])
+
+    def clear(self):
+        """Removes all entries."""
+        for (name, _, _) in self.entries():
+            os.remove(os.path.join(self.directory, name))
+
+
+def is_columnar(value):
+    """Whether value is a dataframe that round-trips through parquet unchanged (object columns only with strings)."""
+    import pandas as pd
+
+    if not isinstance(value, pd.DataFrame):
+        return False
+    for col in value.columns:
+        if value[col].dtype == object and pd.api.types.infer_dtype(value[col], skipna=True) not in ("string", "empty"):
+            return False
+    return True
+
+
+def enable(directory):
+    """Enables the stage cache in directory (created if needed) for all stages of this process."""
+    global ACTIVE_
+    ACTIVE_ = StageCache(directory)
+    return ACTIVE_
+
+
+def disable():
+    """Disables the stage cache."""
+    global ACTIVE_
+    ACTIVE_ = None
+
+
+def get_active():
+    """Enabled stage cache, or None."""
+    return ACTIVE_
+
+
+def code_version(*funcs):
+    """Version of stage code: hash of the source of the functions (unwrapped from decorators) and of everything
+    of this project they use, i.e. the functions they call (recursively, also through modules, e.g.
+    parallel.map_partitions) and the definitions of the module constants they read (e.g. YIELD_BINS_).
+    """
+    h = hashlib.sha1()
+    for func in funcs:
+        h.update(_code_version(inspect.unwrap(func)).encode())
+    return h.hexdigest()[:16]
+
+
+# Function -> version (see code_version), sources do not change while a process runs
+_CODE_VERSIONS_ = {}
+
+# Module name -> assignments (see _module_assignments)
+_MODULE_ASSIGNMENTS_ = {}
+
+# Directory of the project modules (functions and modules elsewhere, e.g. pandas, are not followed)
+_PROJECT_DIR_ = os.path.dirname(os.path.abspath(__file__))
+
+
+def _code_version(func):
+    """Version of one function and its project dependencies (see code_version)."""
+    if func not in _CODE_VERSIONS_:
+        h = hashlib.sha1()
+        for (name, source) in sorted(_collect_sources(func, {}).items()):
+            h.update(f"{name}\n{source}\n".encode())
+        _CODE_VERSIONS_[func] = h.hexdigest()
+    return _CODE_VERSIONS_[func]
+
+
+def _is_project(obj):
+    """Whether a function or module is defined in this project."""
+    filename = getattr(obj, "__file__", None) or getattr(getattr(obj, "__code__", None), "co_filename", None)
+    return filename is not None and os.path.dirname(os.path.abspath(filename)) == _PROJECT_DIR_
+
+
+def _code_names(code):
+    """Global and attribute names used by a code object and the code objects nested in it (lambdas, comprehensions)."""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= _code_names(const)
+    return names
+
+
+def _collect_sources(func, sources):
+    """Adds sources of func and of the project functions and constants it uses to sources (qualified name -> text)."""
+    name = f"{func.__module__}.{func.__qualname__}"
+    if name in sources:
+        return sources
+    try:
+        sources[name] = inspect.getsource(func)
+    except (OSError, TypeError):
+        sources[name] = name
+    if not hasattr(func, "__code__"):
+        return sources
+
+    names = _code_names(func.__code__)
+    namespaces = [(func.__module__, func.__globals__)]
+    for n in names:
+        obj = func.__globals__.get(n)
+        if inspect.ismodule(obj) and _is_project(obj):
+            namespaces += [(obj.__name__, vars(obj))]
+    for (module, namespace) in namespaces:
+        for n in sorted(names & set(namespace)):
+            obj = namespace[n]
+            if inspect.isfunction(obj):
+                obj = inspect.unwrap(obj)
+                if _is_project(obj):
+                    _collect_sources(obj, sources)
+            elif n in _module_assignments(module):
+                sources[f"{module}.{n}"] = _module_assignments(module)[n]
+    return sources
+
+
+def _module_assignments(module):
+    """Module level assignments of a project module as dict name -> source of the statement (constants are
+    versioned by their definition, not their current value, e.g. parallel.WORKERS_ is changed by set_workers).
+    """
+    if module not in _MODULE_ASSIGNMENTS_:
+        assignments = {}
+        try:
+            source = inspect.getsource(sys.modules[module])
+        except (KeyError, OSError, TypeError):
+            source = ""
+        for node in ast.parse(source).body:
+            if isinstance(node, (ast.Assign, ast.AnnAssign)):
+                targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+                for target in targets:
+                    if isinstance(target, ast.Name):
+                        assignments[target.id] = ast.get_source_segment(source, node)
+        _MODULE_ASSIGNMENTS_[module] = assignments
+    return _MODULE_ASSIGNMENTS_[module]
+
+
+def file_digest(filename, chunk_size=2**20):
+    """Content hash of a file."""
+    h = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def make_key(version, upstream, args=(), kwargs=None):
+    """Key of a stage output from the stage code version, the upstream input hash and the arguments."""
+    h = hashlib.sha1()
+    h.update(repr((version, upstream, args, sorted((kwargs or {}).items()))).encode())
+    return h.hexdigest()
+
+
+def main(directory, clear=False):
+    """Main.
+    Parameters
+    ---------
+        directory : str
+            cache directory
+        clear : bool
+            if True, remove all entries
+    """
+    cache = StageCache(directory)
+    entries = cache.entries()
+    for (name, size, mtime) in entries:
+        print(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(mtime))} {size/2**20:>9.2f} MB  {name}")
+    print(f"[INFO] {len(entries)} entries, {sum(e[1] for e in entries)/2**20:.2f} MB in {directory}.")
+    if clear:
+        cache.clear()
+        print(f"[INFO] Removed {len(entries)} entries.")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--directory", help="stage cache directory", required=True)
+    parser.add_argument("--clear", help="remove all entries", action="store_true")
+
+    args = parser.parse_args()
+
+    main(args.directory, clear=args.clear)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3.13
+
+"""
+Code snippet to make synthetic explosion data (same columns and codes as the real database), e.g. to check
+runtime and memory of the figure builders at a fixed size. Explosions are spread over a fixed number of sites,
+like the real tests; the same seed gives the same data.
+
+usage: synthetic_data.py [-h] -n NEVENTS -o OUTFILENAME [--seed SEED] [--sites NSITES]
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import helpers
+
+STATES_ = ["US", "USSR", "FR", "UK", "PRC", "IN", "PAK", "DPRK"]
+STATE_WEIGHTS_ = [.4, .35, .08, .04, .05, .03, .03, .02]
+
+STATE_REGIONS_ = {
+    "US" : ["Northern America", "Micronesia", "North Pacific Ocean", "South Atlantic Ocean"],
+    "USSR" : ["Central Asia", "Eastern Europe", "Arctic Ocean"],
+    "FR" : ["Northern Africa", "Micronesia"],
+    "UK" : ["Australia and New Zealand", "Micronesia", "Northern America"],
+    "PRC" : ["Eastern Asia"],
+    "IN" : ["Southern Asia"],
+    "PAK" : ["Southern Asia"],
+    "DPRK" : ["Eastern Asia"],
+}
+
+TYPES_ = ["UG-S", "A-AD", "AS-T", "UW-BG", "AH-R", "AX-R", "CR-S", "AW-BG", "UG-T?", "UG"]
+PURPOSES_ = ["WR", "PR", "I-CV", "FS", "WE", "SE", None, np.nan, "WR?", "JV"]
+
+
+def make_synthetic_events(n_events, seed=0, n_sites=300):
+    """Makes dataframe of synthetic explosions.
+    Parameters
+    ---------
+        n_events : int
+            number of explosions
+        seed : int
+            random seed
+        n_sites : int
+            number of test sites (locations)
+    Returns
+    -------
+    pd.Dataframe with the columns of the explosion database
+    """
+    rng = np.random.default_rng(seed)
+
+    # sites: location, state, region, type and purpose are fixed per site
+    site_state = rng.choice(STATES_, size=n_sites, p=STATE_WEIGHTS_).astype(object)
+    site_region = np.array([STATE_REGIONS_[s][rng.integers(len(STATE_REGIONS_[s]))] for s in site_state], dtype=object)
+    site_lat = np.round(rng.uniform(-60, 75, n_sites), 4)
+    site_lon = np.round(rng.uniform(-179, 179, n_sites), 4)
+    site_type = np.array(TYPES_, dtype=object)[rng.integers(len(TYPES_), size=n_sites)]
+    site_pur = np.array(PURPOSES_, dtype=object)[rng.integers(len(PURPOSES_), size=n_sites)]
+
+    site = rng.integers(n_sites, size=n_events)
+    year = rng.integers(1945, 2018, size=n_events)
+    datetime = pd.to_datetime({
+        "year" : year,
+        "month" : rng.integers(1, 13, size=n_events),
+        "day" : rng.integers(1, 28, size=n_events),
+        "hour" : rng.integers(0, 24, size=n_events),
+    })
+    datetime[rng.random(n_events) < .02] = pd.NaT
+
+    yields = rng.lognormal(2, 2, size=n_events)
+    yields[rng.random(n_events) < .05] = np.nan
+    hob = np.where(rng.random(n_events) < .01, rng.uniform(8000, 400000, size=n_events), rng.normal(0, 800, size=n_events))
+
+    df = pd.DataFrame({
+        "DATETIME" : datetime,
+        "YEAR" : year,
+        "STATE" : pd.Series(site_state[site], dtype=object),
+        "SHOTNAME" : pd.Series([f"Shot{k}" for k in range(n_events)], dtype=object),
+        "LAT" : site_lat[site],
+        "LONG" : site_lon[site],
+        "REGION" : pd.Series(site_region[site], dtype=object),
+        "TYPE" : pd.Series(site_type[site], dtype=object),
+        "PUR" : pd.Series(site_pur[site], dtype=object),
+        "YIELD" : yields,
+        "HOB" : hob,
+    })
+    df.loc[rng.choice(n_events, size=min(5, n_events), replace=False), "LAT"] = np.nan
+
+    return df
+
+
+def main(n_events, outfilename, seed=0, n_sites=300):
+    """Main.
+    Parameters
+    ---------
+        n_events : int
+            number of explosions
+        outfilename : str
+            filename for pickled pd.Dataframe
+        seed : int
+            random seed
+        n_sites : int
+            number of test sites (locations)
+    """
+    df = make_synthetic_events(n_events, seed=seed, n_sites=n_sites)
+    helpers.save_pkl(df, outfilename)
+    print(f"[INFO] Saved {len(df)} synthetic explosions at {n_sites} sites as {outfilename}.")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--nevents", help="number of explosions", type=int, required=True)
+    parser.add_argument("-o", "--outfilename", help="outfilename", required=True)
+    parser.add_argument("--seed", help="random seed", type=int, default=0)
+    parser.add_argument("--sites", help="number of test sites", type=int, default=300)
+
+    args = parser.parse_args()
+
+    main(args.nevents, args.outfilename, seed=args.seed, n_sites=args.sites)
@@ -0,0 +1,22 @@
+import os.path
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synthetic_data
+
+
+@pytest.fixture(scope="session")
+def events():
+    """Small synthetic explosion catalog (same seed, same data)."""
+    return synthetic_data.make_synthetic_events(500, seed=1, n_sites=40)
+
+
+@pytest.fixture(scope="session")
+def events_file(events, tmp_path_factory):
+    """The synthetic catalog as pickle file."""
+    filename = str(tmp_path_factory.mktemp("data") / "explosions.pkl")
+    events.to_pickle(filename)
+    return filename
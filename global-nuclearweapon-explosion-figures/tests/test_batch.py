@@ -0,0 +1,26 @@
+import json
+
+import batch
+
+
+def test_all_figures_built(events_file, tmp_path):
+    assert batch.main(events_file, str(tmp_path), by=["decade"], figures=["pies"], workers=1)
+    with open(tmp_path / "manifest.json") as f:
+        manifest = json.load(f)
+    assert all("file" in s["figures"]["pies"] for s in manifest["subsets"].values() if s["n_events"])
+
+
+def test_no_subsets_fails(events_file, tmp_path):
+    assert not batch.main(events_file, str(tmp_path), figures=["pies"], workers=1)
+
+
+def test_duplicate_subset_names_fail(events_file, tmp_path):
+    subsetfilename = tmp_path / "subsets.json"
+    subsetfilename.write_text(json.dumps([{"name": "US", "state": "US"}, {"name": "US", "years": "1950-1959"}]))
+    assert not batch.main(events_file, str(tmp_path), subsetfilename=str(subsetfilename), figures=["pies"], workers=1)
+
+
+def test_failed_figure_fails(events_file, tmp_path):
+    # region lookup that cannot be read: the region map fails, the pies are still built
+    assert not batch.main(events_file, str(tmp_path), by=["decade"], figures=["pies", "regions"], workers=1,
+        country_region_json=str(tmp_path / "missing.json"))
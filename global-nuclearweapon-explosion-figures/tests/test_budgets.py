@@ -0,0 +1,37 @@
+import json
+import os
+
+import pytest
+
+import check_budgets
+
+# Timings depend on the machine: the budget check itself only runs with FIGURES_CHECK_BUDGETS=1
+check_budgets_enabled = pytest.mark.skipif(os.environ.get("FIGURES_CHECK_BUDGETS") != "1",
+    reason="set FIGURES_CHECK_BUDGETS=1 to check runtime and memory budgets")
+
+
+def test_every_stage_has_one_budget(events, tmp_path):
+    _, budgets, _ = check_budgets.read_budgets(check_budgets.DEFAULT_BUDGETS_)
+    stages = [f"{figure}.{stage}" for (figure, make_stages) in check_budgets.FIGURES_.items()
+        for (stage, _) in make_stages(events, str(tmp_path))]
+    assert sorted(stages) == sorted(budgets)
+
+
+def test_calibrate_writes_budgets_to_their_files(tmp_path):
+    budgetfilename = tmp_path / "budgets.json"
+    budgetfilename.write_text(json.dumps({"n_events": 200, "seed": 0, "stages": {"pies.make_figure": {"seconds": 1, "peak_mb": 1}}}))
+
+    assert check_budgets.main(str(budgetfilename), figures=["pies"], calibrate=True)
+
+    assert list(json.loads(budgetfilename.read_text())["stages"]) == ["pies.make_figure"]
+    assert list(json.loads((tmp_path / "budgets.pies.json").read_text())["stages"]) == ["pies.write_html"]
+    _, budgets, origins = check_budgets.read_budgets(str(budgetfilename))
+    assert origins["pies.write_html"] == str(tmp_path / "budgets.pies.json")
+
+
+@check_budgets_enabled
+@pytest.mark.parametrize("figure", list(check_budgets.FIGURES_))
+def test_stages_keep_budgets(figure, capsys):
+    ok = check_budgets.main(check_budgets.DEFAULT_BUDGETS_, figures=[figure])
+    # report with measurement and budget of every stage, and the exceeded budgets
+    assert ok, capsys.readouterr().out
@@ -0,0 +1,63 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import dashboard
+import figure_io
+import helpers
+
+
+@pytest.fixture
+def events_with_gaps(events):
+    """Events with missing times, yields, coordinates and names."""
+    df = events.copy()
+    df.loc[[0, 9], "DATETIME"] = pd.NaT
+    df.loc[[2], ["LAT", "LONG"]] = np.nan
+    df.loc[[3], "YIELD"] = np.nan
+    df.loc[[4], "SHOTNAME"] = None
+    return df
+
+
+def test_event_store_round_trip(events_with_gaps):
+    df = events_with_gaps
+    store = json.loads(json.dumps(dashboard.make_event_store(df)))
+    assert store["n"] == len(df)
+
+    columns = {k: figure_io.decode_array(v) for (k, v) in store["columns"].items()}
+    assert all(len(v) == len(df) for v in columns.values())
+    for col in ["LAT", "LONG", "YIELD", "HOB"]:
+        np.testing.assert_allclose(columns[col], df[col].to_numpy(), rtol=1e-6, equal_nan=True)
+    assert store["names"][4] == "" and store["names"][5] == df.SHOTNAME[5]
+
+    # the page compares TIME with MISSING_TIME_ as int32
+    assert store["columns"]["TIME"]["dtype"] == "i4"
+    time = columns["TIME"]
+    missing = df.DATETIME.isna().to_numpy()
+    assert (time[missing] == dashboard.MISSING_TIME_).all()
+    minutes = df.DATETIME[~missing].to_numpy().astype("datetime64[m]").astype(np.int64)
+    assert (time[~missing] == minutes).all()
+
+
+def test_event_store_categories(events_with_gaps):
+    df = helpers.add_derived_columns(events_with_gaps, yield_bins=dashboard.YIELD_BINS_)
+    store = dashboard.make_event_store(events_with_gaps)
+    assert list(store["categories"]) == list(dashboard.CATEGORY_DICT_)
+    for (category, c) in store["categories"].items():
+        codes = figure_io.decode_array(c["codes"])
+        assert len(codes) == len(df)
+        assert len(c["values"]) == len(c["names"]) == len(c["colors"]) == len(set(c["values"]))
+        assert codes.min() >= -1 and codes.max() < len(c["values"])
+        # every listed value gets its code, everything else -1
+        values = df[category].astype(object).where(df[category].notna(), None).tolist()
+        expected = [c["values"].index(str(v)) if v is not None and str(v) in c["values"] else -1 for v in values]
+        assert codes.tolist() == expected
+
+
+def test_encode_category():
+    values, codes = dashboard.encode_category(pd.Series(["b", None, "a", "b", "c"]), order=["a", "b"])
+    assert values == ["a", "b"]
+    assert figure_io.decode_array(codes).tolist() == [1, -1, 0, 1, -1]
+    values, codes = dashboard.encode_category(pd.Series(["b", None, "a", "b"]))
+    assert values == ["b", "a"] and figure_io.decode_array(codes).tolist() == [0, -1, 1, 0]
@@ -0,0 +1,79 @@
+import json
+
+import numpy as np
+import plotly.graph_objects as go
+import pytest
+
+import figure_io
+
+
+def make_figure(y):
+    return go.Figure(go.Scatter(x=[1, 2, 3], y=y))
+
+
+def test_written_figure_carries_patch_base(tmp_path):
+    outfilename = str(tmp_path / "figure.json")
+    figure_io.save_figure(make_figure([1, 2, 3]), outfilename, patch=True)
+    with open(outfilename) as f:
+        first_version = json.load(f)["layout"]["meta"]["figure_version"]
+
+    figure_io.save_figure(make_figure([1, 2, 4]), outfilename, patch=True)
+    with open(tmp_path / "figure.patch.json") as f:
+        patch = json.load(f)
+    with open(outfilename) as f:
+        second_version = json.load(f)["layout"]["meta"]["figure_version"]
+
+    assert patch["base"] == first_version
+    assert patch["version"] == second_version != first_version
+    assert "meta" not in patch["layout"]
+
+
+@pytest.mark.parametrize("a", [
+    np.array([0, 1, -5, 100]),
+    np.array([0, 70000, -70000]),
+    np.array([0, 2**33, -2**40]),
+    np.array([0, 2**53], dtype=np.uint64),
+    np.array([0.5, 1.25, np.nan]),
+    np.array([0.1, 1e-9, 12345.6789]),
+    np.array([[1, 2, 3], [4, 5, 6]]),
+    np.array([[0.5, 1e10], [np.nan, 3.0]]),
+    np.array(["1962-10-30", "NaT"], dtype="datetime64[ns]"),
+    np.array([], dtype=np.int64),
+])
+def test_encode_array_round_trip(a):
+    decoded = figure_io.decode_array(figure_io.encode_array(a))
+    assert decoded.shape == a.shape
+    if a.dtype.kind == "M":
+        expected = a.astype("datetime64[ms]").astype(np.int64).astype(float)
+        expected[np.isnat(a)] = np.nan
+        np.testing.assert_array_equal(decoded, expected)
+    else:
+        np.testing.assert_allclose(decoded, a, rtol=1e-6)
+
+
+def test_encode_array_keeps_large_integers_unencoded():
+    assert figure_io.encode_array(np.array([0, 2**60])) is None
+
+
+def test_compact_lazy_mode_shards(tmp_path):
+    fig = go.Figure([go.Scatter(y=list(range(20)), meta="a"), go.Scatter(y=[0.5] * 20, meta="b", visible=False)])
+    outfilename = str(tmp_path / "figure.html")
+    figure_io.save_figure(fig, outfilename, lazy_modes=["a", "b"], compact=True)
+
+    with open(tmp_path / "figure.b.json") as f:
+        shard = json.load(f)
+    assert shard["indices"] == [1]
+    np.testing.assert_array_equal(figure_io.decode_array(shard["data"][0]["y"]), [0.5] * 20)
+    assert (tmp_path / "figure.b.json.gz").is_file()
+
+
+def test_patch_carries_shards_of_lazy_modes(tmp_path):
+    outfilename = str(tmp_path / "figure.html")
+    for y in ([1, 2, 3], [1, 2, 4]):
+        fig = go.Figure([go.Scatter(y=[0, 1], meta="a"), go.Scatter(y=y, meta="b", visible=False)])
+        figure_io.save_figure(fig, outfilename, lazy_modes=["a", "b"], patch=True, content_hash=True)
+
+    with open(tmp_path / "figure.patch.json") as f:
+        patch = json.load(f)
+    with open(tmp_path / patch["shards"]["b"]) as f:
+        assert json.load(f)["data"][0]["y"] == [1, 2, 4]
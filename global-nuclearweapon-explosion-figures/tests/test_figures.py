@@ -0,0 +1,19 @@
+import figures
+
+
+def test_year_bars_reuses_memoized_counts(events):
+    figures.cache_clear()
+
+    figures.year_bars(events)
+    first = figures.cache_info()["plot_year_bars.make_year_count_table"]
+    figures.year_bars(events)
+    second = figures.cache_info()["plot_year_bars.make_year_count_table"]
+
+    assert first["misses"] > 0
+    assert second["misses"] == first["misses"]
+    assert second["hits"] == first["hits"] + first["misses"]
+
+
+def test_year_bars_sum_to_number_of_explosions(events):
+    fig = figures.year_bars(events)
+    assert sum(sum(t.y) for t in fig.data if t.meta == "STATE") == len(events)
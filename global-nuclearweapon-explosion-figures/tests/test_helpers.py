@@ -0,0 +1,59 @@
+import pandas as pd
+import pytest
+
+import helpers
+
+
+def test_make_filters():
+    assert helpers.make_filters() == {"states": None, "years": None, "types": None, "purposes": None}
+    assert helpers.make_filters("USSR, US,US,", "1950-1963", "A,AS", "WR") == \
+        {"states": ("US", "USSR"), "years": (1950, 1963), "types": ("A", "AS"), "purposes": ("WR",)}
+    assert helpers.make_filters(years="1962")["years"] == (1962, 1962)
+    assert helpers.make_filters(state=" , ")["states"] is None
+
+
+@pytest.mark.parametrize("years", ["1963-1950", "abc", "1950-x"])
+def test_invalid_year_ranges(years):
+    with pytest.raises(ValueError):
+        helpers.make_filters(years=years)
+
+
+def test_year_bounds_are_inclusive(events):
+    (first, last) = (1960, 1965)
+    selected = helpers.filter_events(events, years=(first, last))
+    assert selected.YEAR.min() == first and selected.YEAR.max() == last
+    assert len(selected) == events.YEAR.between(first, last).sum()
+    assert len(helpers.filter_events(events, years=(1962, 1962))) == (events.YEAR == 1962).sum()
+
+
+@pytest.mark.parametrize("filters", [
+    {"types": ("UG",)},
+    {"types": ("A", "AX")},
+    {"purposes": ("WR",)},
+    {"purposes": ("other", "I")},
+    {"states": ("US",), "years": (1955, 1990), "types": ("UG", "AS"), "purposes": ("WR", "FS")},
+])
+def test_raw_and_derived_columns_select_the_same_rows(events, filters):
+    raw = helpers.filter_events(events, **filters)
+    derived = helpers.filter_events(helpers.add_derived_columns(events), **filters)
+    assert len(raw) > 0
+    assert raw.index.tolist() == derived.index.tolist()
+    if "types" in filters:
+        assert set(raw.TYPE.apply(helpers.get_explosion_type)) <= set(filters["types"])
+    if "purposes" in filters:
+        assert set(raw.PUR.apply(helpers.get_explosion_purpose)) <= set(filters["purposes"])
+    # raw frames stay raw, derived columns are kept
+    assert "TYPE_SHORT" not in raw.columns and "TYPE_SHORT" in derived.columns
+
+
+def test_filter_events_returns_copy(events):
+    assert helpers.filter_events(events) is not events
+    assert helpers.filter_events(events).equals(events)
+
+
+def test_load_events_filters_like_filter_events(events, events_file):
+    filters = helpers.make_filters("US,USSR", "1955-1995", "UG,AS", "WR,FS")
+    df = helpers.load_events(events_file, **filters)
+    assert len(df) > 0
+    pd.testing.assert_frame_equal(df, helpers.filter_events(events, **filters))
+    pd.testing.assert_frame_equal(helpers.load_events(events_file), events)
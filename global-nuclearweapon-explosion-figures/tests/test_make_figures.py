@@ -0,0 +1,33 @@
+import os
+
+import pytest
+
+import make_figures
+
+
+@pytest.mark.parametrize("options", [[], ["--content-hash"]])
+def test_update_skips_unchanged_build(events_file, tmp_path, capsys, options):
+    argv = ["year-bars", "-i", events_file, "-o", str(tmp_path / "year_bars.json"), "-u"] + options
+    make_figures.main(argv)
+    assert "is up to date" not in capsys.readouterr().out
+
+    make_figures.main(argv)
+    assert "is up to date" in capsys.readouterr().out
+
+
+def test_update_rebuilds_removed_output(events_file, tmp_path, capsys):
+    argv = ["year-bars", "-i", events_file, "-o", str(tmp_path / "year_bars.json"), "-u", "--content-hash"]
+    make_figures.main(argv)
+    for name in os.listdir(tmp_path):
+        if name.startswith("year_bars."):
+            os.remove(tmp_path / name)
+    capsys.readouterr()
+
+    make_figures.main(argv)
+    assert "is up to date" not in capsys.readouterr().out
+
+
+def test_invalid_filter_exits_nonzero(events_file, tmp_path):
+    with pytest.raises(SystemExit) as e:
+        make_figures.main(["year-bars", "-i", events_file, "-o", str(tmp_path / "year_bars.json"), "--years", "abc"])
+    assert e.value.code == 2
@@ -0,0 +1,49 @@
+import concurrent.futures
+import functools
+
+import metrics
+import parallel
+
+
+def record(n):
+    metrics.inc("figures_rows_total", n, stage="test")
+    metrics.observe("figures_stage_seconds", 0.2, stage="test")
+    return n
+
+
+def test_merge_adds_samples():
+    worker, parent = metrics.Registry(), metrics.Registry()
+    worker.inc("figures_rows_total", 3, stage="a")
+    worker.observe("figures_stage_seconds", 0.2, stage="a")
+    parent.inc("figures_rows_total", 2, stage="a")
+    parent.observe("figures_stage_seconds", 2.0, stage="a")
+
+    parent.merge(worker.samples())
+    counter, histogram = [s for s in parent.samples()]
+    assert counter["value"] == 5
+    assert histogram["count"] == 2 and histogram["sum"] == 2.2
+    assert histogram["buckets"]["0.25"] == 1 and histogram["buckets"]["+Inf"] == 2
+
+
+def test_collect_returns_worker_metrics():
+    metrics.REGISTRY_.clear()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+        outputs = list(executor.map(functools.partial(metrics.collect, record), [1, 2, 3]))
+    assert [result for (result, _) in outputs] == [1, 2, 3]
+    for (_, samples) in outputs:
+        metrics.merge(samples)
+    rows = [s for s in metrics.REGISTRY_.samples() if s["name"] == "figures_rows_total"]
+    assert rows[0]["value"] == 6
+
+
+def test_map_partitions_keeps_worker_metrics(events, monkeypatch):
+    monkeypatch.setattr(parallel, "WORKERS_", 2)
+    monkeypatch.setattr(parallel, "MIN_ROWS_", 10)
+    metrics.REGISTRY_.clear()
+    assert parallel.map_partitions(record_rows, events, by="STATE", merge=lambda parts, df: sum(parts)) == len(events)
+    rows = [s for s in metrics.REGISTRY_.samples() if s["name"] == "figures_rows_total"]
+    assert rows[0]["value"] == len(events)
+
+
+def record_rows(df):
+    return record(len(df))
@@ -0,0 +1,47 @@
+import pandas as pd
+import pytest
+
+import figures
+import helpers
+import parallel
+import plot_explosion_locations
+import plot_region_piechart_map
+import plot_year_bars
+
+
+def build_serial_and_partitioned(monkeypatch, build):
+    """Result of build() with one worker, and with every catalog split over worker processes."""
+    figures.cache_clear()
+    serial = build()
+    monkeypatch.setattr(parallel, "WORKERS_", 3)
+    monkeypatch.setattr(parallel, "MIN_ROWS_", 10)
+    figures.cache_clear()
+    partitioned = build()
+    figures.cache_clear()
+    return serial, partitioned
+
+
+def test_location_frequencies(events, monkeypatch):
+    serial, partitioned = build_serial_and_partitioned(monkeypatch, lambda: plot_explosion_locations.make_location_frequency_df(events))
+    pd.testing.assert_frame_equal(partitioned, serial)
+
+
+@pytest.mark.parametrize("mode", ["number", "yield"])
+def test_region_state_values(events, monkeypatch, mode):
+    serial, partitioned = build_serial_and_partitioned(monkeypatch, lambda: plot_region_piechart_map.make_region_state_values(events, mode))
+    pd.testing.assert_frame_equal(partitioned, serial)
+
+
+@pytest.mark.parametrize("category", list(plot_year_bars.CATEGORY_DICT_))
+def test_year_count_table(events, monkeypatch, category):
+    df = helpers.add_derived_columns(events, yield_bins=plot_year_bars.YIELD_BINS_)
+    serial, partitioned = build_serial_and_partitioned(monkeypatch, lambda: plot_year_bars.make_year_count_table(df, category))
+    pd.testing.assert_frame_equal(partitioned, serial)
+
+
+def test_partition(events):
+    parts = parallel.partition(events, "STATE", 3)
+    assert len(parts) == 3 and sum(len(p) for p in parts) == len(events)
+    assert all(set(p.STATE).isdisjoint(q.STATE) for p in parts for q in parts if p is not q)
+    parts = parallel.partition(events, "coords", 3)
+    assert pd.concat(parts).sort_index().equals(events)
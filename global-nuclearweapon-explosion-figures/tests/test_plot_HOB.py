@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+import plot_HOB
+import synthetic_data
+
+
+@pytest.mark.parametrize("n_events, n_keep", [(20000, 1000), (20000, 5000), (3000, 50)])
+def test_decimate_keeps_quota_and_outliers(n_events, n_keep):
+    df = synthetic_data.make_synthetic_events(n_events, seed=2)
+    df = df[df.DATETIME.notna()]
+    hob = df.HOB.to_numpy(dtype=float)
+    outlier = ~((hob >= plot_HOB.HOB_RANGE_[0]) & (hob <= plot_HOB.HOB_RANGE_[1]))
+
+    result = plot_HOB.decimate(df, n_keep)
+
+    assert len(result) <= n_keep + outlier.sum()
+    assert df.index[outlier].isin(result.index).all()
+    assert result.index.is_monotonic_increasing
+
+
+def test_decimate_keeps_small_data(events):
+    df = events[events.DATETIME.notna()]
+    assert len(plot_HOB.decimate(df, len(df))) == len(df)
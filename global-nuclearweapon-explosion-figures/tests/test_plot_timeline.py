@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import helpers
+import plot_timeline
+
+
+def naive_cumulative_table(df, category, resolution=None):
+    """Cumulative count and yield per category value, summed event by event."""
+    d = df[df[category].notna() & df.DATETIME.notna()]
+    times = d.DATETIME
+    if resolution:
+        times = times.dt.to_period(plot_timeline.RESOLUTIONS_[resolution]).dt.start_time
+    end = times.max()
+    rows = []
+    for value in d[category].unique():
+        t = times[d[category] == value]
+        y = d.YIELD[d[category] == value].fillna(0)
+        count, total = 0, 0.0
+        for time in sorted(t.unique()):
+            count += int((t == time).sum())
+            total += float(y[t == time].sum())
+            rows.append((value, time, count, total))
+        if time < end:
+            rows.append((value, end, count, total))
+    return pd.DataFrame(rows, columns=[category, "DATETIME", "COUNT", "YIELD"])
+
+
+@pytest.fixture
+def events_with_gaps(events):
+    """Derived columns, repeated explosion times and some missing times and states."""
+    df = helpers.add_derived_columns(events)
+    df = pd.concat([df, df.iloc[:20]], ignore_index=True)
+    df.loc[[3, 7], "DATETIME"] = pd.NaT
+    df.loc[[5, 11], "STATE"] = None
+    return df
+
+
+@pytest.mark.parametrize("category", ["STATE", "TYPE_SHORT"])
+@pytest.mark.parametrize("resolution", [None, "day", "month", "year"])
+def test_cumulative_table_matches_naive_sums(events_with_gaps, category, resolution):
+    table = plot_timeline.make_cumulative_table(events_with_gaps, category, resolution)
+    expected = naive_cumulative_table(events_with_gaps, category, resolution)
+
+    def order(d):
+        return d.sort_values([category, "DATETIME"]).reset_index(drop=True)
+
+    got, expected = order(table), order(expected)
+    assert got[[category, "DATETIME", "COUNT"]].astype(object).equals(expected[[category, "DATETIME", "COUNT"]].astype(object))
+    np.testing.assert_allclose(got.YIELD, expected.YIELD)
+
+
+@pytest.mark.parametrize("resolution", [None, "year"])
+def test_cumulative_table_curves(events_with_gaps, resolution):
+    table = plot_timeline.make_cumulative_table(events_with_gaps, "STATE", resolution)
+    end = table.DATETIME.max()
+    known = events_with_gaps[events_with_gaps.STATE.notna() & events_with_gaps.DATETIME.notna()]
+    for (state, d) in table.groupby("STATE"):
+        # sorted by time, one change point per time, every curve continued to the end
+        assert d.DATETIME.is_monotonic_increasing and not d.DATETIME.duplicated().any()
+        assert d.DATETIME.iloc[-1] == end
+        assert d.COUNT.iloc[-1] == (known.STATE == state).sum()
+        assert d.YIELD.iloc[-1] == pytest.approx(known.YIELD[known.STATE == state].sum())
+
+
+def test_cumulative_table_empty(events):
+    df = helpers.add_derived_columns(events).iloc[:0]
+    table = plot_timeline.make_cumulative_table(df, "STATE")
+    assert table.columns.tolist() == ["STATE", "DATETIME", "COUNT", "YIELD"] and len(table) == 0
@@ -0,0 +1,51 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+import region_assign
+
+
+def square(lon0, lat0, size):
+    return [[lon0, lat0], [lon0 + size, lat0], [lon0 + size, lat0 + size], [lon0, lat0 + size], [lon0, lat0]]
+
+
+def feature(name, geometry_type, coordinates):
+    return {"type": "Feature", "properties": {"REGION": name}, "geometry": {"type": geometry_type, "coordinates": coordinates}}
+
+
+FEATURES_ = [
+    # square with a hole
+    feature("Ring", "Polygon", [square(0, 0, 10), square(4, 4, 2)]),
+    feature("Islands", "MultiPolygon", [[square(20, 0, 2)], [square(30, 30, 2)]]),
+]
+
+
+def test_assign_with_holes_and_multipolygons():
+    boundaries = region_assign.RegionBoundaries(FEATURES_)
+    lat = [1, 5, 1, 31, 50, np.nan]
+    lon = [1, 5, 21, 31, 50, 1]
+    assert boundaries.assign(lat, lon).tolist() == ["Ring", None, "Islands", "Islands", None, None]
+
+
+def test_banded_test_matches_all_edges():
+    rng = np.random.default_rng(0)
+    t = np.linspace(0, 2 * np.pi, 2000, endpoint=False)
+    r = 20 + 3 * np.sin(37 * t) + rng.uniform(0, 1, len(t))
+    ring = np.c_[r * np.cos(t), r * np.sin(t)]
+    boundaries = region_assign.RegionBoundaries([feature("Star", "Polygon", [np.vstack([ring, ring[:1]]).tolist()])])
+    assert len(boundaries.bands[0][2]) > 2
+
+    lat, lon = rng.uniform(-25, 25, 20000), rng.uniform(-25, 25, 20000)
+    expected = region_assign.count_crossings(boundaries.edges, lon, lat) % 2 == 1
+    np.testing.assert_array_equal(boundaries.assign(lat, lon) == "Star", expected)
+
+
+def test_assign_regions_keeps_existing(tmp_path):
+    filename = tmp_path / "regions.geojson"
+    filename.write_text(json.dumps({"type": "FeatureCollection", "features": FEATURES_}))
+    boundaries = region_assign.RegionBoundaries.from_geojson(str(filename))
+    df = pd.DataFrame({"LAT": [1.0, 1.0], "LONG": [1.0, 21.0], "REGION": ["Kept", None]})
+
+    assert region_assign.assign_regions(df, boundaries).REGION.tolist() == ["Kept", "Islands"]
+    assert region_assign.assign_regions(df, boundaries, overwrite=True).REGION.tolist() == ["Ring", "Islands"]
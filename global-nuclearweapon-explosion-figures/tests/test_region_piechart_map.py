@@ -0,0 +1,40 @@
+import plotly.graph_objects as go
+import pytest
+
+import plot_region_piechart_map
+
+
+def get_regions(n):
+    return list(plot_region_piechart_map.get_region_dict(key="region"))[:n]
+
+
+@pytest.mark.parametrize("n", [1, 2, 5])
+def test_single_trace_colorscale_spans_zmin_to_zmax(n):
+    regions = get_regions(n)
+    colors = {r: f"rgb({10*i},0,0)" for (i, r) in enumerate(regions)}
+    fig = go.Figure()
+    plot_region_piechart_map.plot_regions_single_trace(fig, regions, colors=colors)
+
+    trace = fig.data[0]
+    stops = [s[0] for s in trace.colorscale]
+    assert stops[0] == 0 and stops[-1] == 1
+    assert stops == sorted(stops)
+    # z of every region maps to the color of the region
+    for (i, region) in enumerate(regions):
+        z = (i - trace.zmin) / (trace.zmax - trace.zmin)
+        assert any(lo <= z <= hi and c == colors[region] for ((lo, c), (hi, _)) in zip(trace.colorscale[::2], trace.colorscale[1::2]))
+
+
+def test_region_without_fixed_position(events):
+    df = events.copy()
+    polynesia = df.index[:5]
+    df.loc[polynesia, "REGION"] = "Polynesia"
+    df.loc[polynesia, ["LAT", "LONG"]] = [[-21.8, -138.9]] * 5
+
+    fig = plot_region_piechart_map.make_figure(df)
+
+    pies = [t for t in fig.data if t.type == "pie" and t.name == "Polynesia"]
+    assert len(pies) == 3
+    for pie in pies:
+        assert 0 <= pie.domain.x[0] < pie.domain.x[1] <= 1
+        assert 0 <= pie.domain.y[0] < pie.domain.y[1] <= 1
@@ -0,0 +1,95 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+import shot_index
+
+
+def make_df():
+    return pd.DataFrame({
+        "SHOTNAME" : ["Castle Bravo", "Ivy  Mike", "Smoky/Plumbbob", "Gnome (Gasbuggy); Rulison", None, "castle romeo"],
+        "STATE" : ["US", "US", "US", "US", "USSR", "US"],
+        "YEAR" : [1954, 1952, 1957, 1961, 1949, 1954],
+        "LAT" : [11.69, 11.67, 37.19, 32.26, 50.44, 11.69],
+        "LONG" : [165.27, 162.19, -116.06, -103.87, np.nan, 165.27],
+        "ALTNAMES" : [None, "Mike,Sausage", None, None, "RDS-1, First Lightning", None],
+    })
+
+
+def test_prefix_and_lookup_ignore_case():
+    index = shot_index.ShotIndex.from_df(make_df())
+    assert index.prefix("CASTLE").tolist() == [0, 5]
+    assert index.prefix("castle", limit=1).tolist() == [0]
+    assert index.prefix("castle b").tolist() == [0]
+    assert index.prefix("xyz").tolist() == []
+    # exact lookup: normalized spaces, no prefix matches
+    assert index.lookup("ivy mike").tolist() == [1]
+    assert index.lookup("IVY   MIKE").tolist() == [1]
+    assert index.lookup("castle").tolist() == []
+
+
+def test_alternate_names():
+    index = shot_index.ShotIndex.from_df(make_df())
+    # parts separated by "/"
+    assert index.lookup("plumbbob").tolist() == [2]
+    assert index.lookup("smoky").tolist() == [2]
+    # parentheses and ";"
+    assert index.lookup("gasbuggy").tolist() == [3]
+    assert index.lookup("rulison").tolist() == [3]
+    assert index.lookup("gnome").tolist() == [3]
+    # ALTNAMES column
+    assert index.lookup("sausage").tolist() == [1]
+    assert index.lookup("first lightning").tolist() == [4]
+    assert index.lookup("rds-1").tolist() == [4]
+    assert shot_index.split_names("Gnome (Gasbuggy); Rulison") == ["gnome (gasbuggy); rulison", "gnome", "gasbuggy", "rulison"]
+    assert shot_index.split_names(np.nan, None) == []
+
+
+def test_missing_coordinates_give_site_minus_one():
+    index = shot_index.ShotIndex.from_df(make_df())
+    assert index.site[4] == -1
+    # same coordinates, same site
+    assert index.site[0] == index.site[5] >= 0
+    assert len(index.sites) == 4
+    described = index.describe([4, 0])
+    assert np.isnan(described.LAT[0]) and np.isnan(described.LONG[0])
+    assert (described.LAT[1], described.LONG[1]) == (11.69, 165.27)
+
+
+def test_to_dict_layout(tmp_path):
+    index = shot_index.ShotIndex.from_df(make_df())
+    d = index.to_dict()
+    assert list(d) == ["keys", "rows", "names", "states", "years", "site", "sites"]
+    # search script: sorted keys for the binary search, rows parallel to keys
+    assert d["keys"] == sorted(d["keys"]) and len(d["rows"]) == len(d["keys"])
+    # per-row arrays, indexed by the rows of the keys
+    n = len(make_df())
+    assert all(len(d[k]) == n for k in ["names", "states", "years", "site"])
+    assert d["names"][4] == "n/a" and d["years"][0] == 1954
+    # sites indexed by site, as [lat, lon]
+    assert all(len(s) == 2 for s in d["sites"])
+    assert d["sites"][d["site"][2]] == [37.19, -116.06]
+    assert d["rows"][d["keys"].index("sausage")] == 1
+
+    filename = str(tmp_path / "index.json")
+    index.write_json(filename)
+    with open(filename, encoding='utf-8') as f:
+        assert json.load(f) == d
+
+
+def test_search_script_embeds_index():
+    df = make_df()
+    df.loc[0, "SHOTNAME"] = "</script>"
+    script = shot_index.make_search_script(shot_index.ShotIndex.from_df(df))
+    assert "SHOT_INDEX_" not in script and "</script>" not in script
+    assert "{plot_id}" in script
+
+
+def test_main(events_file, capsys, tmp_path):
+    outfilename = str(tmp_path / "index.json")
+    shot_index.main(events_file, queries=["shot1"], limit=3, outfilename=outfilename, filters={"states": ["US"]})
+    out = capsys.readouterr().out
+    assert "3 match(es) for 'shot1' (limited)" in out
+    with open(outfilename, encoding='utf-8') as f:
+        assert set(json.load(f)["states"]) == {"US"}
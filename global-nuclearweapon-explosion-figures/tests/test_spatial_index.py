@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+
+from spatial_index import SpatialIndex, select_events
+
+
+def test_empty_index_returns_empty_results():
+    index = SpatialIndex([], [])
+    assert len(index) == 0
+    assert len(index.query_bbox(30, 40, -120, -110)[0]) == 0
+    assert len(index.query_radius(37.1, -116.0, 50)[0]) == 0
+    positions, distances = index.query_knn([37.1, 0], [-116.0, 0], k=3, return_distance=True)
+    assert [len(p) for p in positions] == [0, 0] and [len(d) for d in distances] == [0, 0]
+
+
+def test_index_without_valid_coordinates():
+    df = pd.DataFrame({"LAT": [np.nan, np.nan], "LONG": [1.0, np.nan]})
+    assert len(select_events(df, near=(0, 1, 100))) == 0
+    assert len(select_events(df, bbox=(-10, 10, -10, 10))) == 0
+
+
+def test_radius_query_matches_brute_force(events):
+    index = SpatialIndex.from_df(events)
+    rows = index.query_radius(37.1, -116.0, 500)[0]
+    lat, lon = np.radians(events.LAT.to_numpy()), np.radians(events.LONG.to_numpy())
+    q_lat, q_lon = np.radians(37.1), np.radians(-116.0)
+    d = 6371.0088 * np.arccos(np.clip(np.sin(lat) * np.sin(q_lat) + np.cos(lat) * np.cos(q_lat) * np.cos(lon - q_lon), -1, 1))
+    assert sorted(rows) == sorted(np.flatnonzero(d <= 500))
@@ -0,0 +1,26 @@
+import parallel
+import plot_year_bars
+import stage_cache
+
+
+def test_code_version_covers_callees_and_constants():
+    sources = stage_cache._collect_sources(stage_cache.inspect.unwrap(plot_year_bars.make_year_count_table), {})
+    assert "plot_year_bars.count_per_year" in sources
+    assert "parallel.map_partitions" in sources
+    assert sources["parallel.MIN_ROWS_"].startswith("MIN_ROWS_ =")
+
+
+def test_code_version_changes_with_callee(monkeypatch):
+    version = stage_cache.code_version(plot_year_bars.make_year_count_table)
+
+    monkeypatch.setattr(stage_cache, "_CODE_VERSIONS_", {})
+    monkeypatch.setattr(plot_year_bars, "count_per_year", plot_year_bars.merge_year_counts)
+    assert stage_cache.code_version(plot_year_bars.make_year_count_table) != version
+
+
+def test_code_version_ignores_runtime_settings(monkeypatch):
+    version = stage_cache.code_version(plot_year_bars.make_year_count_table)
+
+    monkeypatch.setattr(stage_cache, "_CODE_VERSIONS_", {})
+    monkeypatch.setattr(parallel, "WORKERS_", 4)
+    assert stage_cache.code_version(plot_year_bars.make_year_count_table) == version
@@ -0,0 +1,46 @@
+import json
+
+import plotly.graph_objects as go
+import pytest
+
+import figure_io
+import trace_groups
+from trace_groups import TraceGroups
+
+
+def make_figure(n_groups, n_per_group):
+    fig = go.Figure()
+    groups = TraceGroups(fig)
+    for g in range(n_groups):
+        with groups.recording(f"g{g}"):
+            fig.add_traces([go.Bar(x=[1], y=[1], visible=(g == 0)) for _ in range(n_per_group)])
+    groups.add_buttons({f"g{g}": f"Group {g}" for g in range(n_groups)})
+    return fig, groups
+
+
+def test_few_traces_use_update_masks():
+    fig, groups = make_figure(3, 2)
+    button = fig.layout.updatemenus[0].buttons[1]
+    assert button.method == "update"
+    assert button.args[0]["visible"] == [False, False, True, True, False, False]
+    assert not trace_groups.needs_page_script(fig)
+
+
+def test_many_traces_send_only_their_group():
+    n_groups, n_per_group = 8, 50
+    fig, groups = make_figure(n_groups, n_per_group)
+    assert len(fig.data) >= trace_groups.RESTYLE_MIN_TRACES_
+
+    for g, button in enumerate(fig.layout.updatemenus[0].buttons):
+        assert button.method == "restyle" and button.execute is False
+        assert button.args[0] == {"visible": True} and list(button.args[1]) == groups.indices(f"g{g}")
+        # payload: the indices of one group, not a value per trace
+        assert len(json.dumps(button.args)) < 6 * n_per_group
+    assert trace_groups.needs_page_script(fig)
+
+
+def test_html_output_switches_groups_in_the_page(tmp_path):
+    fig, _ = make_figure(8, 50)
+    outfilename = tmp_path / "figure.html"
+    figure_io.save_figure(fig, str(outfilename))
+    assert "enableTraceGroups(document.getElementById(" in outfilename.read_text()
@@ -0,0 +1,133 @@
+"""
+Registry of the traces of every mode of a figure, for the buttons that switch between modes.
+
+Trace indices are recorded per mode while the traces are added, so the visibility of every mode is known
+without scanning the figure (and comparing trace meta) once per mode. Traces added outside of a mode (e.g.
+region outlines) stay visible in every mode.
+
+Buttons set the visibility of all traces ("update" with one mask per button). From RESTYLE_MIN_TRACES_ traces
+on, a button only carries the trace indices of its mode and is not executed by plotly.js; the page script
+TRACE_GROUPS_JS_ (added to html output by figure_io.save_figure) restyles the traces of the mode shown before
+and of the new mode, so figures with hundreds of traces neither store nor resend a mask per button.
+
+e.g.:  groups = TraceGroups(fig)
+       with groups.recording("STATE"):
+           fig.add_trace(...)
+       groups.add_buttons({"STATE": "State", "TYPE_SHORT": "Type"}, y=1.03)
+"""
+
+import contextlib
+
+import numpy as np
+
+# From this number of traces on, buttons restyle the traces of the modes only
+RESTYLE_MIN_TRACES_ = 200
+
+TRACE_GROUPS_JS_ = """// Switches modes of buttons made by trace_groups.TraceGroups for many traces (execute: false, args: [{visible: true},
+// indices of the mode]): hides the traces of the mode shown before and shows those of the new mode.
+//     enableTraceGroups(document.getElementById(div_id));
+function enableTraceGroups(gd) {
+    var shown = [];
+    (gd.layout.updatemenus || []).forEach(function(menu) {
+        var button = (menu.buttons || [])[menu.active || 0];
+        if (button && button.execute === false && button.method === 'restyle') {
+            shown = button.args[1];
+        }
+    });
+    gd.on('plotly_buttonclicked', function(e) {
+        var button = e.button;
+        if (button.execute !== false || button.method !== 'restyle') {
+            return;
+        }
+        var show = button.args[1];
+        var keep = {};
+        show.forEach(function(i) { keep[i] = true; });
+        var hide = shown.filter(function(i) { return !keep[i]; });
+        shown = show;
+        Promise.resolve(hide.length ? Plotly.restyle(gd, {visible: false}, hide) : null).then(function() {
+            return Plotly.restyle(gd, {visible: true}, show);
+        });
+    });
+}
+"""
+
+
+def needs_page_script(fig):
+    """Whether the buttons of a figure are switched by TRACE_GROUPS_JS_ (see TraceGroups.make_button)."""
+    return any(button.execute is False and button.method == "restyle"
+        for menu in fig.layout.updatemenus for button in menu.buttons)
+
+
+class TraceGroups:
+    """Trace indices of every mode (group) of a figure."""
+
+    def __init__(self, fig):
+        self.fig = fig
+        self.groups = {}
+
+    @contextlib.contextmanager
+    def recording(self, group):
+        """Records the traces added to the figure within the context as traces of group."""
+        start = len(self.fig.data)
+        yield self
+        self.groups.setdefault(group, []).extend(range(start, len(self.fig.data)))
+
+    def indices(self, group):
+        """Indices of the traces of group."""
+        return list(self.groups.get(group, []))
+
+    def grouped_indices(self):
+        """Indices of all traces recorded in a group, sorted."""
+        return sorted(i for indices in self.groups.values() for i in indices)
+
+    def visible(self, group):
+        """Visibility of all traces with group shown: traces of group and traces of no group.
+        Returns
+        -------
+        list of bool (one per trace)
+        """
+        mask = np.ones(len(self.fig.data), dtype=bool)
+        mask[self.grouped_indices()] = False
+        mask[self.indices(group)] = True
+        return mask.tolist()
+
+    def make_button(self, group, label):
+        """Makes button that shows group (name=group, see figure_io.write_lazy_mode_shards); from RESTYLE_MIN_TRACES_
+        traces on, it only carries the indices of the group and is switched by TRACE_GROUPS_JS_."""
+        if len(self.fig.data) < RESTYLE_MIN_TRACES_:
+            return dict(label=label,
+                name=group,
+                method="update",
+                args=[{"visible": self.visible(group)}]
+                )
+
+        return dict(label=label,
+            name=group,
+            method="restyle",
+            execute=False,
+            args=[{"visible": True}, self.indices(group)]
+            )
+
+    def add_buttons(self, label_dict, x=0.00, y=1.03):
+        """Add the buttons to switch between groups
+        ---------
+            label_dict : dict
+                keys: group to add (e.g. "STATE"), values: title for respective button
+            x, y : float
+                position of the buttons (lower left corner, paper coordinates)
+        """
+        buttons = [self.make_button(group, label) for (group, label) in label_dict.items()]
+
+        self.fig.update_layout({'updatemenus' : [
+            dict(
+                type="buttons",
+                direction="right",
+                active=0,
+                x=x,
+                y=y,
+                xanchor='left',
+                yanchor='bottom',
+                buttons=buttons,
+                font_size=15
+            )
+        ]})